@@ -1,22 +1,66 @@
 """Simple analysis of recommendation outputs."""
 import json
 from pathlib import Path
+from typing import Optional, Sequence
 
+import duckdb
 import pandas as pd
 
-from netflix_recommender import config
+from netflix_recommender.outputs import OUTPUT_FILENAMES
+from netflix_recommender.runtime import runtime_from_env
 
+# Tabular output formats, cheapest to scan first.
+SAMPLE_FORMATS = ("parquet", "arrow", "csv")
 
-def load_outputs(output_dir: Path = config.OUTPUT_DIR) -> tuple[pd.DataFrame, dict]:
-    recommendations = pd.read_csv(output_dir / "recommendations.csv")
-    metrics = json.loads((output_dir / "metrics.json").read_text())
-    return recommendations, metrics
+
+def load_sample(
+    output_dir: Optional[Path] = None,
+    per_model: int = 3,
+    formats: Optional[Sequence[str]] = None,
+) -> pd.DataFrame:
+    """Top recommendations per user and model, filtered by DuckDB while scanning the output.
+
+    ``output_dir`` and ``formats`` default to the pipeline's environment
+    (``NETFLIX_REC_OUTPUT_DIR``, ``NETFLIX_REC_OUTPUT_FORMATS``), so the sample
+    is read from a file the pipeline actually wrote.
+    """
+    if output_dir is None or formats is None:
+        runtime_config = runtime_from_env("analysis")
+        output_dir = output_dir or runtime_config.output_dir
+        formats = formats or runtime_config.output_formats
+    fmt = next((fmt for fmt in SAMPLE_FORMATS if fmt in formats), None)
+    if fmt is None:
+        raise ValueError(f"No tabular recommendations among output formats: {', '.join(formats)}")
+    path = output_dir / OUTPUT_FILENAMES[fmt]
+    conn = duckdb.connect()
+    try:
+        if fmt == "arrow":
+            import pyarrow as pa
+            from pyarrow import ipc
+
+            conn.register("sample_source", ipc.open_file(pa.memory_map(str(path))).read_all())
+            source = "sample_source"
+        else:
+            reader = "read_parquet" if fmt == "parquet" else "read_csv_auto"
+            quoted = str(path).replace("'", "''")
+            source = f"{reader}('{quoted}')"
+        return conn.execute(
+            f"""
+            SELECT *
+            FROM {source}
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY user_id, model ORDER BY rank) <= {int(per_model)}
+            ORDER BY user_id, model, rank
+            """
+        ).df()
+    finally:
+        conn.close()
 
 
 def summarize() -> None:
-    recommendations, metrics = load_outputs()
+    runtime_config = runtime_from_env("analysis")
+    metrics = json.loads((runtime_config.output_dir / "metrics.json").read_text())
     print("Pipeline metrics:", json.dumps(metrics, indent=2))
-    sample = recommendations.groupby(["user_id", "model"]).head(3)
+    sample = load_sample(runtime_config.output_dir, formats=runtime_config.output_formats)
     print("\nSample recommendations:")
     print(sample)
 
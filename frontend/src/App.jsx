@@ -17,11 +17,19 @@ const fetchData = async () => {
   return response.json()
 }
 
+// Pre-aggregated daily/device/model rollups; the charts stay cheap as history grows.
+const fetchRollups = async () => {
+  const response = await fetch('/engagement_rollups.json')
+  return response.ok ? response.json() : null
+}
+
 export default function App() {
   const [data, setData] = useState(null)
+  const [rollups, setRollups] = useState(null)
 
   useEffect(() => {
     fetchData().then(setData).catch(console.error)
+    fetchRollups().then(setRollups).catch(console.error)
   }, [])
 
   if (!data) return <div className="container">Loading data storytelling dashboard...</div>
@@ -55,6 +63,27 @@ export default function App() {
         <Bar data={chartData} options={{ responsive: true, plugins: { legend: { display: false } } }} />
       </div>
 
+      {rollups && (
+        <div className="card">
+          <h2>Daily Active Users</h2>
+          <Bar
+            data={{
+              labels: rollups.daily.map(d => d.day),
+              datasets: [{ label: 'Active users', data: rollups.daily.map(d => d.active_users), backgroundColor: '#f97316' }]
+            }}
+            options={{ responsive: true, plugins: { legend: { display: false } } }}
+          />
+          <h2>Watch Minutes by Device</h2>
+          <Bar
+            data={{
+              labels: rollups.devices.map(d => d.device_type),
+              datasets: [{ label: 'Watch minutes', data: rollups.devices.map(d => d.watch_minutes), backgroundColor: '#0ea5e9' }]
+            }}
+            options={{ responsive: true, plugins: { legend: { display: false } } }}
+          />
+        </div>
+      )}
+
       <div className="card">
         <h2>What we would pitch to Netflix</h2>
         <ul className="list">
@@ -1,28 +1,385 @@
+import argparse
+import copy
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
 import torch
 import torchvision.models as models
+from torch.utils.data import DataLoader, Dataset
 from torchvision import transforms
 from PIL import Image
 
+logger = logging.getLogger(__name__)
+
+_shared_models = {}
+_shared_lock = threading.Lock()
+
+INFERENCE_MODES = ("fp32", "channels_last", "bf16", "int8", "compile")
+# Minimum per-image cosine against fp32 features before a mode is accepted.
+GUARD_THRESHOLDS = {"channels_last": 0.999, "compile": 0.999, "bf16": 0.99, "int8": 0.97}
+
+PREPROCESS = transforms.Compose([
+    transforms.Resize(256),
+    transforms.CenterCrop(224),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+])
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of the file bytes, so renamed or copied posters share a cache entry."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        while chunk := handle.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PosterDataset(Dataset):
+    """Decodes and preprocesses images; runs inside DataLoader worker processes."""
+
+    def __init__(self, paths, preprocess=PREPROCESS):
+        self.paths = list(paths)
+        self.preprocess = preprocess
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        with Image.open(self.paths[index]) as image:
+            return index, self.preprocess(image.convert("RGB"))
+
+
+def _single_threaded_worker(_):
+    # Decoding workers should not compete with the inference threads.
+    torch.set_num_threads(1)
+
+
+class EmbeddingCache:
+    """One .npy file per content digest under <root>/<model_version>/."""
+
+    def __init__(self, root, model_version):
+        self.directory = Path(root) / model_version
+
+    def _path(self, digest):
+        return self.directory / digest[:2] / f"{digest}.npy"
+
+    def get(self, digest):
+        path = self._path(digest)
+        if not path.exists():
+            return None
+        return np.load(path, allow_pickle=False)
+
+    def put(self, digest, vector):
+        path = self._path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.stem}.{uuid.uuid4().hex[:8]}.npy")
+        np.save(tmp, np.asarray(vector, dtype=np.float32), allow_pickle=False)
+        os.replace(tmp, path)
+
+
+def _feature_extractor(model):
+    # Everything up to and including global average pooling, flattened to N x 2048.
+    return torch.nn.Sequential(*list(model.children())[:-1], torch.nn.Flatten(1)).eval()
+
+
+def _traced(module, example):
+    # Trace under no_grad: constants captured under inference_mode cannot be reused later.
+    with torch.no_grad():
+        return torch.jit.freeze(torch.jit.trace(module, example))
+
+
+def _channels_last(batch):
+    return batch.contiguous(memory_format=torch.channels_last)
+
+
+def _build_int8(fp32_model, calibration):
+    """Post-training static quantization of the fp32 weights, calibrated on real batches."""
+    from torch.ao.quantization import convert, get_default_qconfig, prepare
+    from torchvision.models import quantization as quantized_models
+
+    engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "fbgemm"
+    torch.backends.quantized.engine = engine
+    model = quantized_models.resnet50(weights=None, quantize=False)
+    model.load_state_dict(fp32_model.state_dict())
+    model.fc = torch.nn.Identity()
+    model.eval()
+    model.fuse_model()
+    model.qconfig = get_default_qconfig(engine)
+    prepare(model, inplace=True)
+    with torch.no_grad():
+        for batch in calibration:
+            model(batch)
+    convert(model, inplace=True)
+    return model
+
+
+def cosine_rows(a, b):
+    a = torch.nn.functional.normalize(a.float(), dim=1)
+    b = torch.nn.functional.normalize(b.float(), dim=1)
+    return (a * b).sum(dim=1)
+
+
 class CVModel:
-    def __init__(self):
-        self.model = models.resnet50(pretrained=True)
-        self.model.eval()
-        self.preprocess = transforms.Compose([
-            transforms.Resize(256),
-            transforms.CenterCrop(224),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-        ])
+    """ResNet-50 poster encoder; the ImageNet weights load on first use."""
+
+    base_version = "resnet50-imagenet1k-v1"
+    embedding_dim = 2048
+
+    def __init__(self, num_threads=None, mode="fp32", calibration=None):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self._model = self._backbone = None
+        self._load_lock = threading.Lock()
+        self.preprocess = PREPROCESS
+        self.reset_mode()
+        if mode != "fp32":
+            self.optimize(mode, calibration)
+
+    def load(self):
+        """Load the weights once; safe to call from several threads."""
+        if self._model is not None:
+            return self
+        with self._load_lock:
+            if self._model is None:
+                model = models.resnet50(weights=models.ResNet50_Weights.IMAGENET1K_V1)
+                model.eval()
+                self._backbone = _feature_extractor(model)
+                self._model = model
+        return self
+
+    @property
+    def model(self):
+        return self.load()._model
+
+    @property
+    def backbone(self):
+        return self.load()._backbone
+
+    @property
+    def model_version(self):
+        # Optimized modes give slightly different vectors, so they get their own cache.
+        return self.base_version if self.mode == "fp32" else f"{self.base_version}-{self.mode}"
+
+    def build_encoder(self, mode, calibration):
+        """Return a callable mapping an NCHW float batch to N x 2048 features."""
+        example = calibration[0]
+        if mode == "fp32":
+            return self.backbone
+        if mode == "channels_last":
+            module = copy.deepcopy(self.backbone).to(memory_format=torch.channels_last)
+            traced = _traced(module, _channels_last(example))
+            return lambda batch: traced(_channels_last(batch))
+        if mode == "compile":
+            module = copy.deepcopy(self.backbone).to(memory_format=torch.channels_last)
+            compiled = torch.compile(module)
+            return lambda batch: compiled(_channels_last(batch))
+        if mode == "bf16":
+            module = copy.deepcopy(self.backbone).to(memory_format=torch.channels_last)
+
+            def encode(batch):
+                with torch.autocast("cpu", dtype=torch.bfloat16):
+                    return module(_channels_last(batch)).float()
+
+            return encode
+        if mode == "int8":
+            return _traced(_build_int8(self.model, calibration), example)
+        raise ValueError(f"Unknown inference mode {mode!r}; expected one of {INFERENCE_MODES}")
+
+    def reset_mode(self):
+        # None encodes with the fp32 backbone, without forcing the weights to load here.
+        self.mode, self.guard_cosine, self._encode = "fp32", 1.0, None
+
+    def optimize(self, mode, calibration=None, threshold=None):
+        """Switch to ``mode`` if its features stay within the cosine guard of fp32.
+
+        ``calibration`` is a list of preprocessed batches, used for int8
+        observers and for the guard; random inputs are used when omitted,
+        which is fine for benchmarking but a poor int8 calibration.
+        Returns the minimum cosine seen; on failure the model stays fp32.
+        """
+        calibration = calibration or [torch.randn(8, 3, 224, 224)]
+        encoder = self.build_encoder(mode, calibration)
+        with torch.inference_mode():
+            reference = torch.cat([self.backbone(batch) for batch in calibration])
+            candidate = torch.cat([encoder(batch) for batch in calibration])
+        cosine = float(cosine_rows(reference, candidate).min())
+        threshold = GUARD_THRESHOLDS.get(mode, 1.0) if threshold is None else threshold
+        if cosine < threshold:
+            logger.warning(
+                "Inference mode %s rejected: min cosine %.4f < %.4f; staying on fp32",
+                mode, cosine, threshold,
+            )
+            return cosine
+        self.mode, self.guard_cosine, self._encode = mode, cosine, encoder
+        return cosine
 
     def predict(self, image_path):
-        image = Image.open(image_path)
-        image = self.preprocess(image)
-        image = image.unsqueeze(0)
-        with torch.no_grad():
-            output = self.model(image)
+        with Image.open(image_path) as image:
+            batch = self.preprocess(image.convert("RGB")).unsqueeze(0)
+        with torch.inference_mode():
+            output = self.model(batch)
         return output.argmax().item()
 
-if __name__ == "__main__":
+    def embed_batch(self, images):
+        """Penultimate-layer features for a preprocessed N x 3 x 224 x 224 batch."""
+        encode = self.backbone if self._encode is None else self._encode
+        with torch.inference_mode():
+            return encode(images).float()
+
+    def embed_images(self, image_paths, batch_size=32, num_workers=None, cache_dir=None):
+        """Return a float32 array of shape (len(image_paths), 2048).
+
+        Images are keyed by content hash: with ``cache_dir`` only images not
+        embedded before are decoded and run through the network, and identical
+        files in one call are embedded once.
+        """
+        image_paths = [Path(path) for path in image_paths]
+        cache = EmbeddingCache(cache_dir, self.model_version) if cache_dir else None
+        embeddings = np.zeros((len(image_paths), self.embedding_dim), dtype=np.float32)
+        digests = [file_digest(path) for path in image_paths]
+
+        pending = {}
+        for row, digest in enumerate(digests):
+            cached = cache.get(digest) if cache else None
+            if cached is not None:
+                embeddings[row] = cached
+            else:
+                pending.setdefault(digest, []).append(row)
+        if not pending:
+            return embeddings
+
+        unique = list(pending)
+        workers = (os.cpu_count() or 2) // 2 if num_workers is None else num_workers
+        loader = DataLoader(
+            PosterDataset([image_paths[pending[digest][0]] for digest in unique], self.preprocess),
+            batch_size=batch_size,
+            num_workers=workers,
+            worker_init_fn=_single_threaded_worker if workers else None,
+            persistent_workers=False,
+        )
+        for indices, images in loader:
+            features = self.embed_batch(images).numpy()
+            for index, vector in zip(indices.tolist(), features):
+                digest = unique[index]
+                embeddings[pending[digest]] = vector
+                if cache:
+                    cache.put(digest, vector)
+        return embeddings
+
+
+def get_cv_model(mode="fp32", calibration=None):
+    """Process-wide shared CVModel for ``mode``; weights load on first use.
+
+    ``calibration`` is only used when the model for ``mode`` is first built.
+    """
+    with _shared_lock:
+        if mode not in _shared_models:
+            _shared_models[mode] = CVModel(mode=mode, calibration=calibration)
+        return _shared_models[mode]
+
+
+def load_batch(image_paths, preprocess=PREPROCESS):
+    images = []
+    for path in image_paths:
+        with Image.open(path) as image:
+            images.append(preprocess(image.convert("RGB")))
+    return torch.stack(images)
+
+
+def benchmark_modes(modes=INFERENCE_MODES, batch_size=32, batches=10, threads=None, image_paths=None):
+    """Images/sec (total and per intra-op thread) and guard cosine for each mode.
+
+    Uses the given posters (cycled to ``batch_size``) or random inputs, so it
+    runs on any CPU box without a dataset.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    threads = torch.get_num_threads()
+    if image_paths:
+        paths = [image_paths[i % len(image_paths)] for i in range(batch_size)]
+        inputs = load_batch(paths)
+    else:
+        inputs = torch.randn(batch_size, 3, 224, 224)
     cv_model = CVModel()
-    prediction = cv_model.predict('sample_image.jpg')
-    print(f"Predicted Class: {prediction}")
+    results = []
+    for mode in modes:
+        cv_model.reset_mode()
+        try:
+            cosine = cv_model.optimize(mode, [inputs])
+        except Exception as exc:  # noqa: BLE001 - e.g. no int8 engine or compiler
+            results.append({"mode": mode, "error": str(exc)})
+            continue
+        for _ in range(2):
+            cv_model.embed_batch(inputs)
+        started = time.perf_counter()
+        for _ in range(batches):
+            cv_model.embed_batch(inputs)
+        elapsed = time.perf_counter() - started
+        images_per_sec = batch_size * batches / elapsed
+        results.append({
+            "mode": mode,
+            "active_mode": cv_model.mode,
+            "images_per_sec": images_per_sec,
+            "images_per_sec_per_core": images_per_sec / threads,
+            "min_cosine": cosine,
+            "threads": threads,
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ResNet-50 poster embeddings")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    embed = subparsers.add_parser("embed", help="embed poster images")
+    embed.add_argument("images", nargs="+", type=Path)
+    embed.add_argument("--out", type=Path, default=Path("poster_embeddings.npy"))
+    embed.add_argument("--batch-size", type=int, default=32)
+    embed.add_argument("--workers", type=int, default=None, help="decoding processes")
+    embed.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    embed.add_argument("--cache-dir", type=Path, default=Path(".cache/poster_embeddings"))
+    embed.add_argument("--mode", choices=INFERENCE_MODES, default="fp32")
+    embed.add_argument("--calibration-images", type=int, default=32)
+
+    bench = subparsers.add_parser("bench", help="images/sec per inference mode")
+    bench.add_argument("images", nargs="*", type=Path)
+    bench.add_argument("--modes", nargs="+", choices=INFERENCE_MODES, default=list(INFERENCE_MODES))
+    bench.add_argument("--batch-size", type=int, default=32)
+    bench.add_argument("--batches", type=int, default=10)
+    bench.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "bench":
+        for row in benchmark_modes(args.modes, args.batch_size, args.batches, args.threads, args.images):
+            if "error" in row:
+                print(f"{row['mode']:>14}  unavailable: {row['error']}")
+                continue
+            print(
+                f"{row['mode']:>14}  {row['images_per_sec']:8.1f} img/s  "
+                f"{row['images_per_sec_per_core']:7.2f} img/s/core  "
+                f"cos>={row['min_cosine']:.4f}  ran as {row['active_mode']} on {row['threads']} threads"
+            )
+        return
+
+    calibration = None
+    if args.mode != "fp32":
+        calibration = [load_batch(args.images[: args.calibration_images])]
+    cv_model = CVModel(num_threads=args.threads, mode=args.mode, calibration=calibration)
+    embeddings = cv_model.embed_images(
+        args.images, batch_size=args.batch_size, num_workers=args.workers, cache_dir=args.cache_dir
+    )
+    np.save(args.out, embeddings)
+    print(
+        f"Wrote {embeddings.shape[0]} x {embeddings.shape[1]} {cv_model.mode} embeddings to {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,459 @@
-import transformers
-from transformers import GPT2Tokenizer, GPT2LMHeadModel
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, List, Optional
+
+import numpy as np
+
+# torch and transformers take seconds to import; they are loaded with the
+# weights, so the CLI and processes that only touch the caches start fast.
+_shared_models = {}
+_shared_lock = threading.Lock()
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class TextEmbeddingCache:
+    """Persistent text-hash -> vector store, one SQLite file per cache directory.
+
+    A catalog has many short texts, so one file with a keyed table is cheaper
+    to scan than a file per entry. Rows are keyed by model version as well, so
+    vectors from different weights or pooling settings never mix.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model_version TEXT NOT NULL, digest TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model_version, digest))"
+        )
+
+    def get_many(self, model_version, digests, chunk_size=500):
+        found = {}
+        digests = list(digests)
+        for start in range(0, len(digests), chunk_size):
+            chunk = digests[start:start + chunk_size]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT digest, vector FROM embeddings WHERE model_version = ? AND digest IN ({placeholders})",
+                [model_version, *chunk],
+            )
+            for digest, blob in rows:
+                found[digest] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model_version, items):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [(model_version, digest, np.asarray(vector, dtype=np.float32).tobytes()) for digest, vector in items],
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+def length_buckets(lengths, batch_size):
+    """Batches of indices with similar token counts, longest first."""
+    order = np.argsort(-np.asarray(lengths), kind="stable")
+    return [order[start:start + batch_size].tolist() for start in range(0, len(order), batch_size)]
+
+
+def pad_batch(sequences, pad_id, side):
+    """Pad token id lists into input_ids/attention_mask tensors on ``side``.
+
+    Padding here rather than through ``tokenizer.padding_side`` keeps the
+    shared tokenizer free of per-call state, so concurrent generation (left)
+    and embedding (right) cannot pick up each other's setting.
+    """
+    import torch
+
+    width = max((len(ids) for ids in sequences), default=0)
+    input_ids = torch.full((len(sequences), width), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(sequences), width), dtype=torch.long)
+    for row, ids in enumerate(sequences):
+        span = slice(width - len(ids), width) if side == "left" else slice(0, len(ids))
+        input_ids[row, span] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, span] = 1
+    return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+
+@dataclass
+class GenerationMetrics:
+    prompt_tokens: int
+    generated_tokens: int
+    ttft_ms: float
+    total_ms: float
+
+    @property
+    def tokens_per_sec(self):
+        return self.generated_tokens / (self.total_ms / 1000) if self.total_ms else 0.0
+
+    def record(self, metrics_registry, name="nlp.generate"):
+        if metrics_registry is None:
+            return
+        metrics_registry.observe(f"{name}.ttft_ms", self.ttft_ms)
+        metrics_registry.observe(f"{name}.tokens_per_sec", self.tokens_per_sec)
+        metrics_registry.increment(f"{name}.generated_tokens", float(self.generated_tokens))
+
+
+class _FirstStepTimer:
+    """Logits processor timestamping the first decoding step, i.e. when prefill finished.
+
+    ``generate`` only calls processors, so this needs no transformers base class.
+    """
+
+    def __init__(self):
+        self.first_step_at = None
+
+    def __call__(self, input_ids, scores):
+        if self.first_step_at is None:
+            self.first_step_at = time.perf_counter()
+        return scores
+
+
+@dataclass
+class ChatSession:
+    """Key/value cache of one dialogue, so later turns only prefill their new tokens."""
+
+    session_id: str
+    past_key_values: Any = None
+    cached_tokens: int = 0
+    # The last generated token is sampled but not yet fed through the model.
+    pending_ids: List[int] = field(default_factory=list)
+    last_metrics: Optional[GenerationMetrics] = None
+
 
 class NLPModel:
-    def __init__(self, model_name='gpt2'):
-        self.tokenizer = GPT2Tokenizer.from_pretrained(model_name)
-        self.model = GPT2LMHeadModel.from_pretrained(model_name)
+    """GPT-2 style causal LM; the tokenizer and weights load on first use.
+
+    Generation and embedding are safe to call from several threads. One
+    session must not be streamed from two threads at once, and
+    ``last_metrics`` holds whichever call finished last; read the metrics of
+    a session from ``ChatSession.last_metrics``.
+    """
+
+    def __init__(self, model_name='gpt2', local_files_only=None, metrics_registry=None, max_sessions=64):
+        # A local directory always loads offline; hub names honour local_files_only/HF_HUB_OFFLINE.
+        if local_files_only is None:
+            local_files_only = Path(model_name).is_dir()
+        self.model_name = model_name
+        self.local_files_only = local_files_only
+        self._tokenizer = self._model = self._encoder = self._config = None
+        self._load_lock = threading.Lock()
+        self.metrics_registry = metrics_registry
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
+        self.last_metrics = None
+
+    def load(self):
+        """Load the causal LM once; safe to call from several threads."""
+        if self._model is not None:
+            return self
+        with self._load_lock:
+            if self._model is None:
+                from transformers import AutoModelForCausalLM
+
+                model = AutoModelForCausalLM.from_pretrained(self.model_name, local_files_only=self.local_files_only)
+                model.eval()
+                self._model = model
+        return self
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            with self._load_lock:
+                if self._tokenizer is None:
+                    from transformers import AutoTokenizer
+
+                    tokenizer = AutoTokenizer.from_pretrained(self.model_name, local_files_only=self.local_files_only)
+                    if tokenizer.pad_token is None:
+                        # GPT-2 has no pad token; padded positions are masked out anyway.
+                        tokenizer.pad_token = tokenizer.eos_token
+                    self._tokenizer = tokenizer
+        return self._tokenizer
+
+    @property
+    def model(self):
+        return self.load()._model
+
+    @property
+    def encoder(self):
+        """Bare transformer for embeddings, without an LM head.
+
+        Loaded with AutoModel, so encoder-only checkpoints work too. When the
+        causal LM is already loaded, its base model is reused instead.
+        """
+        if self._model is not None:
+            return self._model.base_model
+        if self._encoder is None:
+            with self._load_lock:
+                if self._encoder is None:
+                    from transformers import AutoModel
+
+                    encoder = AutoModel.from_pretrained(self.model_name, local_files_only=self.local_files_only)
+                    encoder.eval()
+                    self._encoder = encoder
+        return self._encoder
+
+    @property
+    def config(self):
+        # Only the small config file, so fully cached embedding runs never load weights.
+        if self._config is None:
+            from transformers import AutoConfig
+
+            self._config = AutoConfig.from_pretrained(self.model_name, local_files_only=self.local_files_only)
+        return self._config
+
+    @property
+    def embedding_dim(self):
+        return self.config.hidden_size
+
+    def model_version(self, max_length):
+        # The load path is left out, so a hub name and a local copy share cache rows.
+        settings = {key: value for key, value in self.config.to_dict().items() if key != "_name_or_path"}
+        config = json.dumps(settings, sort_keys=True, default=str)
+        revision = getattr(self.config, "_commit_hash", None) or ""
+        digest = hashlib.sha256(f"{config}|{revision}|mean|{max_length}".encode("utf-8")).hexdigest()
+        return f"{self.config.model_type}-{digest[:12]}"
+
+    @property
+    def max_context(self):
+        return getattr(self.config, "n_positions", None) or self.config.max_position_embeddings
 
     def generate_text(self, prompt, max_length=50):
-        inputs = self.tokenizer(prompt, return_tensors="pt")
-        outputs = self.model.generate(inputs["input_ids"], max_length=max_length, num_return_sequences=1)
-        return self.tokenizer.decode(outputs[0], skip_special_tokens=True)
+        return self.generate_batch([prompt], max_length=max_length)[0]
+
+    def generate_batch(self, prompts, max_new_tokens=None, max_length=None, **generate_kwargs):
+        """Generate for many prompts in one call; returns prompt + completion per prompt.
+
+        Prompts are left-padded so every row's last real token sits at the
+        end, where decoder-only models continue from.
+        """
+        import torch
+        from transformers import LogitsProcessorList
+
+        inputs = pad_batch(self.tokenizer(list(prompts))["input_ids"], self.tokenizer.pad_token_id, "left")
+        timer = _FirstStepTimer()
+        started = time.perf_counter()
+        with torch.inference_mode():
+            outputs = self.model.generate(
+                input_ids=inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                max_new_tokens=max_new_tokens,
+                max_length=max_length if max_new_tokens is None else None,
+                pad_token_id=self.tokenizer.pad_token_id,
+                logits_processor=LogitsProcessorList([timer]),
+                **generate_kwargs,
+            )
+        finished = time.perf_counter()
+        new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+        generated = int((new_tokens != self.tokenizer.pad_token_id).sum())
+        self.last_metrics = GenerationMetrics(
+            prompt_tokens=int(inputs["attention_mask"].sum()),
+            generated_tokens=generated,
+            ttft_ms=((timer.first_step_at or finished) - started) * 1000,
+            total_ms=(finished - started) * 1000,
+        )
+        self.last_metrics.record(self.metrics_registry)
+        return self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+
+    def session(self, session_id):
+        with self._sessions_lock:
+            session = self.sessions.pop(session_id, None) or ChatSession(session_id)
+            self.sessions[session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        return session
+
+    def end_session(self, session_id):
+        with self._sessions_lock:
+            self.sessions.pop(session_id, None)
+
+    def stream(self, prompt, session_id=None, max_new_tokens=50, temperature=0.0):
+        """Yield decoded text pieces as tokens are generated.
+
+        With ``session_id``, the key/value cache from earlier turns of that
+        dialogue is reused, so only this turn's tokens are prefilled. When the
+        dialogue would outgrow the model's context, the session restarts from
+        this turn. Metrics land in ``self.last_metrics`` and the session.
+        ``max_new_tokens`` must be at least 1: the prompt is only prefilled
+        into the session's cache together with the first generation step.
+        """
+        if max_new_tokens < 1:
+            raise ValueError(f"max_new_tokens must be at least 1, got {max_new_tokens}")
+        import torch
+
+        session = self.session(session_id) if session_id is not None else ChatSession("")
+        prompt_ids = session.pending_ids + self.tokenizer(prompt)["input_ids"]
+        if session.cached_tokens + len(prompt_ids) + max_new_tokens > self.max_context:
+            session.past_key_values, session.cached_tokens = None, 0
+            prompt_ids = self.tokenizer(prompt)["input_ids"]
+        started = time.perf_counter()
+        first_token_at = None
+        generated = []
+        emitted = ""
+        input_ids = prompt_ids
+        try:
+            for _ in range(max_new_tokens):
+                attention_mask = torch.ones(1, session.cached_tokens + len(input_ids), dtype=torch.long)
+                with torch.inference_mode():
+                    out = self.model(
+                        input_ids=torch.tensor([input_ids]),
+                        attention_mask=attention_mask,
+                        past_key_values=session.past_key_values,
+                        use_cache=True,
+                    )
+                session.past_key_values = out.past_key_values
+                session.cached_tokens += len(input_ids)
+                logits = out.logits[0, -1]
+                if temperature > 0:
+                    next_id = int(torch.multinomial(torch.softmax(logits / temperature, dim=-1), 1))
+                else:
+                    next_id = int(logits.argmax())
+                # Sampled but not yet in the cache; the next step (or turn) feeds it.
+                input_ids = [next_id]
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                if next_id == self.tokenizer.eos_token_id:
+                    break
+                generated.append(next_id)
+                # Decode the whole completion so multi-byte characters split
+                # across BPE tokens are only emitted once complete.
+                text = self.tokenizer.decode(generated, skip_special_tokens=True)
+                if text.endswith("\ufffd"):
+                    continue
+                piece, emitted = text[len(emitted):], text
+                if piece:
+                    yield piece
+        finally:
+            finished = time.perf_counter()
+            session.pending_ids = input_ids if input_ids is not prompt_ids else []
+            metrics = GenerationMetrics(
+                prompt_tokens=len(prompt_ids),
+                generated_tokens=len(generated),
+                ttft_ms=((first_token_at or finished) - started) * 1000,
+                total_ms=(finished - started) * 1000,
+            )
+            metrics.record(self.metrics_registry, "nlp.stream")
+            self.last_metrics = session.last_metrics = metrics
+
+    def _embed_uncached(self, texts, batch_size, max_length):
+        import torch
+
+        encoded = self.tokenizer(texts, truncation=True, max_length=max_length)
+        lengths = [len(ids) for ids in encoded["input_ids"]]
+        embeddings = np.zeros((len(texts), self.embedding_dim), dtype=np.float32)
+        for bucket in length_buckets(lengths, batch_size):
+            # Pad only to the longest text in this bucket.
+            batch = pad_batch([encoded["input_ids"][i] for i in bucket], self.tokenizer.pad_token_id, "right")
+            with torch.inference_mode():
+                hidden = self.encoder(**batch).last_hidden_state
+            mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+            embeddings[bucket] = pooled.float().numpy()
+        return embeddings
+
+    def embed_texts(self, texts, batch_size=32, max_length=128, cache_path=None):
+        """Mean-pooled last hidden states, shape (len(texts), hidden_size).
+
+        Texts are deduplicated by hash; with ``cache_path`` only texts not
+        seen before for this model version are run through the model.
+        """
+        texts = list(texts)
+        digests = [text_digest(text) for text in texts]
+        version = self.model_version(max_length)
+        cache = TextEmbeddingCache(cache_path) if cache_path else None
+        try:
+            known = cache.get_many(version, set(digests)) if cache else {}
+            missing = list({digest: text for digest, text in zip(digests, texts) if digest not in known}.items())
+            if missing:
+                vectors = self._embed_uncached([text for _, text in missing], batch_size, max_length)
+                fresh = {digest: vector for (digest, _), vector in zip(missing, vectors)}
+                if cache:
+                    cache.put_many(version, fresh.items())
+                known.update(fresh)
+        finally:
+            if cache:
+                cache.close()
+        if not texts:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+        return np.stack([known[digest] for digest in digests]).astype(np.float32, copy=False)
+
+
+def get_nlp_model(model_name='gpt2', local_files_only=None):
+    """Process-wide shared NLPModel for ``model_name``; weights load on first use.
+
+    The instance is shared by every caller in the process, so session ids
+    must be unique across them (see NLPModel for the threading rules).
+    Callers that want their own sessions or metrics registry should build an
+    NLPModel instead.
+    """
+    key = (model_name, local_files_only)
+    with _shared_lock:
+        if key not in _shared_models:
+            _shared_models[key] = NLPModel(model_name, local_files_only=local_files_only)
+        return _shared_models[key]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GPT-2 text generation and embeddings")
+    parser.add_argument("--model", default="gpt2", help="hub name or local model directory")
+    parser.add_argument("--offline", action="store_true", help="never contact the model hub")
+    subparsers = parser.add_subparsers(dest="command")
+
+    generate = subparsers.add_parser("generate", help="batched generation, one completion per prompt")
+    generate.add_argument("prompts", nargs="*", default=["Once upon a time"])
+    generate.add_argument("--max-new-tokens", type=int, default=50)
+
+    chat = subparsers.add_parser("chat", help="interactive streaming chat that reuses the KV cache")
+    chat.add_argument("--max-new-tokens", type=int, default=60)
+    chat.add_argument("--temperature", type=float, default=0.0)
+
+    embed = subparsers.add_parser("embed", help="embed one text per input line")
+    embed.add_argument("input", type=Path)
+    embed.add_argument("--out", type=Path, default=Path("text_embeddings.npy"))
+    embed.add_argument("--batch-size", type=int, default=32)
+    embed.add_argument("--max-length", type=int, default=128)
+    embed.add_argument("--cache", type=Path, default=Path(".cache/text_embeddings.sqlite"))
+    args = parser.parse_args(argv)
+
+    nlp_model = NLPModel(args.model, local_files_only=True if args.offline else None)
+    if args.command == "embed":
+        texts = [line.strip() for line in args.input.read_text(encoding="utf-8").splitlines() if line.strip()]
+        embeddings = nlp_model.embed_texts(texts, args.batch_size, args.max_length, cache_path=args.cache)
+        np.save(args.out, embeddings)
+        print(f"Wrote {embeddings.shape[0]} x {embeddings.shape[1]} embeddings to {args.out}")
+        return
+    if args.command == "chat":
+        while True:
+            try:
+                turn = input("> ")
+            except EOFError:
+                break
+            for piece in nlp_model.stream(turn + "\n", "cli", args.max_new_tokens, args.temperature):
+                print(piece, end="", flush=True)
+            metrics = nlp_model.last_metrics
+            print(f"\n[ttft {metrics.ttft_ms:.0f} ms, {metrics.tokens_per_sec:.1f} tok/s]")
+        return
+    prompts = getattr(args, "prompts", ["Once upon a time"])
+    for generated_text in nlp_model.generate_batch(prompts, max_new_tokens=getattr(args, "max_new_tokens", 50)):
+        print(f"Generated Text: {generated_text}")
+    metrics = nlp_model.last_metrics
+    print(f"[ttft {metrics.ttft_ms:.0f} ms, {metrics.tokens_per_sec:.1f} tok/s across {len(prompts)} prompts]")
+
 
 if __name__ == "__main__":
-    nlp_model = NLPModel()
-    prompt = "Once upon a time"
-    generated_text = nlp_model.generate_text(prompt)
-    print(f"Generated Text: {generated_text}")
+    main()
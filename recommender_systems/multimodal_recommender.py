@@ -1,12 +1,15 @@
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 
+from netflix_recommender.batching import normalize_rows, top_n_cosine
+
 class MultimodalRecommender:
     def __init__(self, text_features, image_features, video_features):
         self.text_features = text_features
         self.image_features = image_features
         self.video_features = video_features
         self.combined_features = np.hstack((text_features, image_features, video_features))
+        self.normalized_features = normalize_rows(self.combined_features)
 
     def recommend(self, user_profile, top_n=10):
         user_profile = user_profile.reshape(1, -1)
@@ -14,6 +17,11 @@ class MultimodalRecommender:
         recommendations = similarities.argsort()[0][-top_n:]
         return recommendations
 
+    def recommend_batch(self, user_profiles, top_n=10):
+        # One matrix multiply for many profiles; rows match recommend()'s ordering.
+        user_profiles = np.vstack([np.reshape(profile, (1, -1)) for profile in user_profiles])
+        return top_n_cosine(user_profiles, self.normalized_features, top_n)
+
 if __name__ == "__main__":
     text_features = np.random.rand(1000, 300)
     image_features = np.random.rand(1000, 2048)
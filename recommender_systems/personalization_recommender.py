@@ -1,10 +1,13 @@
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
 
+from netflix_recommender.batching import normalize_rows, top_n_cosine
+
 class PersonalizationRecommender:
     def __init__(self, user_profiles, item_profiles):
         self.user_profiles = user_profiles
         self.item_profiles = item_profiles
+        self.normalized_items = normalize_rows(item_profiles)
 
     def recommend(self, user_id, top_n=10):
         user_profile = self.user_profiles[user_id].reshape(1, -1)
@@ -12,6 +15,10 @@ class PersonalizationRecommender:
         recommendations = similarities.argsort()[0][-top_n:]
         return recommendations
 
+    def recommend_batch(self, user_ids, top_n=10):
+        # One matrix multiply for many users; rows match recommend()'s ordering.
+        return top_n_cosine(self.user_profiles[list(user_ids)], self.normalized_items, top_n)
+
 if __name__ == "__main__":
     user_profiles = np.random.rand(100, 50)
     item_profiles = np.random.rand(1000, 50)
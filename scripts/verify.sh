@@ -11,21 +11,40 @@ if command -v black >/dev/null 2>&1; then
   black --check \
     "$ROOT_DIR/src/netflix_recommender/observability.py" \
     "$ROOT_DIR/src/netflix_recommender/tracing.py" \
+    "$ROOT_DIR/src/netflix_recommender/trace_analysis.py" \
     "$ROOT_DIR/src/netflix_recommender/plugins.py" \
     "$ROOT_DIR/src/netflix_recommender/safety.py" \
     "$ROOT_DIR/src/netflix_recommender/runtime.py" \
     "$ROOT_DIR/src/netflix_recommender/demo.py" \
     "$ROOT_DIR/src/netflix_recommender/quality.py" \
+    "$ROOT_DIR/src/netflix_recommender/quality_drift.py" \
+    "$ROOT_DIR/src/netflix_recommender/sketches.py" \
     "$ROOT_DIR/src/netflix_recommender/reporting.py" \
+    "$ROOT_DIR/src/netflix_recommender/profiling.py" \
+    "$ROOT_DIR/src/netflix_recommender/outputs.py" \
+    "$ROOT_DIR/src/netflix_recommender/serving.py" \
+    "$ROOT_DIR/src/netflix_recommender/snapshots.py" \
+    "$ROOT_DIR/src/netflix_recommender/batching.py" \
+    "$ROOT_DIR/src/netflix_recommender/sql_runner.py" \
+    "$ROOT_DIR/src/netflix_recommender/rollups.py" \
     "$ROOT_DIR/tests/test_observability.py" \
     "$ROOT_DIR/tests/test_tracing.py" \
+    "$ROOT_DIR/tests/test_trace_analysis.py" \
     "$ROOT_DIR/tests/test_plugins.py" \
     "$ROOT_DIR/tests/test_safety.py" \
     "$ROOT_DIR/tests/test_runtime.py" \
     "$ROOT_DIR/tests/test_demo.py" \
     "$ROOT_DIR/tests/test_pipeline_extensions.py" \
     "$ROOT_DIR/tests/test_quality.py" \
-    "$ROOT_DIR/tests/test_reporting.py"
+    "$ROOT_DIR/tests/test_quality_drift.py" \
+    "$ROOT_DIR/tests/test_reporting.py" \
+    "$ROOT_DIR/tests/test_profiling.py" \
+    "$ROOT_DIR/tests/test_outputs.py" \
+    "$ROOT_DIR/tests/test_serving.py" \
+    "$ROOT_DIR/tests/test_snapshots.py" \
+    "$ROOT_DIR/tests/test_batching.py" \
+    "$ROOT_DIR/tests/test_sql_runner.py" \
+    "$ROOT_DIR/tests/test_rollups.py"
 else
   echo "black not installed; skipping format check"
 fi
@@ -1,4 +1,14 @@
-"""Netflix-style recommender demo package."""
+"""Netflix-style recommender demo package.
+
+Submodules are imported on first attribute access, so ``import
+netflix_recommender`` stays cheap and pandas/DuckDB are only loaded by the
+modules that need them.
+"""
+
+from __future__ import annotations
+
+import importlib
+from types import ModuleType
 
 __all__ = [
     "config",
@@ -8,10 +18,30 @@ __all__ = [
     "analysis_utils",
     "observability",
     "tracing",
+    "trace_analysis",
     "plugins",
     "safety",
     "runtime",
     "demo",
     "quality",
+    "quality_drift",
+    "sketches",
     "reporting",
+    "outputs",
+    "serving",
+    "snapshots",
+    "batching",
+    "sql_runner",
+    "rollups",
+    "profiling",
 ]
+
+
+def __getattr__(name: str) -> ModuleType:
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,184 @@
+"""Asyncio micro-batching for real-time scoring.
+
+Scoring one request at a time turns every recommendation into a
+matrix-vector product. :class:`MicroBatcher` queues concurrent requests and
+hands them to a batch function as soon as ``max_batch_size`` requests are
+waiting or the oldest one has waited ``max_wait_ms``, so a burst is served by
+one matrix-matrix product. Results are fanned back out to each caller's
+future. Batch sizes and per-request queue wait are reported to a
+:class:`~.observability.MetricRegistry` when one is given.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Generic, List, Optional, Sequence, TypeVar
+
+import numpy as np
+
+from .observability import MetricRegistry
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class _Pending(Generic[T, R]):
+    item: T
+    future: "asyncio.Future[R]"
+    enqueued_ns: int = field(default_factory=time.perf_counter_ns)
+
+
+class MicroBatcher(Generic[T, R]):
+    """Coalesce concurrent ``submit`` calls into calls of ``score_batch``.
+
+    ``score_batch`` receives a list of items and must return one result per
+    item, in order. With ``offload=True`` it runs in the default executor so
+    the event loop keeps accepting requests while NumPy/BLAS works.
+    """
+
+    def __init__(
+        self,
+        score_batch: Callable[[List[T]], Sequence[R]],
+        max_batch_size: int = 64,
+        max_wait_ms: float = 2.0,
+        metrics_registry: Optional[MetricRegistry] = None,
+        name: str = "micro_batch",
+        offload: bool = True,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.score_batch = score_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.metrics_registry = metrics_registry
+        self.name = name
+        self.offload = offload
+        self._queue: Optional[asyncio.Queue[_Pending[T, R]]] = None
+        self._worker: Optional[asyncio.Task[None]] = None
+
+    async def __aenter__(self) -> "MicroBatcher[T, R]":
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self.close()
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the worker; requests still queued fail with ``CancelledError``."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        assert self._queue is not None
+        while not self._queue.empty():
+            self._queue.get_nowait().future.cancel()
+
+    async def submit(self, item: T) -> R:
+        self.start()
+        assert self._queue is not None
+        future: asyncio.Future[R] = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Pending(item, future))
+        return await future
+
+    async def _collect(self, batch: List[_Pending[T, R]]) -> None:
+        """Fill ``batch`` in place so a cancelled worker can fail what it holds."""
+        assert self._queue is not None
+        batch.append(await self._queue.get())
+        deadline = batch[0].enqueued_ns + int(self.max_wait_ms * 1e6)
+        while len(batch) < self.max_batch_size:
+            remaining = (deadline - time.perf_counter_ns()) / 1e9
+            if remaining <= 0:
+                # Past the deadline, still take whatever is already queued.
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:  # noqa: UP041 - not the builtin on 3.10
+                break
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        batch: List[_Pending[T, R]] = []
+        try:
+            while True:
+                batch = []
+                await self._collect(batch)
+                batch = [pending for pending in batch if not pending.future.done()]
+                if batch:
+                    await self._score(loop, batch)
+        except asyncio.CancelledError:
+            for pending in batch:
+                pending.future.cancel()
+            raise
+
+    async def _score(
+        self, loop: asyncio.AbstractEventLoop, batch: List[_Pending[T, R]]
+    ) -> None:
+        items = [pending.item for pending in batch]
+        try:
+            # A failing metrics registry fails this batch, not the worker.
+            self._record(batch)
+            if self.offload:
+                results = await loop.run_in_executor(None, self.score_batch, items)
+            else:
+                results = self.score_batch(items)
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"score_batch returned {len(results)} results for {len(batch)} items"
+                )
+        except Exception as exc:  # noqa: BLE001 - propagated to every caller
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(exc)
+            return
+        for pending, result in zip(batch, results):
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+    def _record(self, batch: List[_Pending[T, R]]) -> None:
+        if self.metrics_registry is None:
+            return
+        now = time.perf_counter_ns()
+        self.metrics_registry.observe(f"{self.name}.batch_size", float(len(batch)))
+        for pending in batch:
+            self.metrics_registry.observe(
+                f"{self.name}.queue_wait_ms", (now - pending.enqueued_ns) / 1e6
+            )
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so cosine similarity becomes a plain dot product."""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def top_n_cosine(
+    queries: np.ndarray, normalized_items: np.ndarray, top_n: int
+) -> np.ndarray:
+    """Indices of the ``top_n`` most similar items per query row.
+
+    Scores every query with one matrix multiply. Like the recommenders'
+    single-request ``argsort()[-top_n:]``, each row is in ascending order of
+    similarity.
+    """
+    scores = normalize_rows(queries) @ normalized_items.T
+    top_n = min(top_n, scores.shape[1])
+    if top_n == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.intp)
+    candidates = np.argpartition(scores, -top_n, axis=1)[:, -top_n:]
+    order = np.argsort(np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
@@ -6,24 +6,41 @@ import logging
 import os
 import uuid
 from pathlib import Path
-from contextlib import nullcontext
-from typing import Dict, List, Tuple
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, replace
+from typing import ContextManager, Dict, Iterator, List, Sequence, Tuple
 
 import duckdb
 import pandas as pd
 
 from . import analysis_utils, config, database, recommenders
-from .observability import MetricRegistry, configure_logging, metric_timer
+from .observability import MetricRegistry, StructuredLogger, configure_logging, metric_timer
+from .outputs import OutputArtifact, atomic_path, write_outputs
 from .plugins import PluginContext, apply_plugins, build_default_registry
-from .quality import DataQualityConfig, run_quality_checks
-from .reporting import build_summary, write_markdown_report, write_summary
+from .profiling import StageProfiler
+from .quality import DataQualityConfig, run_quality_checks, run_quality_checks_sql
+from .quality_drift import run_incremental_quality_checks
+from .reporting import build_summary_sql, write_markdown_report, write_summary
+from .rollups import export_dashboard_rollups, refresh_rollups
 from .runtime import PipelineRuntimeConfig, runtime_from_env
-from .safety import build_default_policy, enforce_policy
-from .tracing import TraceRecorder, build_trace_recorder
+from .safety import ProfileItemMasks, build_default_policy, build_profile_policies, enforce_policy
+from .serving import RecommendationIndex
+from .snapshots import SnapshotStore
+from .sql_runner import QueryResult, run_sql_file
+from .tracing import TraceRecorder, build_trace_recorder, child_span
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Checks on the loaded fact table, compiled into a single DuckDB scan.
+WAREHOUSE_QUALITY_CONFIG = DataQualityConfig(
+    min_rows=1,
+    required_columns=["user_key", "title_key", "timestamp", "completion_ratio"],
+    numeric_ranges={"completion_ratio": (0.0, 1.0), "watch_time_minutes": (0.0, 24 * 60.0)},
+    not_null_columns=["user_key", "title_key", "timestamp"],
+    foreign_keys={"user_key": ("dim_users", "user_key"), "title_key": ("dim_titles", "title_key")},
+)
+
 
 def resolve_runtime_config(runtime_config: PipelineRuntimeConfig | None) -> PipelineRuntimeConfig:
     """Resolve runtime config from env when none is provided."""
@@ -46,12 +63,46 @@ def maybe_timer(registry: MetricRegistry | None, name: str) -> nullcontext:
     return metric_timer(registry, name)
 
 
-def maybe_span(recorder: TraceRecorder | None, name: str) -> nullcontext:
+def maybe_span(recorder: TraceRecorder | None, name: str) -> ContextManager:
     if recorder is None:
         return nullcontext()
     return recorder.span(name)
 
 
+def maybe_profile(profiler: StageProfiler | None, name: str) -> ContextManager:
+    if profiler is None:
+        return nullcontext()
+    return profiler.profile(name)
+
+
+def resolve_profile_dir(runtime_config: PipelineRuntimeConfig) -> Path:
+    """Place stage profiles next to the trace when there is one."""
+    if runtime_config.profile_dir is not None:
+        return runtime_config.profile_dir
+    if runtime_config.trace_path is not None:
+        return runtime_config.trace_path.parent / "profiles"
+    return runtime_config.output_dir / "profiles"
+
+
+@dataclass
+class StageInstruments:
+    """Optional tracing, metrics and profiling hooks applied to every stage."""
+
+    metrics_registry: MetricRegistry | None = None
+    trace_recorder: TraceRecorder | None = None
+    profiler: StageProfiler | None = None
+    structured_logger: StructuredLogger | None = None
+
+    @contextmanager
+    def stage(self, name: str, metric_name: str | None = None) -> Iterator[None]:
+        """Wrap a stage in a span, an optional timer metric and an optional profile."""
+        timer = maybe_timer(self.metrics_registry, metric_name) if metric_name else nullcontext()
+        with maybe_span(self.trace_recorder, name):
+            with timer:
+                with maybe_profile(self.profiler, name):
+                    yield
+
+
 def extract_data(data_path: Path = config.DATA_PATH) -> pd.DataFrame:
     """Load the synthetic viewing history dataset."""
     logger.info("Extracting synthetic data from %s", data_path)
@@ -67,35 +118,58 @@ def load_raw_data(df: pd.DataFrame, conn: duckdb.DuckDBPyConnection) -> None:
 
 
 def build_star_schema(conn: duckdb.DuckDBPyConnection) -> None:
-    """Create dimension and fact tables."""
+    """Create dimension and fact tables.
+
+    Dimensions assign dense 0-based INTEGER surrogate keys in sorted id order,
+    so a key doubles as the row/column index of the NumPy interaction matrix.
+    ``fact_views`` stores only the keys, clustered by user and title; external
+    ids are joined back from the dimensions when results are written out.
+    """
     logger.info("Building dimension and fact tables")
     conn.execute(
         """
         CREATE OR REPLACE TABLE dim_users AS
-        SELECT DISTINCT user_id, region, profile
-        FROM raw_views;
+        SELECT
+            CAST(ROW_NUMBER() OVER (ORDER BY user_id) - 1 AS INTEGER) AS user_key,
+            user_id,
+            arg_max(region, timestamp) AS region,
+            arg_max(profile, timestamp) AS profile
+        FROM raw_views
+        GROUP BY user_id
+        ORDER BY user_key;
         """
     )
+    # Carry an optional content rating through so policies can filter candidates.
+    raw_columns = {row[0] for row in conn.execute("DESCRIBE raw_views").fetchall()}
+    rating_select = ", MAX(content_rating) AS content_rating" if "content_rating" in raw_columns else ""
     conn.execute(
-        """
+        f"""
         CREATE OR REPLACE TABLE dim_titles AS
-        SELECT DISTINCT show_id AS title_id
-        FROM raw_views;
+        SELECT
+            CAST(ROW_NUMBER() OVER (ORDER BY show_id) - 1 AS INTEGER) AS title_key,
+            show_id AS title_id{rating_select}
+        FROM raw_views
+        GROUP BY show_id
+        ORDER BY title_key;
         """
     )
     conn.execute(
         """
         CREATE OR REPLACE TABLE fact_views AS
         SELECT
-            user_id,
-            show_id AS title_id,
-            timestamp,
-            device_type,
-            watch_time_minutes,
-            completion_ratio
-        FROM raw_views;
+            u.user_key,
+            t.title_key,
+            r.timestamp,
+            r.device_type,
+            r.watch_time_minutes,
+            r.completion_ratio
+        FROM raw_views r
+        JOIN dim_users u USING (user_id)
+        JOIN dim_titles t ON t.title_id = r.show_id
+        ORDER BY u.user_key, t.title_key, r.timestamp;
         """
     )
+    database.bump_table_versions(conn, ["dim_users", "dim_titles", "fact_views"])
     logger.info("Star schema built: dim_users (%d rows), dim_titles (%d rows), fact_views (%d rows)",
                 conn.execute("SELECT COUNT(*) FROM dim_users").fetchone()[0],
                 conn.execute("SELECT COUNT(*) FROM dim_titles").fetchone()[0],
@@ -103,25 +177,39 @@ def build_star_schema(conn: duckdb.DuckDBPyConnection) -> None:
 
 
 def feature_engineering(conn: duckdb.DuckDBPyConnection) -> None:
-    """Create feature tables for modeling."""
+    """Create feature tables for modeling.
+
+    Aggregation runs on the integer keys; the external ids are attached from
+    the dimensions afterwards so the features can be joined to outputs.
+    """
     logger.info("Generating feature tables")
     conn.execute(
         """
         CREATE OR REPLACE TABLE feat_user_engagement AS
-        SELECT user_id, AVG(completion_ratio) AS avg_completion, SUM(watch_time_minutes) AS total_watch_time
-        FROM fact_views
-        GROUP BY user_id;
+        SELECT d.user_key, d.user_id, f.avg_completion, f.total_watch_time
+        FROM (
+            SELECT user_key, AVG(completion_ratio) AS avg_completion, SUM(watch_time_minutes) AS total_watch_time
+            FROM fact_views
+            GROUP BY user_key
+        ) f
+        JOIN dim_users d USING (user_key)
+        ORDER BY d.user_key;
         """
     )
     conn.execute(
         """
         CREATE OR REPLACE TABLE feat_title_popularity AS
-        SELECT title_id, COUNT(*) AS view_events, AVG(completion_ratio) AS avg_completion
-        FROM fact_views
-        GROUP BY title_id
-        ORDER BY view_events DESC;
+        SELECT d.title_key, d.title_id, f.view_events, f.avg_completion
+        FROM (
+            SELECT title_key, COUNT(*) AS view_events, AVG(completion_ratio) AS avg_completion
+            FROM fact_views
+            GROUP BY title_key
+        ) f
+        JOIN dim_titles d USING (title_key)
+        ORDER BY f.view_events DESC;
         """
     )
+    database.bump_table_versions(conn, ["feat_user_engagement", "feat_title_popularity"])
     logger.info(
         "Feature tables created (users: %d, titles: %d)",
         conn.execute("SELECT COUNT(*) FROM feat_user_engagement").fetchone()[0],
@@ -129,11 +217,37 @@ def feature_engineering(conn: duckdb.DuckDBPyConnection) -> None:
     )
 
 
-def train_models(conn: duckdb.DuckDBPyConnection, top_k: int = config.DEFAULT_TOP_K) -> pd.DataFrame:
+def load_profile_item_masks(conn: duckdb.DuckDBPyConnection) -> ProfileItemMasks | None:
+    """Build per-profile candidate masks from title ratings in ``dim_titles``."""
+    title_columns = {row[0] for row in conn.execute("DESCRIBE dim_titles").fetchall()}
+    if "content_rating" not in title_columns:
+        logger.warning("dim_titles has no content_rating column; candidate policy filtering skipped")
+        return None
+    ratings = conn.execute("SELECT title_id, content_rating FROM dim_titles").df()
+    profiles = conn.execute("SELECT user_id, profile FROM dim_users").df()
+    return ProfileItemMasks(
+        title_ratings=ratings.set_index("title_id")["content_rating"],
+        policies=build_profile_policies(),
+        user_profiles=dict(zip(profiles["user_id"], profiles["profile"])),
+    )
+
+
+def train_models(
+    conn: duckdb.DuckDBPyConnection,
+    top_k: int = config.DEFAULT_TOP_K,
+    item_masks: ProfileItemMasks | None = None,
+) -> pd.DataFrame:
     """Train baseline recommenders and return combined recommendations."""
     logger.info("Training baseline recommenders with top_k=%d", top_k)
-    popularity_recs = recommenders.popularity_recommender(conn, top_k)
-    cf_recs = recommenders.user_based_cf(conn, top_k)
+    # Both models share one int32-coded interaction load, so their categorical
+    # id columns share a vocabulary and concatenate without decoding.
+    interactions = recommenders.load_interactions(conn)
+    with child_span("model.popularity"):
+        popularity_recs = recommenders.popularity_recommender(
+            conn, top_k, item_masks=item_masks, interactions=interactions
+        )
+    with child_span("model.user_cf"):
+        cf_recs = recommenders.user_based_cf(conn, top_k, item_masks=item_masks, interactions=interactions)
     combined = pd.concat([popularity_recs, cf_recs])
     logger.info("Generated %d recommendation rows", len(combined))
     return combined
@@ -147,7 +261,8 @@ def evaluate_models(
     train_df, test_df = analysis_utils.simple_holdout_split(df)
     truth = analysis_utils.collect_ground_truth(test_df)
     recs_grouped: Dict[str, List[str]] = {}
-    for user, group in recommendations.groupby("user_id"):
+    # user_id is categorical; skip vocabulary users that have no recommendations.
+    for user, group in recommendations.groupby("user_id", observed=True):
         recs_grouped[user] = group.sort_values("rank").head(top_k)["title_id"].tolist()
     aligned_truth = {user: truth.get(user, []) for user in recs_grouped.keys()}
     prec = analysis_utils.precision_at_k(recs_grouped, aligned_truth, k=top_k)
@@ -156,27 +271,37 @@ def evaluate_models(
     return metrics
 
 
-def run_sql_examples(conn: duckdb.DuckDBPyConnection) -> List:
-    """Run example SQL analyses from the sql directory."""
+def run_sql_examples(manager: database.ConnectionManager, result_dir: Path) -> List[QueryResult]:
+    """Run example SQL analyses from the sql directory, writing results to ``result_dir``."""
     sql_file = config.SQL_DIR / "engagement_queries.sql"
     if sql_file.exists():
         logger.info("Running sample SQL analyses from %s", sql_file)
-        return database.run_query_file(conn, sql_file)
+        return run_sql_file(manager, sql_file, result_dir)
     logger.warning("No SQL file found at %s", sql_file)
     return []
 
 
 def save_outputs(
-    recommendations: pd.DataFrame, metrics: Dict[str, float], output_dir: Path | None = None
-) -> None:
-    """Persist outputs to disk."""
+    recommendations: pd.DataFrame,
+    metrics: Dict[str, float],
+    output_dir: Path | None = None,
+    formats: Sequence[str] = ("csv",),
+    conn: duckdb.DuckDBPyConnection | None = None,
+) -> List[OutputArtifact]:
+    """Persist outputs to disk in the requested formats."""
     resolved_output = output_dir or config.OUTPUT_DIR
-    resolved_output.mkdir(parents=True, exist_ok=True)
-    rec_path = resolved_output / "recommendations.csv"
+    artifacts = write_outputs(
+        recommendations, resolved_output, formats=formats, metrics=metrics, conn=conn
+    )
     metrics_path = resolved_output / "metrics.json"
-    recommendations.to_csv(rec_path, index=False)
-    metrics_path.write_text(json.dumps(metrics, indent=2))
-    logger.info("Saved recommendations to %s and metrics to %s", rec_path, metrics_path)
+    with atomic_path(metrics_path) as tmp:
+        tmp.write_text(json.dumps(metrics, indent=2))
+    logger.info(
+        "Saved recommendations (%s) and metrics to %s",
+        ", ".join(artifact.format for artifact in artifacts),
+        resolved_output,
+    )
+    return artifacts
 
 
 def run_pipeline(
@@ -194,78 +319,198 @@ def run_pipeline(
         if runtime_config.enable_observability
         else None
     )
+    owns_trace_recorder = trace_recorder is None
     trace_recorder = trace_recorder or (
-        build_trace_recorder(runtime_config.trace_path, run_id=runtime_config.run_id, enabled=runtime_config.enable_tracing)
+        build_trace_recorder(
+            runtime_config.trace_path,
+            run_id=runtime_config.run_id,
+            enabled=runtime_config.enable_tracing,
+            buffered=runtime_config.trace_buffered,
+            sample_rate=runtime_config.trace_sample_rate,
+        )
         if runtime_config.trace_path is not None
         else None
     )
     if metrics_registry is None and runtime_config.enable_metrics:
         metrics_registry = MetricRegistry()
 
-    with maybe_span(trace_recorder, "extract"):
-        with maybe_timer(metrics_registry, "extract_data"):
-            df = extract_data(data_path)
+    profiler = None
+    if runtime_config.enable_profiling:
+        profiler = StageProfiler(resolve_profile_dir(runtime_config))
+    instruments = StageInstruments(
+        metrics_registry=metrics_registry,
+        trace_recorder=trace_recorder,
+        profiler=profiler,
+        structured_logger=structured_logger,
+    )
+
+    try:
+        with maybe_span(trace_recorder, "pipeline"):
+            recommendations, metrics = _run_stages(data_path, top_k, runtime_config, instruments)
+    finally:
+        if trace_recorder is not None:
+            if owns_trace_recorder:
+                trace_recorder.close()
+            else:
+                trace_recorder.flush()
+
+    if structured_logger:
+        structured_logger.info("Pipeline complete", metrics=metrics)
+    return recommendations, metrics
+
+
+def _run_stages(
+    data_path: Path,
+    top_k: int,
+    runtime_config: PipelineRuntimeConfig,
+    instruments: StageInstruments,
+) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    """Execute each pipeline stage; spans opened here nest under the run's root span."""
+    structured_logger = instruments.structured_logger
+
+    with instruments.stage("extract", "extract_data"):
+        df = extract_data(data_path)
 
     if runtime_config.enable_quality_checks:
-        quality_config = DataQualityConfig(
-            min_rows=1,
-            required_columns=["user_id", "show_id", "timestamp", "completion_ratio"],
-            numeric_ranges={"completion_ratio": (0.0, 1.0)},
-        )
-        raw_report = run_quality_checks(df, quality_config, dataset="raw_views")
+        with instruments.stage("quality_checks"):
+            quality_config = DataQualityConfig(
+                min_rows=1,
+                required_columns=["user_id", "show_id", "timestamp", "completion_ratio"],
+                numeric_ranges={"completion_ratio": (0.0, 1.0)},
+            )
+            raw_report = run_quality_checks(df, quality_config, dataset="raw_views")
         quality_path = runtime_config.quality_report_path or (runtime_config.output_dir / "quality_report.json")
         quality_path.parent.mkdir(parents=True, exist_ok=True)
         quality_path.write_text(json.dumps(raw_report.to_dict(), indent=2))
         if structured_logger:
             structured_logger.info("Quality checks completed", passed=raw_report.passed(), path=str(quality_path))
 
-    with maybe_span(trace_recorder, "connect"):
-        with maybe_timer(metrics_registry, "connect_db"):
-            conn = database.get_connection(runtime_config.db_path)
+    with instruments.stage("connect", "connect_db"):
+        manager = database.ConnectionManager.from_runtime_config(runtime_config)
+    try:
+        return _run_warehouse_stages(df, manager, top_k, runtime_config, instruments)
+    finally:
+        manager.close()
 
-    with maybe_span(trace_recorder, "load_raw"):
-        with maybe_timer(metrics_registry, "load_raw"):
-            load_raw_data(df, conn)
 
-    with maybe_span(trace_recorder, "star_schema"):
-        with maybe_timer(metrics_registry, "build_star_schema"):
-            build_star_schema(conn)
+def _run_warehouse_stages(
+    df: pd.DataFrame,
+    manager: database.ConnectionManager,
+    top_k: int,
+    runtime_config: PipelineRuntimeConfig,
+    instruments: StageInstruments,
+) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    """Stages that run against the warehouse; ``manager`` owns the connection."""
+    structured_logger = instruments.structured_logger
+    profiler = instruments.profiler
+    conn = manager.connection
+    if profiler is not None:
+        profiler.attach_connection(conn)
 
-    with maybe_span(trace_recorder, "feature_engineering"):
-        with maybe_timer(metrics_registry, "feature_engineering"):
-            feature_engineering(conn)
+    with instruments.stage("load_raw", "load_raw"):
+        load_raw_data(df, conn)
 
-    with maybe_span(trace_recorder, "train_models"):
-        with maybe_timer(metrics_registry, "train_models"):
-            recommendations = train_models(conn, top_k)
+    with instruments.stage("star_schema", "build_star_schema"):
+        build_star_schema(conn)
+
+    if runtime_config.enable_quality_checks:
+        with instruments.stage("warehouse_quality_checks"):
+            if runtime_config.quality_mode == "incremental":
+                warehouse_report = run_incremental_quality_checks(
+                    conn,
+                    "fact_views",
+                    replace(WAREHOUSE_QUALITY_CONFIG, min_rows=0),
+                    runtime_config.quality_state_path or (runtime_config.output_dir / "quality_state.json"),
+                )
+            else:
+                warehouse_report = run_quality_checks_sql(conn, "fact_views", WAREHOUSE_QUALITY_CONFIG)
+        warehouse_quality_path = runtime_config.output_dir / "warehouse_quality_report.json"
+        warehouse_quality_path.parent.mkdir(parents=True, exist_ok=True)
+        warehouse_quality_path.write_text(json.dumps(warehouse_report.to_dict(), indent=2))
+        if structured_logger:
+            structured_logger.info(
+                "Warehouse quality checks completed",
+                passed=warehouse_report.passed(),
+                path=str(warehouse_quality_path),
+            )
+
+    with instruments.stage("feature_engineering", "feature_engineering"):
+        feature_engineering(conn)
+
+    item_masks = load_profile_item_masks(conn) if runtime_config.enable_candidate_policy else None
+    with instruments.stage("train_models", "train_models"):
+        recommendations = train_models(conn, top_k, item_masks=item_masks)
 
     database.write_dataframe(conn, recommendations, "recommendations")
 
+    if runtime_config.snapshot_dir is not None:
+        with instruments.stage("publish_snapshot"):
+            try:
+                snapshot = SnapshotStore(runtime_config.snapshot_dir).publish(
+                    RecommendationIndex.from_connection(conn), runtime_config.run_id
+                )
+            except FileExistsError:
+                # Snapshots are immutable and may be mapped by a live server, so a
+                # re-run under a fixed run_id keeps the one already published.
+                logger.warning(
+                    "Snapshot %s already published; keeping it", runtime_config.run_id
+                )
+                snapshot = None
+        if snapshot is not None and structured_logger:
+            structured_logger.info(
+                "Published serving snapshot", run_id=snapshot.run_id, path=str(snapshot.path)
+            )
+
     if runtime_config.enable_plugins:
-        registry = build_default_registry()
-        plugin_context = PluginContext(run_id=runtime_config.run_id, stage="post_recommendation")
-        recommendations = apply_plugins(recommendations, registry, plugin_context, enabled=True)
+        with instruments.stage("plugins"):
+            registry = build_default_registry(conn)
+            plugin_context = PluginContext(run_id=runtime_config.run_id, stage="post_recommendation")
+            recommendations = apply_plugins(recommendations, registry, plugin_context, enabled=True)
         if structured_logger:
             structured_logger.info("Applied plugins", plugins=registry.list_plugins())
 
     if runtime_config.enable_policy:
-        policy = build_default_policy()
-        recommendations = enforce_policy(recommendations, policy, enabled=True)
+        with instruments.stage("policy"):
+            policy = build_default_policy()
+            recommendations = enforce_policy(recommendations, policy, enabled=True)
         if structured_logger:
             structured_logger.info("Applied safety policy", rules=[rule.name for rule in policy.rules])
 
-    with maybe_span(trace_recorder, "evaluate"):
-        with maybe_timer(metrics_registry, "evaluate"):
-            metrics = evaluate_models(df, recommendations, top_k)
+    with instruments.stage("evaluate", "evaluate"):
+        metrics = evaluate_models(df, recommendations, top_k)
 
-    save_outputs(recommendations, metrics, output_dir=runtime_config.output_dir)
-    summary = build_summary(recommendations)
-    write_summary(summary, runtime_config.output_dir / "summary.json")
-    write_markdown_report(summary, metrics, runtime_config.output_dir / "pipeline_report.md")
-    run_sql_examples(conn)
+    with instruments.stage("save_outputs"):
+        save_outputs(
+            recommendations,
+            metrics,
+            output_dir=runtime_config.output_dir,
+            formats=runtime_config.output_formats,
+            conn=conn,
+        )
+        # Plugins and policy only add columns, so the warehouse table has the
+        # same rows and can be summarized without another pass over the frame.
+        summary = build_summary_sql(
+            conn, "recommendations", approximate=runtime_config.approximate_summary
+        )
+        write_summary(summary, runtime_config.output_dir / "summary.json")
 
+    with instruments.stage("rollups"):
+        refreshes = refresh_rollups(conn)
+        export_dashboard_rollups(conn, runtime_config.output_dir / "engagement_rollups.json")
     if structured_logger:
-        structured_logger.info("Pipeline complete", metrics=metrics)
+        structured_logger.info("Refreshed rollups", rollups=[refresh.to_dict() for refresh in refreshes])
+
+    with instruments.stage("sql_examples"):
+        run_sql_examples(manager, runtime_config.output_dir / "sql_results")
+
+    profiles = None
+    if profiler is not None:
+        profiles = profiler.profiles
+        profile_summary = profiler.write_summary()
+        if structured_logger:
+            structured_logger.info("Stage profiles written", path=str(profile_summary))
+    write_markdown_report(summary, metrics, runtime_config.output_dir / "pipeline_report.md", profiles=profiles)
+
     return recommendations, metrics
 
 
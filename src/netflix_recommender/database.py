@@ -1,9 +1,14 @@
 """DuckDB helper utilities for the Netflix recommender demo."""
+import threading
+import uuid
 from pathlib import Path
-from typing import Iterable, List
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
 
 import duckdb
 
+if TYPE_CHECKING:
+    from .runtime import PipelineRuntimeConfig
+
 
 def get_connection(db_path: Path) -> duckdb.DuckDBPyConnection:
     """Create a DuckDB connection pointing to the provided path."""
@@ -11,16 +16,167 @@ def get_connection(db_path: Path) -> duckdb.DuckDBPyConnection:
     return duckdb.connect(database=str(db_path))
 
 
+def configure_connection(
+    conn: duckdb.DuckDBPyConnection,
+    threads: Optional[int] = None,
+    memory_limit: Optional[str] = None,
+    temp_directory: Optional[Path] = None,
+) -> None:
+    """Apply resource settings; they are database-wide, so cursors inherit them."""
+    if threads is not None:
+        conn.execute(f"SET threads = {int(threads)}")
+    if memory_limit is not None:
+        conn.execute("SET memory_limit = ?", [str(memory_limit)])
+    if temp_directory is not None:
+        temp_directory.mkdir(parents=True, exist_ok=True)
+        conn.execute("SET temp_directory = ?", [str(temp_directory)])
+
+
+class ConnectionManager:
+    """Own one DuckDB database handle and hand out per-thread cursors.
+
+    A DuckDB connection must not be used from several threads at once, but
+    cursors created from it share the same database instance, catalog and
+    buffer pool. Each thread gets its own cursor on first use, so parallel
+    readers never reopen the file.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        threads: Optional[int] = None,
+        memory_limit: Optional[str] = None,
+        temp_directory: Optional[Path] = None,
+        read_only: bool = False,
+    ) -> None:
+        if db_path is None:
+            self._conn = duckdb.connect()
+        else:
+            if not read_only:
+                db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = duckdb.connect(database=str(db_path), read_only=read_only)
+        configure_connection(self._conn, threads, memory_limit, temp_directory)
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cursors: List[duckdb.DuckDBPyConnection] = []
+        self._closed = False
+
+    @classmethod
+    def from_runtime_config(
+        cls, runtime_config: "PipelineRuntimeConfig", read_only: bool = False
+    ) -> "ConnectionManager":
+        return cls(
+            runtime_config.db_path,
+            threads=runtime_config.duckdb_threads,
+            memory_limit=runtime_config.duckdb_memory_limit,
+            temp_directory=runtime_config.duckdb_temp_directory,
+            read_only=read_only,
+        )
+
+    @property
+    def connection(self) -> duckdb.DuckDBPyConnection:
+        """The root connection, for the thread that owns the manager."""
+        if self._closed:
+            raise RuntimeError("ConnectionManager is closed")
+        return self._conn
+
+    def cursor(self) -> duckdb.DuckDBPyConnection:
+        """Return the calling thread's cursor, creating it on first use."""
+        if self._closed:
+            raise RuntimeError("ConnectionManager is closed")
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            with self._lock:
+                cursor = self._conn.cursor()
+                self._cursors.append(cursor)
+            self._local.cursor = cursor
+        return cursor
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for cursor in self._cursors:
+                cursor.close()
+            self._cursors.clear()
+            self._conn.close()
+
+    def __enter__(self) -> "ConnectionManager":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
 def write_dataframe(
     conn: duckdb.DuckDBPyConnection, df, table_name: str, mode: str = "replace"
 ) -> None:
-    """Write a pandas DataFrame into DuckDB."""
+    """Write a pandas DataFrame into DuckDB.
+
+    Categorical string columns arrive as DuckDB enums (only the categories are
+    converted) and are stored as VARCHAR so the table schema does not depend
+    on how the frame was encoded.
+    """
     if mode not in {"replace", "append"}:
         raise ValueError("mode must be 'replace' or 'append'")
+    select = ", ".join(_column_expression(df, column) for column in df.columns)
     if mode == "replace":
-        conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM df")
+        conn.execute(f"CREATE OR REPLACE TABLE {table_name} AS SELECT {select} FROM df")
     else:
-        conn.execute(f"INSERT INTO {table_name} SELECT * FROM df")
+        conn.execute(f"INSERT INTO {table_name} SELECT {select} FROM df")
+    bump_table_versions(conn, [table_name])
+
+
+def _column_expression(df, column) -> str:
+    quoted = '"' + str(column).replace('"', '""') + '"'
+    # ``df`` is a pandas frame, so pandas is already loaded; importing it at
+    # module level would add its import time to every ``database`` import.
+    import pandas as pd
+
+    dtype = df[column].dtype
+    if isinstance(dtype, pd.CategoricalDtype) and pd.api.types.is_string_dtype(dtype.categories):
+        return f"CAST({quoted} AS VARCHAR) AS {quoted}"
+    return quoted
+
+
+TABLE_VERSIONS = "meta_table_versions"
+
+
+def bump_table_versions(conn: duckdb.DuckDBPyConnection, tables: Iterable[str]) -> None:
+    """Give ``tables`` a fresh version token so cached query results over them go stale."""
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_VERSIONS} (
+            table_name VARCHAR PRIMARY KEY, version VARCHAR NOT NULL, updated_at TIMESTAMP NOT NULL
+        )
+        """
+    )
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {TABLE_VERSIONS} VALUES (?, ?, now())",
+        [[table.lower(), uuid.uuid4().hex] for table in tables],
+    )
+
+
+def get_table_versions(conn: duckdb.DuckDBPyConnection, tables: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Current version token per table; None for tables that were never versioned."""
+    versions: Dict[str, Optional[str]] = {table.lower(): None for table in tables}
+    exists = conn.execute(
+        "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ? AND schema_name = 'main'", [TABLE_VERSIONS]
+    ).fetchone()[0]
+    if exists and versions:
+        rows = conn.execute(
+            f"SELECT table_name, version FROM {TABLE_VERSIONS} WHERE list_contains(?, table_name)",
+            [list(versions)],
+        ).fetchall()
+        versions.update(dict(rows))
+    return versions
+
+
+def split_statements(sql: str) -> List[str]:
+    """Split ``sql`` with DuckDB's parser, so semicolons in strings or comments are safe."""
+    return [statement.query.strip() for statement in duckdb.extract_statements(sql)]
 
 
 def run_queries(conn: duckdb.DuckDBPyConnection, queries: Iterable[str]) -> List:
@@ -32,7 +188,9 @@ def run_queries(conn: duckdb.DuckDBPyConnection, queries: Iterable[str]) -> List
 
 
 def run_query_file(conn: duckdb.DuckDBPyConnection, sql_file: Path) -> List:
-    """Execute queries from a SQL file split by semicolons."""
-    content = sql_file.read_text()
-    queries = [q.strip() for q in content.split(";") if q.strip()]
-    return run_queries(conn, queries)
+    """Execute every statement in a SQL file and return the fetched rows.
+
+    Prefer :class:`~.sql_runner.SqlRunner` for analytical files; it runs
+    queries concurrently and writes results to files instead of tuples.
+    """
+    return run_queries(conn, split_statements(sql_file.read_text()))
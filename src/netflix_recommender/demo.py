@@ -12,6 +12,11 @@ import pandas as pd
 
 from . import config, data_pipeline, runtime
 from .observability import MetricRegistry, configure_logging
+from .trace_analysis import (
+    analyze_trace,
+    render_analysis_markdown,
+    write_collapsed_stacks,
+)
 from .tracing import build_trace_recorder
 
 
@@ -23,6 +28,8 @@ class DemoResult:
     metrics: Dict[str, float]
     trace_path: Path
     trace_markdown_path: Path
+    trace_analysis_path: Path
+    trace_folded_path: Path
     quality_report_path: Path
     summary_path: Path
 
@@ -32,10 +39,12 @@ def run_demo(output_dir: Path) -> DemoResult:
     run_id = uuid.uuid4().hex
     trace_path = output_dir / "traces" / f"trace_{run_id}.jsonl"
     trace_markdown_path = output_dir / "traces" / f"trace_{run_id}.md"
+    trace_analysis_path = output_dir / "traces" / f"trace_{run_id}_analysis.md"
+    trace_folded_path = output_dir / "traces" / f"trace_{run_id}.folded"
     logger = configure_logging(service="netflix-demo", run_id=run_id)
     metrics_registry = MetricRegistry()
     trace_recorder = build_trace_recorder(
-        trace_path=trace_path, run_id=run_id, enabled=True
+        trace_path=trace_path, run_id=run_id, enabled=True, buffered=True
     )
 
     runtime_config = runtime.build_runtime_config(
@@ -50,6 +59,7 @@ def run_demo(output_dir: Path) -> DemoResult:
         enable_metrics=True,
         enable_quality_checks=True,
         quality_report_path=output_dir / "quality_report.json",
+        trace_buffered=True,
     )
 
     logger.info("Starting demo run", output_dir=str(output_dir))
@@ -61,6 +71,12 @@ def run_demo(output_dir: Path) -> DemoResult:
         trace_recorder=trace_recorder,
     )
     trace_recorder.export_markdown(trace_markdown_path)
+    trace_recorder.close()
+    trace_tree = analyze_trace(trace_path, run_id=run_id)
+    trace_analysis_path.write_text(
+        render_analysis_markdown(trace_tree), encoding="utf-8"
+    )
+    write_collapsed_stacks(trace_tree, trace_folded_path)
     metrics_path = output_dir / "metrics_snapshot.json"
     metrics_path.write_text(json.dumps(metrics_registry.snapshot(), indent=2))
     logger.info("Demo run complete", metrics_path=str(metrics_path))
@@ -72,6 +88,8 @@ def run_demo(output_dir: Path) -> DemoResult:
         metrics=metrics,
         trace_path=trace_path,
         trace_markdown_path=trace_markdown_path,
+        trace_analysis_path=trace_analysis_path,
+        trace_folded_path=trace_folded_path,
         quality_report_path=output_dir / "quality_report.json",
         summary_path=output_dir / "summary.json",
     )
@@ -86,6 +104,8 @@ def format_demo_summary(result: DemoResult) -> str:
         f"- Metrics: {result.metrics}",
         f"- Trace JSONL: {result.trace_path}",
         f"- Trace Markdown: {result.trace_markdown_path}",
+        f"- Trace Analysis: {result.trace_analysis_path}",
+        f"- Flame Graph Stacks: {result.trace_folded_path}",
         f"- Quality Report: {result.quality_report_path}",
         f"- Summary JSON: {result.summary_path}",
     ]
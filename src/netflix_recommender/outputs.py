@@ -0,0 +1,286 @@
+"""Bulk writers for recommendation outputs.
+
+CSV is written by DuckDB ``COPY`` and Parquet by the relation's
+``write_parquet``. Arrow IPC streams DuckDB record batches through pyarrow's
+writer, since DuckDB has no core Arrow copy function. The dashboard JSON
+shards are fetched in batches and written from Python.
+
+Each output goes to a hidden sibling path first and is renamed into place
+only after the write succeeded, so readers never see a partial file. The
+shard directory is the exception: replacing an existing directory takes two
+renames (see :func:`atomic_path`). Formats are written concurrently, each on
+its own DuckDB cursor.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+)
+
+if TYPE_CHECKING:
+    # Imported lazily so runtime config validation does not load DuckDB/pandas.
+    import duckdb
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FORMATS = ("csv", "parquet", "arrow", "json_shards")
+OUTPUT_FILENAMES = {
+    "csv": "recommendations.csv",
+    "parquet": "recommendations.parquet",
+    "arrow": "recommendations.arrow",
+    "json_shards": "dashboard",
+}
+_RELATION = "output_recommendations"
+
+
+@dataclass
+class OutputArtifact:
+    format: str
+    path: Path
+    rows: int
+    files: int = 1
+
+
+def validate_output_formats(formats: Sequence[str]) -> tuple[str, ...]:
+    unknown = sorted(set(formats) - set(OUTPUT_FORMATS))
+    if unknown:
+        raise ValueError(
+            f"Unknown output formats {unknown}; expected any of {list(OUTPUT_FORMATS)}"
+        )
+    return tuple(dict.fromkeys(formats))
+
+
+def _sql_path(path: Path) -> str:
+    return "'" + str(path).replace("'", "''") + "'"
+
+
+@contextmanager
+def atomic_path(path: Path, directory: bool = False) -> Iterator[Path]:
+    """Yield a temporary sibling of ``path`` and rename it into place on success.
+
+    A file, or a directory whose target does not exist yet, appears in one
+    rename. A directory replacing an existing one is not atomic. The old
+    directory is renamed aside before the new one moves in, and a reader
+    between the two renames finds ``path`` missing.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp-{uuid.uuid4().hex[:8]}")
+    if directory:
+        tmp.mkdir()
+    try:
+        yield tmp
+    except BaseException:
+        if tmp.is_dir():
+            shutil.rmtree(tmp, ignore_errors=True)
+        elif tmp.exists():
+            tmp.unlink()
+        raise
+    if directory and path.exists():
+        # A directory cannot replace a non-empty one; swap the old one aside.
+        retired = path.with_name(f".{path.name}.old-{uuid.uuid4().hex[:8]}")
+        os.replace(path, retired)
+        os.replace(tmp, path)
+        shutil.rmtree(retired, ignore_errors=True)
+    else:
+        os.replace(tmp, path)
+
+
+def _row_count(cursor: duckdb.DuckDBPyConnection) -> int:
+    return int(cursor.execute(f"SELECT COUNT(*) FROM {_RELATION}").fetchone()[0])
+
+
+def write_csv(cursor: duckdb.DuckDBPyConnection, path: Path) -> OutputArtifact:
+    with atomic_path(path) as tmp:
+        cursor.execute(
+            f"COPY (SELECT * FROM {_RELATION}) TO {_sql_path(tmp)} (FORMAT csv, HEADER)"
+        )
+    return OutputArtifact("csv", path, _row_count(cursor))
+
+
+def copy_query_to_parquet(
+    cursor: duckdb.DuckDBPyConnection,
+    query: str,
+    path: Path,
+    row_group_size: int = 122_880,
+) -> int:
+    """Stream ``query`` into a zstd Parquet file at ``path``; returns the row count.
+
+    ``query`` may carry a trailing semicolon or comments, as statements split
+    out of a SQL file do.
+    """
+    with atomic_path(path) as tmp:
+        cursor.sql(query).write_parquet(
+            str(tmp), compression="zstd", row_group_size=int(row_group_size)
+        )
+    # fetchall() drains the result; with fetchone() the cursor's transaction
+    # stays open and a later cursor.sql() would not see newer tables.
+    rows = cursor.execute(
+        f"SELECT SUM(num_rows) FROM parquet_file_metadata({_sql_path(path)})"
+    ).fetchall()[0][0]
+    return int(rows or 0)
+
+
+def stream_query_to_arrow(
+    cursor: duckdb.DuckDBPyConnection,
+    query: str,
+    path: Path,
+    batch_rows: int = 1_000_000,
+) -> int:
+    """Stream ``query`` into an Arrow IPC (Feather v2) file; requires pyarrow."""
+    import importlib.util
+
+    if importlib.util.find_spec("pyarrow") is None:
+        raise RuntimeError("The 'arrow' output format requires pyarrow to be installed")
+    from pyarrow import ipc
+
+    rows = 0
+    reader = cursor.execute(query).fetch_record_batch(batch_rows)
+    options = ipc.IpcWriteOptions(compression="zstd")
+    with atomic_path(path) as tmp:
+        with ipc.new_file(str(tmp), reader.schema, options=options) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+    return rows
+
+
+def write_parquet(
+    cursor: duckdb.DuckDBPyConnection, path: Path, row_group_size: int = 122_880
+) -> OutputArtifact:
+    rows = copy_query_to_parquet(
+        cursor, f"SELECT * FROM {_RELATION}", path, row_group_size
+    )
+    return OutputArtifact("parquet", path, rows)
+
+
+def write_arrow(
+    cursor: duckdb.DuckDBPyConnection, path: Path, batch_rows: int = 1_000_000
+) -> OutputArtifact:
+    """Write an Arrow IPC (Feather v2) file; requires the optional pyarrow package."""
+    rows = stream_query_to_arrow(cursor, f"SELECT * FROM {_RELATION}", path, batch_rows)
+    return OutputArtifact("arrow", path, rows)
+
+
+def write_json_shards(
+    cursor: duckdb.DuckDBPyConnection,
+    path: Path,
+    metrics: Optional[Dict[str, float]] = None,
+    shards: int = 16,
+    fetch_rows: int = 10_000,
+) -> OutputArtifact:
+    """Export ``{user_id, model, titles}`` records for the dashboard.
+
+    Users are range-partitioned into ``shards`` files by sorted ``user_id``;
+    ``index.json`` lists each shard's first and last user so a client can
+    find a user's file with a binary search and fetch only that shard.
+    """
+    result = cursor.execute(f"""
+        WITH users AS (
+            SELECT user_id, NTILE({int(shards)}) OVER (ORDER BY user_id) - 1 AS shard
+            FROM (SELECT DISTINCT user_id FROM {_RELATION})
+        )
+        SELECT u.shard, r.user_id, r.model, list(r.title_id ORDER BY r.rank) AS titles
+        FROM {_RELATION} r JOIN users u USING (user_id)
+        GROUP BY ALL
+        ORDER BY u.shard, r.user_id, r.model
+        """)
+    entries: List[Dict[str, Any]] = []
+    total = 0
+    with atomic_path(path, directory=True) as tmp:
+        current: Optional[int] = None
+        records: List[Dict[str, Any]] = []
+
+        def flush() -> None:
+            if current is None or not records:
+                return
+            name = f"shard-{current:03d}.json"
+            (tmp / name).write_text(
+                json.dumps({"recommendations": records}, separators=(",", ":")),
+                encoding="utf-8",
+            )
+            entries.append(
+                {
+                    "file": name,
+                    "first_user": records[0]["user_id"],
+                    "last_user": records[-1]["user_id"],
+                    "records": len(records),
+                }
+            )
+
+        while batch := result.fetchmany(fetch_rows):
+            for shard, user_id, model, titles in batch:
+                if shard != current:
+                    flush()
+                    current, records = shard, []
+                records.append({"user_id": user_id, "model": model, "titles": titles})
+                total += 1
+        flush()
+        (tmp / "index.json").write_text(
+            json.dumps({"metrics": metrics or {}, "shards": entries}, indent=2),
+            encoding="utf-8",
+        )
+    return OutputArtifact("json_shards", path, total, files=len(entries) + 1)
+
+
+def write_outputs(
+    recommendations: pd.DataFrame,
+    output_dir: Path,
+    formats: Sequence[str] = ("csv",),
+    metrics: Optional[Dict[str, float]] = None,
+    conn: Optional[duckdb.DuckDBPyConnection] = None,
+    shards: int = 16,
+) -> List[OutputArtifact]:
+    """Write ``recommendations`` in every requested format, in parallel."""
+    formats = validate_output_formats(formats)
+    owned = conn is None
+    if conn is None:
+        import duckdb
+
+        conn = duckdb.connect()
+    writers: Dict[str, Callable[[duckdb.DuckDBPyConnection, Path], OutputArtifact]] = {
+        "csv": write_csv,
+        "parquet": write_parquet,
+        "arrow": write_arrow,
+        "json_shards": lambda cursor, path: write_json_shards(
+            cursor, path, metrics=metrics, shards=shards
+        ),
+    }
+
+    def run(fmt: str) -> OutputArtifact:
+        # Registered frames are per connection, so each cursor registers its own view.
+        with conn.cursor() as cursor:
+            cursor.register(_RELATION, recommendations)
+            return writers[fmt](cursor, output_dir / OUTPUT_FILENAMES[fmt])
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(formats))) as pool:
+            artifacts = list(pool.map(run, formats))
+    finally:
+        if owned:
+            conn.close()
+    for artifact in artifacts:
+        logger.info(
+            "Wrote %s output to %s (%d rows)",
+            artifact.format,
+            artifact.path,
+            artifact.rows,
+        )
+    return artifacts
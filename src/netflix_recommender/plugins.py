@@ -1,12 +1,37 @@
-"""Plugin architecture for extending the recommendation pipeline."""
+"""Plugin architecture for extending the recommendation pipeline.
+
+Plugins that implement ``compute`` declare the columns they read and write and
+return only the new columns. Columns in ``reads`` must be present before the
+plugin runs; ``optional_reads`` are used when present, with a fallback
+otherwise. The registry runs plugins in one pass over a single shallow copy of
+the recommendations, so a chain of plugins adds only its new columns to peak
+memory instead of one full frame copy per plugin.
+"""
 
 from __future__ import annotations
 
+import uuid
 from dataclasses import dataclass, field
-from typing import Dict, Iterable, List, Protocol
-
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Protocol,
+    Tuple,
+)
+
+import numpy as np
 import pandas as pd
 
+if TYPE_CHECKING:
+    import duckdb
+
+ColumnValues = Any
+
 
 class PipelinePlugin(Protocol):
     """Protocol for pipeline plugins."""
@@ -18,6 +43,35 @@ class PipelinePlugin(Protocol):
     ) -> pd.DataFrame: ...
 
 
+class ColumnPlugin(PipelinePlugin, Protocol):
+    """Plugin that appends declared columns without copying its input."""
+
+    reads: Tuple[str, ...]
+    writes: Tuple[str, ...]
+
+    def compute(
+        self, recommendations: pd.DataFrame, context: Dict[str, str]
+    ) -> Mapping[str, ColumnValues]: ...
+
+
+def assign_columns(
+    recommendations: pd.DataFrame, columns: Mapping[str, ColumnValues]
+) -> pd.DataFrame:
+    """Return a shallow copy of ``recommendations`` with ``columns`` added.
+
+    Existing columns are shared with the input rather than copied.
+    """
+    output = recommendations.copy(deep=False)
+    for name, values in columns.items():
+        output[name] = values
+    return output
+
+
+def constant_column(value: str, length: int) -> pd.Categorical:
+    """A repeated string stored as one category plus one byte per row."""
+    return pd.Categorical.from_codes(np.zeros(length, dtype=np.int8), [value])
+
+
 @dataclass
 class PluginRegistry:
     """In-memory registry for pipeline plugins."""
@@ -35,9 +89,31 @@ class PluginRegistry:
     def apply_all(
         self, recommendations: pd.DataFrame, context: Dict[str, str]
     ) -> pd.DataFrame:
-        output = recommendations.copy()
+        output = recommendations.copy(deep=False)
         for plugin in self.plugins.values():
-            output = plugin.apply(output, context)
+            compute = getattr(plugin, "compute", None)
+            if compute is None:
+                output = plugin.apply(output, context)
+                continue
+            missing = [
+                column
+                for column in getattr(plugin, "reads", ())
+                if column not in output.columns
+            ]
+            if missing:
+                raise ValueError(
+                    f"Plugin {plugin.name} reads missing columns: "
+                    f"{', '.join(missing)}"
+                )
+            columns = compute(output, context)
+            undeclared = set(columns) - set(getattr(plugin, "writes", ()))
+            if undeclared:
+                raise ValueError(
+                    f"Plugin {plugin.name} wrote undeclared columns: "
+                    f"{', '.join(sorted(undeclared))}"
+                )
+            for name, values in columns.items():
+                output[name] = values
         return output
 
 
@@ -52,51 +128,137 @@ class PluginContext:
         return {"run_id": self.run_id, "stage": self.stage}
 
 
+class WarehouseEnrichmentPlugin:
+    """Join title popularity and user engagement features inside DuckDB.
+
+    Only the key columns and a row position are handed to DuckDB; the join
+    against ``feat_title_popularity`` and ``feat_user_engagement`` runs in the
+    warehouse and the feature columns come back as NumPy arrays in row order.
+    ``completion_ratio`` is the user's average completion so that downstream
+    segmenting describes the user being recommended to.
+    """
+
+    name = "warehouse_enrichment"
+    reads = ("user_id", "title_id")
+    writes = (
+        "view_events",
+        "title_avg_completion",
+        "completion_ratio",
+        "total_watch_time",
+    )
+
+    def __init__(self, conn: "duckdb.DuckDBPyConnection") -> None:
+        self.conn = conn
+
+    def compute(
+        self, recommendations: pd.DataFrame, context: Dict[str, str]
+    ) -> Dict[str, ColumnValues]:
+        keys = pd.DataFrame(
+            {
+                "pos": np.arange(len(recommendations), dtype=np.int64),
+                "user_id": recommendations["user_id"].to_numpy(),
+                "title_id": recommendations["title_id"].to_numpy(),
+            }
+        )
+        view_name = f"_plugin_keys_{uuid.uuid4().hex}"
+        self.conn.register(view_name, keys)
+        try:
+            result = self.conn.execute(f"""
+                SELECT
+                    COALESCE(t.view_events, 0) AS view_events,
+                    t.avg_completion AS title_avg_completion,
+                    u.avg_completion AS completion_ratio,
+                    u.total_watch_time
+                FROM {view_name} AS k
+                LEFT JOIN feat_title_popularity AS t ON t.title_id = k.title_id
+                LEFT JOIN feat_user_engagement AS u ON u.user_id = k.user_id
+                ORDER BY k.pos
+                """).fetchnumpy()
+        finally:
+            self.conn.unregister(view_name)
+        return {column: _filled(result[column]) for column in self.writes}
+
+    def apply(
+        self, recommendations: pd.DataFrame, context: Dict[str, str]
+    ) -> pd.DataFrame:
+        return assign_columns(recommendations, self.compute(recommendations, context))
+
+
+def _filled(values: np.ndarray) -> np.ndarray:
+    """Turn DuckDB NULLs (masked entries) into NaN."""
+    if isinstance(values, np.ma.MaskedArray):
+        return values.astype(np.float64).filled(np.nan)
+    return values
+
+
 class EngagementSegmentPlugin:
     """Annotate recommendations with engagement segments."""
 
     name = "engagement_segment"
+    reads = ()
+    optional_reads = ("completion_ratio",)
+    writes = ("engagement_segment", "plugin_context")
 
-    def apply(
+    def compute(
         self, recommendations: pd.DataFrame, context: Dict[str, str]
-    ) -> pd.DataFrame:
-        output = recommendations.copy()
-        if "completion_ratio" in output.columns:
-            output["engagement_segment"] = pd.cut(
-                output["completion_ratio"],
+    ) -> Dict[str, ColumnValues]:
+        rows = len(recommendations)
+        if "completion_ratio" in recommendations.columns:
+            segment = pd.cut(
+                recommendations["completion_ratio"],
                 bins=[0.0, 0.4, 0.7, 1.0],
                 labels=["low", "medium", "high"],
                 include_lowest=True,
             )
         else:
-            output["engagement_segment"] = "unknown"
-        output["plugin_context"] = (
+            segment = constant_column("unknown", rows)
+        plugin_context = (
             f"{context.get('stage', 'pipeline')}:{context.get('run_id', '')}"
         )
-        return output
+        return {
+            "engagement_segment": segment,
+            "plugin_context": constant_column(plugin_context, rows),
+        }
+
+    def apply(
+        self, recommendations: pd.DataFrame, context: Dict[str, str]
+    ) -> pd.DataFrame:
+        return assign_columns(recommendations, self.compute(recommendations, context))
 
 
 class ColdStartBoostPlugin:
     """Boost cold-start titles by tagging them for follow-up analysis."""
 
     name = "cold_start_boost"
+    reads = ()
+    optional_reads = ("view_events",)
+    writes = ("cold_start_flag",)
 
     def __init__(self, threshold: int = 2) -> None:
         self.threshold = threshold
 
+    def compute(
+        self, recommendations: pd.DataFrame, context: Dict[str, str]
+    ) -> Dict[str, ColumnValues]:
+        if "view_events" in recommendations.columns:
+            flag = recommendations["view_events"].to_numpy() <= self.threshold
+        else:
+            flag = np.zeros(len(recommendations), dtype=bool)
+        return {"cold_start_flag": flag}
+
     def apply(
         self, recommendations: pd.DataFrame, context: Dict[str, str]
     ) -> pd.DataFrame:
-        output = recommendations.copy()
-        if "view_events" in output.columns:
-            output["cold_start_flag"] = output["view_events"] <= self.threshold
-        else:
-            output["cold_start_flag"] = False
-        return output
+        return assign_columns(recommendations, self.compute(recommendations, context))
 
 
-def build_default_registry() -> PluginRegistry:
+def build_default_registry(
+    conn: Optional["duckdb.DuckDBPyConnection"] = None,
+) -> PluginRegistry:
+    """Default plugins; with a connection, warehouse enrichment runs first."""
     registry = PluginRegistry()
+    if conn is not None:
+        registry.register(WarehouseEnrichmentPlugin(conn))
     registry.register(EngagementSegmentPlugin())
     registry.register(ColdStartBoostPlugin())
     return registry
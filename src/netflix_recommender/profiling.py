@@ -0,0 +1,267 @@
+"""Opt-in CPU and memory profiling for pipeline stages.
+
+Each profiled stage records wall and CPU time, a cProfile dump, Python
+allocation peak/delta via ``tracemalloc``, process RSS and DuckDB buffer
+memory. Profiling is disabled by default because cProfile and tracemalloc
+both slow the interpreter down noticeably.
+
+:func:`profile_import` measures interpreter startup instead: it imports a
+module in a fresh ``python -X importtime`` process and reports the total and
+the heaviest packages it pulled in. ``python -m netflix_recommender.profiling``
+runs it for the CLI and worker entry points.
+"""
+
+from __future__ import annotations
+
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+IMPORT_TARGETS = (
+    "netflix_recommender",
+    "netflix_recommender.runtime",
+    "netflix_recommender.serving",
+    "netflix_recommender.snapshots",
+    "netflix_recommender.data_pipeline",
+)
+_IMPORT_MARKER = "-- importing --\n"
+
+
+@dataclass
+class StageProfile:
+    stage: str
+    wall_ms: float
+    cpu_ms: float
+    py_alloc_peak_bytes: int
+    py_alloc_delta_bytes: int
+    rss_before_bytes: Optional[int]
+    rss_after_bytes: Optional[int]
+    duckdb_memory_bytes: Optional[int]
+    profile_path: Optional[str] = None
+    top_functions: List[str] = field(default_factory=list)
+
+    @property
+    def io_wait_ms(self) -> float:
+        """Wall time not spent on CPU in this process (I/O, locks, native threads)."""
+        return max(0.0, self.wall_ms - self.cpu_ms)
+
+    def to_dict(self) -> Dict[str, Any]:
+        payload = dict(self.__dict__)
+        payload["io_wait_ms"] = self.io_wait_ms
+        return payload
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Return the resident set size of this process, if the platform exposes it."""
+    statm = Path("/proc/self/statm")
+    if statm.exists():
+        pages = int(statm.read_text().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is the peak rather than the current RSS on platforms without procfs.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def duckdb_memory_bytes(conn: Any) -> Optional[int]:
+    """Return memory held by DuckDB's buffer manager for ``conn``."""
+    if conn is None:
+        return None
+    import duckdb
+
+    try:
+        row = conn.execute(
+            "SELECT COALESCE(SUM(memory_usage_bytes), 0) FROM duckdb_memory()"
+        ).fetchone()
+    except duckdb.Error:
+        return None
+    return int(row[0]) if row else None
+
+
+class StageProfiler:
+    """Collects a :class:`StageProfile` per stage into ``output_dir``."""
+
+    def __init__(self, output_dir: Path, top_n: int = 10) -> None:
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.profiles: List[StageProfile] = []
+        self.connection: Any = None
+        self._active = False
+
+    def attach_connection(self, conn: Any) -> None:
+        self.connection = conn
+
+    @contextmanager
+    def profile(self, stage: str) -> Iterator[None]:
+        # cProfile and tracemalloc peaks are process-wide; nested stages are
+        # folded into the outermost one.
+        if self._active:
+            yield
+            return
+        self._active = True
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        alloc_before, _ = tracemalloc.get_traced_memory()
+        rss_before = current_rss_bytes()
+        profiler = cProfile.Profile()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            cpu_ms = (time.process_time() - cpu_start) * 1000
+            wall_ms = (time.perf_counter() - wall_start) * 1000
+            alloc_after, alloc_peak = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+            self._active = False
+            self.profiles.append(
+                StageProfile(
+                    stage=stage,
+                    wall_ms=wall_ms,
+                    cpu_ms=cpu_ms,
+                    py_alloc_peak_bytes=alloc_peak - alloc_before,
+                    py_alloc_delta_bytes=alloc_after - alloc_before,
+                    rss_before_bytes=rss_before,
+                    rss_after_bytes=current_rss_bytes(),
+                    duckdb_memory_bytes=duckdb_memory_bytes(self.connection),
+                    profile_path=str(self._dump(stage, profiler)),
+                    top_functions=self._top_functions(profiler),
+                )
+            )
+
+    def _dump(self, stage: str, profiler: cProfile.Profile) -> Path:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        path = self.output_dir / f"{stage}.prof"
+        profiler.dump_stats(str(path))
+        return path
+
+    def _top_functions(self, profiler: cProfile.Profile) -> List[str]:
+        stats = pstats.Stats(profiler)
+        ranked = sorted(
+            stats.stats.items(),  # type: ignore[attr-defined]
+            key=lambda item: item[1][3],
+            reverse=True,
+        )
+        lines = []
+        for (filename, lineno, func), (_, _, _, cumulative, _) in ranked[: self.top_n]:
+            lines.append(
+                f"{Path(filename).name}:{lineno}({func}) {cumulative * 1000:.1f}ms"
+            )
+        return lines
+
+    def write_summary(self, path: Optional[Path] = None) -> Path:
+        target = path or (self.output_dir / "profiles.json")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(
+            json.dumps([profile.to_dict() for profile in self.profiles], indent=2),
+            encoding="utf-8",
+        )
+        return target
+
+
+@dataclass
+class ImportProfile:
+    module: str
+    total_ms: float
+    imported: List[str] = field(default_factory=list)
+    heaviest: List[Tuple[str, float]] = field(default_factory=list)
+    error: Optional[str] = None
+
+    def loaded(self, package: str) -> bool:
+        """Whether importing ``module`` also imported ``package``."""
+        return any(
+            name == package or name.startswith(package + ".") for name in self.imported
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "module": self.module,
+            "total_ms": self.total_ms,
+            "modules_imported": len(self.imported),
+            "heaviest": [list(item) for item in self.heaviest],
+            "error": self.error,
+        }
+
+
+def profile_import(module: str, top_n: int = 10) -> ImportProfile:
+    """Import ``module`` in a fresh interpreter under ``-X importtime``.
+
+    The child gets this process's ``sys.path``, so it resolves the same
+    modules. ``heaviest`` lists top-level packages by cumulative time.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, sys.path)))
+    # Interpreter startup imports (site, encodings, ...) come before the marker.
+    code = f"import sys; sys.stderr.write({_IMPORT_MARKER!r}); import {module}"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    _, _, timings = result.stderr.partition(_IMPORT_MARKER)
+    imported: List[str] = []
+    cumulative: Dict[str, float] = {}
+    total_ms = 0.0
+    for line in timings.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, total_us, name = line[len("import time:") :].split("|")
+        if not total_us.strip().isdigit():
+            continue  # the column header
+        name = name.strip()
+        ms = int(total_us) / 1000
+        imported.append(name)
+        if name == module:
+            total_ms = ms
+        elif "." not in name:
+            cumulative[name] = max(cumulative.get(name, 0.0), ms)
+    heaviest = sorted(cumulative.items(), key=lambda item: item[1], reverse=True)
+    error = None
+    if result.returncode != 0:
+        error = (result.stderr.strip().splitlines() or ["import failed"])[-1]
+    return ImportProfile(module, total_ms, imported, heaviest[:top_n], error)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Measure cold import time of package entry points."
+    )
+    parser.add_argument("modules", nargs="*", default=list(IMPORT_TARGETS))
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print JSON instead")
+    args = parser.parse_args(argv)
+
+    profiles = [profile_import(module, top_n=args.top) for module in args.modules]
+    if args.json:
+        print(json.dumps([profile.to_dict() for profile in profiles], indent=2))
+    else:
+        for profile in profiles:
+            if profile.error:
+                print(f"{profile.module:<36} failed: {profile.error}")
+                continue
+            heaviest = ", ".join(f"{name} {ms:.0f}ms" for name, ms in profile.heaviest)
+            print(f"{profile.module:<36} {profile.total_ms:8.1f} ms  ({heaviest})")
+    return 1 if any(profile.error for profile in profiles) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,10 +1,18 @@
-"""Data quality checks for the pipeline."""
+"""Data quality checks for the pipeline.
+
+``run_quality_checks_sql`` compiles every configured check into a single
+DuckDB aggregate query over a table, so validating a large warehouse table is
+one scan. ``run_quality_checks`` routes in-memory frames through the same
+engine; the ``check_*`` helpers remain for ad-hoc pandas use.
+"""
 
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Dict, Iterable, List
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
 
+import duckdb
 import pandas as pd
 
 
@@ -36,6 +44,13 @@ class DataQualityConfig:
     min_rows: int = 1
     required_columns: Iterable[str] = field(default_factory=list)
     numeric_ranges: Dict[str, tuple[float, float]] = field(default_factory=dict)
+    not_null_columns: Iterable[str] = field(default_factory=list)
+    unique_columns: Iterable[str] = field(default_factory=list)
+    # column -> (referenced table, referenced column)
+    foreign_keys: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+    freshness_column: Optional[str] = None
+    max_staleness: Optional[timedelta] = None
+    reference_time: Optional[datetime] = None
 
 
 def check_min_rows(df: pd.DataFrame, min_rows: int) -> QualityCheckResult:
@@ -86,10 +101,207 @@ def check_numeric_ranges(
 def run_quality_checks(
     df: pd.DataFrame, config: DataQualityConfig, dataset: str
 ) -> QualityReport:
+    """Run all checks on an in-memory frame in one scan via DuckDB."""
+    if len(df.columns) == 0:
+        # DuckDB cannot register a frame without columns.
+        return _columnless_report(df, config, dataset)
+    conn = duckdb.connect()
+    try:
+        conn.register("quality_input", df)
+        return run_quality_checks_sql(conn, "quality_input", config, dataset=dataset)
+    finally:
+        conn.close()
+
+
+def _columnless_report(
+    df: pd.DataFrame, config: DataQualityConfig, dataset: str
+) -> QualityReport:
+    """Report for a frame without columns: every column check fails."""
     report = QualityReport(dataset=dataset)
     report.checks.append(check_min_rows(df, config.min_rows))
     if config.required_columns:
         report.checks.append(check_required_columns(df, config.required_columns))
-    if config.numeric_ranges:
-        report.checks.extend(check_numeric_ranges(df, config.numeric_ranges))
+    report.checks.extend(check_numeric_ranges(df, config.numeric_ranges))
+    names = [f"not_null:{column}" for column in config.not_null_columns]
+    names += [f"unique:{column}" for column in config.unique_columns]
+    names += [
+        f"foreign_key:{column}->{ref_table}.{ref_column}"
+        for column, (ref_table, ref_column) in config.foreign_keys.items()
+    ]
+    if config.freshness_column is not None and config.max_staleness is not None:
+        names.append(f"freshness:{config.freshness_column}")
+    report.checks.extend(
+        QualityCheckResult(name, False, "column missing") for name in names
+    )
+    return report
+
+
+def quote_identifier(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def run_quality_checks_sql(
+    conn: duckdb.DuckDBPyConnection,
+    table: str,
+    config: DataQualityConfig,
+    dataset: Optional[str] = None,
+) -> QualityReport:
+    """Evaluate all checks for ``table`` with one aggregate query.
+
+    Missing columns are detected from the catalog; every other check becomes
+    one aggregate expression. Foreign keys are resolved with left joins
+    against the distinct referenced keys, which never multiplies rows.
+    """
+    report = QualityReport(dataset=dataset or table)
+    columns = {row[0] for row in conn.execute(f"DESCRIBE {table}").fetchall()}
+
+    selects = ["COUNT(*)"]
+    params: List[object] = []
+    joins: List[str] = []
+    evaluators = []
+
+    def add(expression: str, *values: object) -> int:
+        selects.append(expression)
+        params.extend(values)
+        return len(selects) - 1
+
+    for column, (low, high) in config.numeric_ranges.items():
+        name = f"range:{column}"
+        if column not in columns:
+            evaluators.append(
+                lambda row, n=name: QualityCheckResult(n, False, "column missing")
+            )
+            continue
+        quoted = quote_identifier(column)
+        present = add(f"COUNT(t.{quoted})")
+        # Bound as parameters so open bounds such as float("inf") work.
+        outside = add(
+            f"COUNT(*) FILTER (WHERE t.{quoted} < ? OR t.{quoted} > ?)",
+            float(low),
+            float(high),
+        )
+        evaluators.append(
+            lambda row, n=name, p=present, o=outside: _range_result(n, row[p], row[o])
+        )
+
+    for column in config.not_null_columns:
+        name = f"not_null:{column}"
+        if column not in columns:
+            evaluators.append(
+                lambda row, n=name: QualityCheckResult(n, False, "column missing")
+            )
+            continue
+        nulls = add(f"COUNT(*) FILTER (WHERE t.{quote_identifier(column)} IS NULL)")
+        evaluators.append(
+            lambda row, n=name, i=nulls: QualityCheckResult(
+                n, row[i] == 0, f"nulls={row[i]}"
+            )
+        )
+
+    for column in config.unique_columns:
+        name = f"unique:{column}"
+        if column not in columns:
+            evaluators.append(
+                lambda row, n=name: QualityCheckResult(n, False, "column missing")
+            )
+            continue
+        quoted = quote_identifier(column)
+        duplicates = add(f"COUNT(t.{quoted}) - COUNT(DISTINCT t.{quoted})")
+        evaluators.append(
+            lambda row, n=name, i=duplicates: QualityCheckResult(
+                n, row[i] == 0, f"duplicates={row[i]}"
+            )
+        )
+
+    for index, (column, (ref_table, ref_column)) in enumerate(
+        config.foreign_keys.items()
+    ):
+        name = f"foreign_key:{column}->{ref_table}.{ref_column}"
+        if column not in columns:
+            evaluators.append(
+                lambda row, n=name: QualityCheckResult(n, False, "column missing")
+            )
+            continue
+        alias = f"fk{index}"
+        joins.append(
+            f"LEFT JOIN (SELECT DISTINCT {quote_identifier(ref_column)} AS key FROM {ref_table}) AS {alias} "
+            f"ON {alias}.key = t.{quote_identifier(column)}"
+        )
+        orphans = add(
+            f"COUNT(*) FILTER (WHERE t.{quote_identifier(column)} IS NOT NULL AND {alias}.key IS NULL)"
+        )
+        evaluators.append(
+            lambda row, n=name, i=orphans: QualityCheckResult(
+                n, row[i] == 0, f"orphans={row[i]}"
+            )
+        )
+
+    if config.freshness_column is not None and config.max_staleness is not None:
+        name = f"freshness:{config.freshness_column}"
+        if config.freshness_column not in columns:
+            evaluators.append(
+                lambda row, n=name: QualityCheckResult(n, False, "column missing")
+            )
+        else:
+            # Staleness is computed in DuckDB, which reconciles TIMESTAMP and
+            # TIMESTAMPTZ columns with a naive or aware reference time.
+            quoted = quote_identifier(config.freshness_column)
+            latest = add(f"CAST(MAX(t.{quoted}) AS VARCHAR)")
+            if config.reference_time is None:
+                staleness = add(f"now() - MAX(t.{quoted})")
+            else:
+                staleness = add(f"? - MAX(t.{quoted})", config.reference_time)
+            evaluators.append(
+                lambda row, n=name, i=latest, s=staleness: _freshness_result(
+                    n, row[i], row[s], config.max_staleness
+                )
+            )
+
+    query = f"SELECT {', '.join(selects)} FROM {table} AS t {' '.join(joins)}"
+    row = conn.execute(query, params).fetchone()
+    row_count = row[0]
+    if row_count >= config.min_rows:
+        report.checks.append(
+            QualityCheckResult("min_rows", True, f"row_count={row_count}")
+        )
+    else:
+        report.checks.append(
+            QualityCheckResult(
+                "min_rows", False, f"row_count={row_count} < {config.min_rows}"
+            )
+        )
+    if config.required_columns:
+        missing = [
+            column for column in config.required_columns if column not in columns
+        ]
+        if missing:
+            report.checks.append(
+                QualityCheckResult(
+                    "required_columns", False, f"missing: {', '.join(missing)}"
+                )
+            )
+        else:
+            report.checks.append(
+                QualityCheckResult("required_columns", True, "all columns present")
+            )
+    report.checks.extend(evaluate(row) for evaluate in evaluators)
     return report
+
+
+def _range_result(name: str, present: int, outside: int) -> QualityCheckResult:
+    if present == 0:
+        return QualityCheckResult(name, False, "no values")
+    if outside == 0:
+        return QualityCheckResult(name, True, "within range")
+    return QualityCheckResult(name, False, f"out_of_bounds={outside}")
+
+
+def _freshness_result(
+    name: str,
+    latest: Optional[str],
+    staleness: Optional[timedelta],
+    max_staleness: timedelta,
+) -> QualityCheckResult:
+    if latest is None or staleness is None:
+        return QualityCheckResult(name, False, "no values")
+    return QualityCheckResult(name, staleness <= max_staleness, f"latest={latest}")
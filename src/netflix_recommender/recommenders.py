@@ -1,72 +1,234 @@
-"""Baseline recommender implementations."""
+"""Baseline recommender implementations.
+
+Interactions come out of DuckDB through ``fetchnumpy`` with user and title
+ids already dictionary-encoded as the star schema's int32 surrogate keys, so
+scoring works on contiguous integer and float arrays rather than object-dtype
+string frames. Results are returned with categorical id columns that share
+the interaction vocabulary; DuckDB reads those as enums, so writing them back
+only converts the vocabulary, not every row.
+"""
 from __future__ import annotations
 
 import logging
-from typing import List
+from dataclasses import dataclass
+from typing import List, Optional
 
 import duckdb
 import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+
+from .batching import normalize_rows
+from .safety import ProfileItemMasks
+from .tracing import child_span
 
 logger = logging.getLogger(__name__)
 
+OUTPUT_COLUMNS = ["user_id", "title_id", "rank", "model"]
+
+
+@dataclass
+class Interactions:
+    """Viewing events with ids encoded as int32 codes into sorted vocabularies."""
+
+    user_ids: np.ndarray
+    title_ids: np.ndarray
+    user_codes: np.ndarray
+    title_codes: np.ndarray
+    values: np.ndarray
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            array.nbytes
+            for array in (self.user_codes, self.title_codes, self.values)
+        )
+
+    def dense_matrix(self) -> np.ndarray:
+        """Users x titles matrix of mean values; missing and NULL values are 0.
+
+        Equivalent to ``pivot_table(aggfunc="mean", fill_value=0)`` without
+        the all-NULL rows and columns dropped; see :meth:`active`.
+        """
+        shape = (len(self.user_ids), len(self.title_ids))
+        valid = ~np.isnan(self.values)
+        flat = (
+            self.user_codes[valid].astype(np.int64) * shape[1]
+            + self.title_codes[valid]
+        )
+        size = shape[0] * shape[1]
+        sums = np.bincount(flat, weights=self.values[valid], minlength=size)
+        counts = np.bincount(flat, minlength=size)
+        matrix = np.zeros(size)
+        np.divide(sums, counts, out=matrix, where=counts > 0)
+        return matrix.reshape(shape)
+
+    def active(self) -> tuple[np.ndarray, np.ndarray]:
+        """Boolean masks of users and titles with at least one non-NULL value."""
+        valid = ~np.isnan(self.values)
+        users = np.zeros(len(self.user_ids), dtype=bool)
+        titles = np.zeros(len(self.title_ids), dtype=bool)
+        users[self.user_codes[valid]] = True
+        titles[self.title_codes[valid]] = True
+        return users, titles
+
+    def categorical(self, column: str, codes: np.ndarray) -> pd.Categorical:
+        vocabulary = self.user_ids if column == "user_id" else self.title_ids
+        return pd.Categorical.from_codes(codes, categories=pd.Index(vocabulary))
+
+
+def load_interactions(
+    conn: duckdb.DuckDBPyConnection,
+    table: str = "fact_views",
+    value_column: str = "completion_ratio",
+    users: str = "dim_users",
+    titles: str = "dim_titles",
+) -> Interactions:
+    """Fetch ``table`` as int32-coded ids plus a float64 value array.
 
-def popularity_recommender(conn: duckdb.DuckDBPyConnection, top_k: int) -> pd.DataFrame:
-    """Recommend the most popular titles overall."""
+    The star schema's dense surrogate keys are used as codes as they are:
+    ``user_key``/``title_key`` index the vocabularies read from the ``users``
+    and ``titles`` dimensions, so no id string crosses into Python per event.
+    """
+    user_ids = conn.execute(f"SELECT user_id FROM {users} ORDER BY user_key").fetchnumpy()["user_id"]
+    title_ids = conn.execute(f"SELECT title_id FROM {titles} ORDER BY title_key").fetchnumpy()["title_id"]
+    events = conn.execute(
+        f"SELECT user_key, title_key, CAST({value_column} AS DOUBLE) AS value FROM {table}"
+    ).fetchnumpy()
+    values = events["value"]
+    if isinstance(values, np.ma.MaskedArray):
+        values = values.filled(np.nan)
+    return Interactions(
+        user_ids=np.asarray(user_ids, dtype=object),
+        title_ids=np.asarray(title_ids, dtype=object),
+        user_codes=np.asarray(events["user_key"], dtype=np.int32),
+        title_codes=np.asarray(events["title_key"], dtype=np.int32),
+        values=np.asarray(values, dtype=np.float64),
+    )
+
+
+def _empty_recommendations() -> pd.DataFrame:
+    return pd.DataFrame(columns=OUTPUT_COLUMNS)
+
+
+def popularity_recommender(
+    conn: duckdb.DuckDBPyConnection,
+    top_k: int,
+    item_masks: Optional[ProfileItemMasks] = None,
+    interactions: Optional[Interactions] = None,
+) -> pd.DataFrame:
+    """Recommend the most popular titles overall.
+
+    With ``item_masks``, restricted profiles get the most popular titles their
+    policy allows instead of a filtered global top-k.
+    """
     logger.info("Computing popularity-based recommendations")
+    interactions = interactions or load_interactions(conn)
     popularity = conn.execute(
         """
-        SELECT title_id, COUNT(*) AS views, AVG(completion_ratio) AS avg_completion
+        SELECT title_key, COUNT(*) AS views, AVG(completion_ratio) AS avg_completion
         FROM fact_views
-        GROUP BY title_id
-        ORDER BY views DESC, avg_completion DESC;
+        GROUP BY title_key
+        ORDER BY views DESC, avg_completion DESC, title_key;
         """
-    ).df()
-    users = conn.execute("SELECT DISTINCT user_id FROM fact_views").df()["user_id"].tolist()
-    rows = []
-    for user in users:
-        for rank, (_, row) in enumerate(popularity.iterrows(), start=1):
-            if rank > top_k:
-                break
-            rows.append({"user_id": user, "title_id": row["title_id"], "rank": rank, "model": "popularity"})
-    return pd.DataFrame(rows)
-
-
-def user_based_cf(conn: duckdb.DuckDBPyConnection, top_k: int) -> pd.DataFrame:
-    """Simple user-based collaborative filtering using cosine similarity."""
+    ).fetchnumpy()
+    title_codes = np.asarray(popularity["title_key"], dtype=np.int32)
+    titles = interactions.title_ids[title_codes]
+    aligned = item_masks.align(titles) if item_masks is not None else {}
+    top_by_profile = {
+        profile: title_codes[mask][:top_k] for profile, mask in aligned.items()
+    }
+    default_top = title_codes[:top_k]
+    picks = [
+        top_by_profile.get(item_masks.profile_for(user), default_top)
+        if item_masks is not None
+        else default_top
+        for user in interactions.user_ids.tolist()
+    ]
+    lengths = np.fromiter((len(p) for p in picks), dtype=np.int64, count=len(picks))
+    if not lengths.sum():
+        return _empty_recommendations()
+    user_codes = np.repeat(np.arange(len(picks), dtype=np.int32), lengths)
+    return pd.DataFrame(
+        {
+            "user_id": interactions.categorical("user_id", user_codes),
+            "title_id": interactions.categorical("title_id", np.concatenate(picks)),
+            "rank": np.concatenate([np.arange(1, n + 1) for n in lengths]),
+            "model": "popularity",
+        }
+    )
+
+
+def user_based_cf(
+    conn: duckdb.DuckDBPyConnection,
+    top_k: int,
+    item_masks: Optional[ProfileItemMasks] = None,
+    interactions: Optional[Interactions] = None,
+) -> pd.DataFrame:
+    """Simple user-based collaborative filtering using cosine similarity.
+
+    A candidate title's score is the mean over all other users of
+    ``similarity * completion``. Titles disallowed for a user's profile by
+    ``item_masks`` are never scored.
+    """
     logger.info("Computing user-based collaborative filtering recommendations")
-    interactions = conn.execute(
-        """
-        SELECT user_id, title_id, completion_ratio
-        FROM fact_views
-        """
-    ).df()
-    pivot = interactions.pivot_table(index="user_id", columns="title_id", values="completion_ratio", fill_value=0)
-    similarity = cosine_similarity(pivot)
-    sim_df = pd.DataFrame(similarity, index=pivot.index, columns=pivot.index)
-
-    recommendations: List[dict] = []
-    for user_id in pivot.index:
-        # compute weighted scores
-        user_sim = sim_df.loc[user_id]
-        for title in pivot.columns:
-            if pivot.loc[user_id, title] > 0:
+    interactions = interactions or load_interactions(conn)
+    with child_span("user_cf.similarity"):
+        active_users, active_titles = interactions.active()
+        user_index = np.flatnonzero(active_users)
+        title_index = np.flatnonzero(active_titles)
+        matrix = interactions.dense_matrix()[np.ix_(user_index, title_index)]
+        normalized = normalize_rows(matrix)
+        similarity = normalized @ normalized.T
+        n_users = len(user_index)
+        # The user's own term drops out only because interaction values
+        # (completion ratios) are non-negative: a candidate title then has
+        # value zero for the user. Negative values would leak into the mean.
+        scores = (
+            similarity @ matrix / (n_users - 1)
+            if n_users > 1
+            else np.zeros_like(matrix)
+        )
+    aligned = (
+        item_masks.align(interactions.title_ids[title_index])
+        if item_masks is not None
+        else {}
+    )
+
+    user_parts: List[np.ndarray] = []
+    title_parts: List[np.ndarray] = []
+    rank_parts: List[np.ndarray] = []
+    # One span for the whole loop: a span per user floods the trace writer.
+    with child_span("user_cf.rank", users=str(len(user_index))):
+        for row, user_code in enumerate(user_index):
+            candidates = matrix[row] <= 0
+            profile = (
+                item_masks.profile_for(interactions.user_ids[user_code])
+                if item_masks is not None
+                else None
+            )
+            if profile is not None:
+                candidates &= aligned[profile]
+            columns = np.flatnonzero(candidates)
+            if not len(columns):
                 continue
-            scores = []
-            for other_user in pivot.index:
-                if other_user == user_id:
-                    continue
-                score = user_sim[other_user]
-                scores.append(score * pivot.loc[other_user, title])
-            mean_score = float(np.mean(scores)) if scores else 0.0
-            recommendations.append({"user_id": user_id, "title_id": title, "score": mean_score})
-
-    rec_df = pd.DataFrame(recommendations)
-    if rec_df.empty:
+            # Dense rank by descending score; ties keep title order.
+            _, dense = np.unique(-scores[row, columns], return_inverse=True)
+            ranks = dense + 1
+            keep = np.lexsort((columns, ranks))[:top_k]
+            user_parts.append(np.full(len(keep), user_code, dtype=np.int32))
+            title_parts.append(title_index[columns[keep]].astype(np.int32))
+            rank_parts.append(ranks[keep].astype(np.float64))
+
+    if not user_parts:
         logger.warning("No CF recommendations generated")
-        return pd.DataFrame(columns=["user_id", "title_id", "rank", "model"])
-    rec_df["rank"] = rec_df.groupby("user_id")["score"].rank("dense", ascending=False)
-    filtered = rec_df.sort_values(["user_id", "rank"]).groupby("user_id").head(top_k)
-    filtered["model"] = "user_cf"
-    return filtered[["user_id", "title_id", "rank", "model"]]
+        return _empty_recommendations()
+    return pd.DataFrame(
+        {
+            "user_id": interactions.categorical("user_id", np.concatenate(user_parts)),
+            "title_id": interactions.categorical(
+                "title_id", np.concatenate(title_parts)
+            ),
+            "rank": np.concatenate(rank_parts),
+            "model": "user_cf",
+        }
+    )
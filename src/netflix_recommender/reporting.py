@@ -1,14 +1,24 @@
-"""Reporting helpers for pipeline outputs."""
+"""Reporting helpers for pipeline outputs.
+
+Summaries can be computed from an in-memory frame or as one DuckDB query over
+the ``recommendations`` table. The pipeline uses the query, which never needs
+the full output resident in Python memory and can use approximate distinct
+counts (``PipelineRuntimeConfig.approximate_summary``).
+"""
 
 from __future__ import annotations
 
 import json
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional
 
+import duckdb
 import pandas as pd
 
+from .profiling import StageProfile
+from .quality import quote_identifier
+
 
 @dataclass
 class RecommendationSummary:
@@ -51,13 +61,53 @@ def build_summary(recommendations: pd.DataFrame) -> RecommendationSummary:
     )
 
 
+def build_summary_sql(
+    conn: duckdb.DuckDBPyConnection,
+    table: str = "recommendations",
+    approximate: bool = False,
+) -> RecommendationSummary:
+    """Summarize ``table`` inside DuckDB; ``approximate`` uses HyperLogLog counts."""
+    columns = {row[0] for row in conn.execute(f"DESCRIBE {table}").fetchall()}
+
+    def distinct(column: str) -> str:
+        if column not in columns:
+            return "0"
+        quoted = quote_identifier(column)
+        if approximate:
+            return f"approx_count_distinct({quoted})"
+        return f"COUNT(DISTINCT {quoted})"
+
+    total_rows, unique_users, unique_titles = conn.execute(
+        f"SELECT COUNT(*), {distinct('user_id')}, {distinct('title_id')} FROM {table}"
+    ).fetchone()
+    top_models: Dict[str, int] = {}
+    if "model" in columns:
+        rows = conn.execute(f"""
+            SELECT model, COUNT(*) AS rows
+            FROM {table}
+            GROUP BY model
+            ORDER BY rows DESC, model
+            LIMIT 5
+            """).fetchall()
+        top_models = {model: int(count) for model, count in rows}
+    return RecommendationSummary(
+        total_rows=int(total_rows),
+        unique_users=int(unique_users),
+        unique_titles=int(unique_titles),
+        top_models=top_models,
+    )
+
+
 def write_summary(summary: RecommendationSummary, path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
     path.write_text(json.dumps(summary.to_dict(), indent=2), encoding="utf-8")
 
 
 def write_markdown_report(
-    summary: RecommendationSummary, metrics: Dict[str, float], path: Path
+    summary: RecommendationSummary,
+    metrics: Dict[str, float],
+    path: Path,
+    profiles: Optional[Iterable[StageProfile]] = None,
 ) -> None:
     lines = [
         "# Pipeline Report",
@@ -74,10 +124,30 @@ def write_markdown_report(
     lines.extend(["", "## Metrics"])
     for key, value in metrics.items():
         lines.append(f"- {key}: {value}")
+    if profiles:
+        lines.extend(
+            [
+                "",
+                "## Stage Profiles",
+                "",
+                "| stage | wall ms | cpu ms | non-cpu ms | py alloc peak MiB | rss MiB | duckdb MiB |",
+                "| --- | ---: | ---: | ---: | ---: | ---: | ---: |",
+            ]
+        )
+        for profile in profiles:
+            lines.append(
+                f"| {profile.stage} | {profile.wall_ms:.1f} | {profile.cpu_ms:.1f} "
+                f"| {profile.io_wait_ms:.1f} | {_mib(profile.py_alloc_peak_bytes)} "
+                f"| {_mib(profile.rss_after_bytes)} | {_mib(profile.duckdb_memory_bytes)} |"
+            )
     path.parent.mkdir(parents=True, exist_ok=True)
     path.write_text("\n".join(lines), encoding="utf-8")
 
 
+def _mib(value: Optional[int]) -> str:
+    return "-" if value is None else f"{value / (1024 * 1024):.1f}"
+
+
 def read_recommendations(path: Path) -> pd.DataFrame:
     return pd.read_csv(path)
 
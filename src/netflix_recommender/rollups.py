@@ -0,0 +1,320 @@
+"""Incrementally maintained rollup tables for engagement analytics.
+
+Daily rollups are partitioned by calendar day of ``fact_views.timestamp``.
+A refresh reads the stored watermark, recomputes every day from the first
+day with newer rows onward, and replaces only those days. Existing history
+is never regrouped, and the analytics queries read a few rows per day
+instead of every event. Rollups hold no surrogate keys, because a rebuilt
+star schema may renumber them.
+
+The pipeline rebuilds ``fact_views`` on every run, so history can change
+under the watermark. Each rollup therefore stores the source's version token
+(see :func:`~.database.bump_table_versions`) and a fingerprint of the rows it
+covers: the row count plus a sum of row hashes. A refresh of an unchanged
+version reads no events. Otherwise one hash scan, shared by both rollups,
+re-checks the fingerprint, and the rollups are rebuilt in full when rows at or
+before the watermark were edited or removed. ``user_key`` is left out of the
+fingerprint: renumbering users does not change any distinct-user count.
+
+``rollup_model_coverage`` is derived from the ``recommendations`` table,
+which every run rewrites. It is recomputed only when that table's version
+token (see :func:`~.database.bump_table_versions`) has changed. Any rollup
+that changes gets its own version bumped, so cached SQL results over it go
+stale.
+"""
+
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import duckdb
+
+from .database import bump_table_versions, get_table_versions
+from .outputs import atomic_path
+
+STATE_TABLE = "rollup_state"
+COVERAGE_ROLLUP = "rollup_model_coverage"
+
+# Every column the daily rollups read, except the surrogate user key.
+_FINGERPRINT_COLUMNS = (
+    "timestamp",
+    "device_type",
+    "watch_time_minutes",
+    "completion_ratio",
+)
+
+_DAILY_SELECTS = {
+    "rollup_daily_engagement": """
+        SELECT
+            CAST(timestamp AS DATE) AS day,
+            COUNT(DISTINCT user_key) AS active_users,
+            COUNT(*) AS views,
+            SUM(watch_time_minutes) AS watch_minutes,
+            SUM(completion_ratio) AS completion_sum,
+            COUNT(completion_ratio) AS completion_count
+        FROM {source}
+        {where}
+        GROUP BY day
+        """,
+    "rollup_daily_device": """
+        SELECT
+            CAST(timestamp AS DATE) AS day,
+            device_type,
+            COUNT(DISTINCT user_key) AS active_users,
+            COUNT(*) AS views,
+            SUM(watch_time_minutes) AS watch_minutes
+        FROM {source}
+        {where}
+        GROUP BY day, device_type
+        """,
+}
+
+
+@dataclass
+class RollupRefresh:
+    rollup: str
+    mode: str
+    rows: int
+    since: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "rollup": self.rollup,
+            "mode": self.mode,
+            "rows": self.rows,
+            "since": self.since,
+        }
+
+
+def _table_exists(conn: duckdb.DuckDBPyConnection, table: str) -> bool:
+    return bool(
+        conn.execute(
+            "SELECT COUNT(*) FROM duckdb_tables() "
+            "WHERE table_name = ? AND schema_name = 'main'",
+            [table],
+        ).fetchone()[0]
+    )
+
+
+def _load_state(
+    conn: duckdb.DuckDBPyConnection, rollup: str
+) -> tuple[Optional[object], Optional[str], Optional[str]]:
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            rollup VARCHAR PRIMARY KEY,
+            watermark TIMESTAMP,
+            source_version VARCHAR,
+            refreshed_at TIMESTAMP NOT NULL
+        )
+        """)
+    # State tables written before fingerprints existed lack the column.
+    conn.execute(
+        f"ALTER TABLE {STATE_TABLE} ADD COLUMN IF NOT EXISTS fingerprint VARCHAR"
+    )
+    row = conn.execute(
+        f"SELECT watermark, source_version, fingerprint FROM {STATE_TABLE} "
+        "WHERE rollup = ?",
+        [rollup],
+    ).fetchone()
+    return (row[0], row[1], row[2]) if row else (None, None, None)
+
+
+def _save_state(
+    conn: duckdb.DuckDBPyConnection,
+    rollup: str,
+    watermark: Optional[object],
+    source_version: Optional[str],
+    fingerprint: Optional[str] = None,
+) -> None:
+    conn.execute(
+        f"INSERT OR REPLACE INTO {STATE_TABLE} "
+        "(rollup, watermark, source_version, fingerprint, refreshed_at) "
+        "VALUES (?, ?, ?, ?, now())",
+        [rollup, watermark, source_version, fingerprint],
+    )
+
+
+def _fingerprint(
+    conn: duckdb.DuckDBPyConnection,
+    source: str,
+    upto: object,
+    after: Optional[object] = None,
+) -> tuple[int, int]:
+    """Row count and row-hash sum of ``source`` in ``(after, upto]``.
+
+    Both parts are additive, so the fingerprint of a longer range is the sum
+    of the fingerprints of its pieces.
+    """
+    where = "timestamp <= ?" + ("" if after is None else " AND timestamp > ?")
+    rows, hashes = conn.execute(
+        f"SELECT COUNT(*), COALESCE(SUM(hash({', '.join(_FINGERPRINT_COLUMNS)})), 0) "
+        f"FROM {source} WHERE {where}",
+        [upto] if after is None else [upto, after],
+    ).fetchone()
+    return int(rows), int(hashes)
+
+
+def _format_fingerprint(fingerprint: tuple[int, int]) -> str:
+    return f"{fingerprint[0]}:{fingerprint[1]}"
+
+
+def refresh_daily_rollups(
+    conn: duckdb.DuckDBPyConnection, source: str = "fact_views", full: bool = False
+) -> List[RollupRefresh]:
+    """Bring the daily rollups up to date with ``source``."""
+    version = get_table_versions(conn, [source])[source.lower()]
+    fingerprints: Dict[tuple, tuple[int, int]] = {}
+
+    def fingerprint_of(upto: object, after: Optional[object] = None) -> tuple[int, int]:
+        # Both rollups read the same source, so each range is scanned once.
+        if (upto, after) not in fingerprints:
+            fingerprints[upto, after] = _fingerprint(conn, source, upto, after)
+        return fingerprints[upto, after]
+
+    refreshes = []
+    for rollup, select in _DAILY_SELECTS.items():
+        watermark, stored_version, stored = _load_state(conn, rollup)
+        rebuild = full or watermark is None or not _table_exists(conn, rollup)
+        if not rebuild and version is not None and version == stored_version:
+            refreshes.append(RollupRefresh(rollup, "unchanged", 0))
+            continue
+        if not rebuild:
+            history = fingerprint_of(watermark)
+            rebuild = _format_fingerprint(history) != stored
+        since = None
+        if rebuild:
+            latest = conn.execute(f"SELECT MAX(timestamp) FROM {source}").fetchone()[0]
+            fingerprint = fingerprint_of(latest)
+        else:
+            since, latest = conn.execute(
+                f"SELECT CAST(MIN(timestamp) AS DATE), MAX(timestamp) FROM {source} "
+                "WHERE timestamp > ?",
+                [watermark],
+            ).fetchone()
+            if since is None:
+                _save_state(conn, rollup, watermark, version, stored)
+                refreshes.append(RollupRefresh(rollup, "unchanged", 0))
+                continue
+            delta = fingerprint_of(latest, watermark)
+            fingerprint = (history[0] + delta[0], history[1] + delta[1])
+        conn.execute("BEGIN TRANSACTION")
+        try:
+            if rebuild:
+                conn.execute(
+                    f"CREATE OR REPLACE TABLE {rollup} AS "
+                    + select.format(source=source, where="")
+                    + " ORDER BY ALL"
+                )
+            else:
+                conn.execute(f"DELETE FROM {rollup} WHERE day >= ?", [since])
+                conn.execute(
+                    f"INSERT INTO {rollup} "
+                    + select.format(
+                        source=source,
+                        where="WHERE timestamp >= CAST(? AS TIMESTAMP)",
+                    ),
+                    [since],
+                )
+            rows = conn.execute(
+                f"SELECT COUNT(*) FROM {rollup}"
+                + ("" if rebuild else " WHERE day >= ?"),
+                [] if rebuild else [since],
+            ).fetchone()[0]
+            _save_state(conn, rollup, latest, version, _format_fingerprint(fingerprint))
+            bump_table_versions(conn, [rollup])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        refreshes.append(
+            RollupRefresh(
+                rollup,
+                "full" if rebuild else "incremental",
+                int(rows),
+                None if since is None else str(since),
+            )
+        )
+    return refreshes
+
+
+def refresh_coverage_rollup(
+    conn: duckdb.DuckDBPyConnection, source: str = "recommendations"
+) -> RollupRefresh:
+    """Recompute per-model coverage when ``source`` has a new version."""
+    _, stored_version, _ = _load_state(conn, COVERAGE_ROLLUP)
+    version = get_table_versions(conn, [source])[source]
+    if (
+        version is not None
+        and version == stored_version
+        and _table_exists(conn, COVERAGE_ROLLUP)
+    ):
+        return RollupRefresh(COVERAGE_ROLLUP, "unchanged", 0)
+    conn.execute(f"""
+        CREATE OR REPLACE TABLE {COVERAGE_ROLLUP} AS
+        SELECT model, COUNT(DISTINCT user_id) AS users_covered, COUNT(*) AS total_rows
+        FROM {source}
+        GROUP BY model
+        ORDER BY model
+        """)
+    _save_state(conn, COVERAGE_ROLLUP, None, version)
+    bump_table_versions(conn, [COVERAGE_ROLLUP])
+    rows = conn.execute(f"SELECT COUNT(*) FROM {COVERAGE_ROLLUP}").fetchone()[0]
+    return RollupRefresh(COVERAGE_ROLLUP, "full", int(rows))
+
+
+def refresh_rollups(
+    conn: duckdb.DuckDBPyConnection, full: bool = False
+) -> List[RollupRefresh]:
+    refreshes = refresh_daily_rollups(conn, full=full)
+    if _table_exists(conn, "recommendations"):
+        refreshes.append(refresh_coverage_rollup(conn))
+    return refreshes
+
+
+def export_dashboard_rollups(conn: duckdb.DuckDBPyConnection, path: Path) -> Path:
+    """Write the rollups the dashboard charts as one small JSON document."""
+    daily = conn.execute("""
+        SELECT strftime(day, '%Y-%m-%d'), active_users, views, watch_minutes,
+               completion_sum / NULLIF(completion_count, 0)
+        FROM rollup_daily_engagement
+        ORDER BY day
+        """).fetchall()
+    devices = conn.execute("""
+        SELECT device_type, SUM(watch_minutes) AS watch_minutes, SUM(views) AS views
+        FROM rollup_daily_device
+        GROUP BY device_type
+        ORDER BY watch_minutes DESC
+        """).fetchall()
+    coverage = (
+        conn.execute(
+            f"SELECT model, users_covered, total_rows FROM {COVERAGE_ROLLUP}"
+        ).fetchall()
+        if _table_exists(conn, COVERAGE_ROLLUP)
+        else []
+    )
+    payload = {
+        "daily": [
+            {
+                "day": day,
+                "active_users": users,
+                "views": views,
+                "watch_minutes": minutes,
+                "avg_completion": completion,
+            }
+            for day, users, views, minutes, completion in daily
+        ],
+        "devices": [
+            {"device_type": device, "watch_minutes": minutes, "views": int(views)}
+            for device, minutes, views in devices
+        ],
+        "coverage": [
+            {"model": model, "users_covered": users, "total_rows": rows}
+            for model, users, rows in coverage
+        ],
+    }
+    with atomic_path(path) as tmp:
+        tmp.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    return path
@@ -5,9 +5,10 @@ from __future__ import annotations
 import os
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Sequence, Tuple
 
 from . import config
+from .outputs import validate_output_formats
 
 
 @dataclass
@@ -20,9 +21,22 @@ class PipelineRuntimeConfig:
     enable_tracing: bool = False
     enable_plugins: bool = False
     enable_policy: bool = False
+    enable_candidate_policy: bool = False
     enable_metrics: bool = False
     enable_quality_checks: bool = False
     quality_report_path: Optional[Path] = None
+    quality_mode: str = "full"
+    quality_state_path: Optional[Path] = None
+    trace_buffered: bool = False
+    trace_sample_rate: float = 1.0
+    enable_profiling: bool = False
+    profile_dir: Optional[Path] = None
+    output_formats: Tuple[str, ...] = ("csv",)
+    approximate_summary: bool = False
+    snapshot_dir: Optional[Path] = None
+    duckdb_threads: Optional[int] = None
+    duckdb_memory_limit: Optional[str] = None
+    duckdb_temp_directory: Optional[Path] = None
 
 
 def build_runtime_config(
@@ -34,12 +48,27 @@ def build_runtime_config(
     enable_tracing: bool = False,
     enable_plugins: bool = False,
     enable_policy: bool = False,
+    enable_candidate_policy: bool = False,
     enable_metrics: bool = False,
     enable_quality_checks: bool = False,
     quality_report_path: Optional[Path] = None,
+    quality_mode: str = "full",
+    quality_state_path: Optional[Path] = None,
+    trace_buffered: bool = False,
+    trace_sample_rate: float = 1.0,
+    enable_profiling: bool = False,
+    profile_dir: Optional[Path] = None,
+    output_formats: Sequence[str] = ("csv",),
+    approximate_summary: bool = False,
+    snapshot_dir: Optional[Path] = None,
+    duckdb_threads: Optional[int] = None,
+    duckdb_memory_limit: Optional[str] = None,
+    duckdb_temp_directory: Optional[Path] = None,
 ) -> PipelineRuntimeConfig:
     resolved_output_dir = output_dir or config.OUTPUT_DIR
     resolved_db_path = db_path or config.DB_PATH
+    if quality_mode not in {"full", "incremental"}:
+        raise ValueError("quality_mode must be 'full' or 'incremental'")
     return PipelineRuntimeConfig(
         run_id=run_id,
         output_dir=resolved_output_dir,
@@ -49,9 +78,22 @@ def build_runtime_config(
         enable_tracing=enable_tracing,
         enable_plugins=enable_plugins,
         enable_policy=enable_policy,
+        enable_candidate_policy=enable_candidate_policy,
         enable_metrics=enable_metrics,
         enable_quality_checks=enable_quality_checks,
         quality_report_path=quality_report_path,
+        quality_mode=quality_mode,
+        quality_state_path=quality_state_path,
+        trace_buffered=trace_buffered,
+        trace_sample_rate=trace_sample_rate,
+        enable_profiling=enable_profiling,
+        profile_dir=profile_dir,
+        output_formats=validate_output_formats(output_formats),
+        approximate_summary=approximate_summary,
+        snapshot_dir=snapshot_dir,
+        duckdb_threads=duckdb_threads,
+        duckdb_memory_limit=duckdb_memory_limit,
+        duckdb_temp_directory=duckdb_temp_directory,
     )
 
 
@@ -60,6 +102,11 @@ def runtime_from_env(run_id: str) -> PipelineRuntimeConfig:
     db_override = os.getenv("NETFLIX_REC_DB_PATH")
     trace_override = os.getenv("NETFLIX_REC_TRACE_PATH")
     quality_report_override = os.getenv("NETFLIX_REC_QUALITY_REPORT")
+    profile_dir_override = os.getenv("NETFLIX_REC_PROFILE_DIR")
+    quality_state_override = os.getenv("NETFLIX_REC_QUALITY_STATE")
+    snapshot_dir_override = os.getenv("NETFLIX_REC_SNAPSHOT_DIR")
+    duckdb_threads = os.getenv("NETFLIX_REC_DUCKDB_THREADS")
+    duckdb_temp_directory = os.getenv("NETFLIX_REC_DUCKDB_TEMP_DIR")
     return build_runtime_config(
         run_id=run_id,
         output_dir=Path(output_override) if output_override else None,
@@ -69,9 +116,30 @@ def runtime_from_env(run_id: str) -> PipelineRuntimeConfig:
         enable_tracing=os.getenv("ENABLE_TRACING", "0") == "1",
         enable_plugins=os.getenv("ENABLE_PLUGINS", "0") == "1",
         enable_policy=os.getenv("ENABLE_POLICY", "0") == "1",
+        enable_candidate_policy=os.getenv("ENABLE_CANDIDATE_POLICY", "0") == "1",
         enable_metrics=os.getenv("ENABLE_METRICS", "0") == "1",
         enable_quality_checks=os.getenv("ENABLE_QUALITY_CHECKS", "0") == "1",
         quality_report_path=(
             Path(quality_report_override) if quality_report_override else None
         ),
+        quality_mode=os.getenv("NETFLIX_REC_QUALITY_MODE", "full"),
+        quality_state_path=(
+            Path(quality_state_override) if quality_state_override else None
+        ),
+        trace_buffered=os.getenv("NETFLIX_REC_TRACE_BUFFERED", "0") == "1",
+        trace_sample_rate=float(os.getenv("NETFLIX_REC_TRACE_SAMPLE_RATE", "1.0")),
+        enable_profiling=os.getenv("ENABLE_PROFILING", "0") == "1",
+        profile_dir=Path(profile_dir_override) if profile_dir_override else None,
+        output_formats=[
+            fmt.strip()
+            for fmt in os.getenv("NETFLIX_REC_OUTPUT_FORMATS", "csv").split(",")
+            if fmt.strip()
+        ],
+        approximate_summary=os.getenv("NETFLIX_REC_APPROX_SUMMARY", "0") == "1",
+        snapshot_dir=Path(snapshot_dir_override) if snapshot_dir_override else None,
+        duckdb_threads=int(duckdb_threads) if duckdb_threads else None,
+        duckdb_memory_limit=os.getenv("NETFLIX_REC_DUCKDB_MEMORY_LIMIT") or None,
+        duckdb_temp_directory=(
+            Path(duckdb_temp_directory) if duckdb_temp_directory else None
+        ),
     )
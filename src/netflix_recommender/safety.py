@@ -7,10 +7,16 @@ remain unchanged unless explicitly enabled.
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Dict, Iterable, List
+from typing import Dict, Iterable, List, Optional, Sequence
 
+import numpy as np
 import pandas as pd
 
+from .plugins import assign_columns, constant_column
+
+# Sentinel that no rule can allowlist, used to resolve the unknown-rating outcome.
+_UNKNOWN_RATING = object()
+
 
 @dataclass
 class SafetyRule:
@@ -25,6 +31,41 @@ class SafetyOutcome:
     reason: str
 
 
+@dataclass
+class CompiledPolicy:
+    """Rating lookup tables for vectorized policy evaluation.
+
+    ``allowed`` and ``reason_codes`` have one entry per known rating plus a
+    trailing entry for unknown ratings, which lines up with the ``-1`` code
+    pandas assigns to values outside the categories.
+    """
+
+    ratings: List[str]
+    allowed: np.ndarray
+    reason_codes: np.ndarray
+    reasons: List[str]
+
+    def rating_codes(self, ratings: pd.Series) -> np.ndarray:
+        """Index of each rating in ``ratings``, ``-1`` when not allowlisted."""
+        known = pd.Index(self.ratings)
+        if isinstance(ratings.dtype, pd.CategoricalDtype):
+            # Resolve the handful of categories, then gather by integer code.
+            lookup = np.append(known.get_indexer(ratings.cat.categories), -1)
+            return lookup[ratings.cat.codes.to_numpy()]
+        return known.get_indexer(ratings)
+
+    def allowed_mask(self, ratings: pd.Series) -> np.ndarray:
+        return np.take(self.allowed, self.rating_codes(ratings))
+
+    def evaluate(self, ratings: pd.Series) -> Dict[str, object]:
+        codes = self.rating_codes(ratings)
+        reason_codes = np.take(self.reason_codes, codes)
+        return {
+            "policy_allowed": np.take(self.allowed, codes),
+            "policy_reason": pd.Categorical.from_codes(reason_codes, self.reasons),
+        }
+
+
 @dataclass
 class SafetyPolicy:
     """Simple safety policy based on allowlisted ratings."""
@@ -42,18 +83,44 @@ class SafetyPolicy:
             return SafetyOutcome(True, "unknown-rating-allowed")
         return SafetyOutcome(False, "rating-blocked")
 
+    def compile(self) -> CompiledPolicy:
+        """Resolve every rule once into per-rating lookup tables."""
+        outcomes: Dict[str, SafetyOutcome] = {}
+        for rule in self.rules:
+            for rating in rule.allowed_ratings:
+                outcomes.setdefault(rating, SafetyOutcome(True, rule.name))
+        ratings = list(outcomes)
+        resolved = [outcomes[rating] for rating in ratings]
+        resolved.append(self.evaluate_rating(_UNKNOWN_RATING))
+        reasons = list(dict.fromkeys(outcome.reason for outcome in resolved))
+        return CompiledPolicy(
+            ratings=ratings,
+            allowed=np.array([outcome.allowed for outcome in resolved], dtype=bool),
+            reason_codes=np.array(
+                [reasons.index(outcome.reason) for outcome in resolved],
+                dtype=np.int16,
+            ),
+            reasons=reasons,
+        )
+
+    def compute(
+        self, recommendations: pd.DataFrame, rating_column: str = "content_rating"
+    ) -> Dict[str, object]:
+        """Return the ``policy_allowed``/``policy_reason`` columns only."""
+        if rating_column not in recommendations.columns:
+            rows = len(recommendations)
+            return {
+                "policy_allowed": np.ones(rows, dtype=bool),
+                "policy_reason": constant_column("no-rating-column", rows),
+            }
+        return self.compile().evaluate(recommendations[rating_column])
+
     def apply(
         self, recommendations: pd.DataFrame, rating_column: str = "content_rating"
     ) -> pd.DataFrame:
-        output = recommendations.copy()
-        if rating_column not in output.columns:
-            output["policy_allowed"] = True
-            output["policy_reason"] = "no-rating-column"
-            return output
-        outcomes = output[rating_column].apply(self.evaluate_rating)
-        output["policy_allowed"] = outcomes.apply(lambda item: item.allowed)
-        output["policy_reason"] = outcomes.apply(lambda item: item.reason)
-        return output
+        return assign_columns(
+            recommendations, self.compute(recommendations, rating_column)
+        )
 
 
 def build_default_policy() -> SafetyPolicy:
@@ -82,3 +149,39 @@ def enforce_policy(
 
 def summarize_policy(policy: SafetyPolicy) -> Dict[str, str]:
     return {rule.name: rule.description for rule in policy.rules}
+
+
+def build_profile_policies() -> Dict[str, SafetyPolicy]:
+    """Candidate-generation policies per user profile.
+
+    Only Kids profiles are restricted, and for them unrated titles are blocked
+    rather than allowed.
+    """
+    default = build_default_policy()
+    return {"Kids": SafetyPolicy(rules=default.rules, allow_unknown=False)}
+
+
+@dataclass
+class ProfileItemMasks:
+    """Allowed-title masks per user profile for filtering before top-k.
+
+    ``align`` evaluates each profile policy once against a recommender's own
+    title order; recommenders then skip disallowed titles while scoring so
+    every user still receives ``top_k`` allowed titles when enough exist.
+    """
+
+    title_ratings: pd.Series
+    policies: Dict[str, SafetyPolicy]
+    user_profiles: Dict[str, str]
+
+    def align(self, title_ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        ratings = self.title_ratings.reindex(pd.Index(title_ids))
+        return {
+            profile: policy.compile().allowed_mask(ratings)
+            for profile, policy in self.policies.items()
+        }
+
+    def profile_for(self, user_id: str) -> Optional[str]:
+        """Return the user's profile when a policy restricts it."""
+        profile = self.user_profiles.get(user_id)
+        return profile if profile in self.policies else None
@@ -0,0 +1,477 @@
+"""In-process serving layer for precomputed recommendations.
+
+``RecommendationIndex`` packs the precomputed top-k lists into flat arrays:
+a sorted user vocabulary, an ``offsets`` array (user ``i`` owns
+``title_codes[offsets[i]:offsets[i + 1]]``) and a title vocabulary the codes
+point into. Lookups are a dict probe plus an array slice, or a binary search
+when the ids are fixed-width bytes mapped from a snapshot (see
+``snapshots``). Unknown users get a global popularity list.
+
+``RecommendationService`` renders JSON responses through an LRU cache. It can
+be exposed with the stdlib asyncio HTTP server in this module, and
+``python -m netflix_recommender.serving bench`` runs a local latency load
+test.
+
+Only building an index from query results needs pandas and DuckDB; they are
+imported there, so a worker that maps a snapshot starts with numpy alone.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+)
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import numpy as np
+
+from . import config
+
+if TYPE_CHECKING:
+    import duckdb
+
+DEFAULT_MODELS = ("user_cf", "popularity")
+FALLBACK_SOURCE = "fallback"
+
+
+@dataclass
+class Recommendation:
+    user_id: str
+    titles: List[str]
+    source: str
+
+    def to_json(self) -> bytes:
+        return json.dumps(
+            {"user_id": self.user_id, "titles": self.titles, "source": self.source},
+            separators=(",", ":"),
+        ).encode("utf-8")
+
+
+@dataclass(frozen=True)
+class RecommendationIndex:
+    user_ids: np.ndarray
+    offsets: np.ndarray
+    title_codes: np.ndarray
+    sources: np.ndarray
+    titles: np.ndarray
+    fallback_codes: np.ndarray
+    models: Tuple[str, ...] = DEFAULT_MODELS
+    _positions: Optional[Dict[str, int]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        # Byte-string ids (memory-mapped snapshots) are binary searched instead,
+        # so loading a snapshot does not touch every user.
+        if self.user_ids.dtype.kind != "S":
+            positions = {user: i for i, user in enumerate(self.user_ids.tolist())}
+            object.__setattr__(self, "_positions", positions)
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        user_ids: Sequence[str],
+        title_ids: Sequence[str],
+        sources: Sequence[int],
+        fallback_titles: Sequence[str],
+        models: Tuple[str, ...] = DEFAULT_MODELS,
+    ) -> "RecommendationIndex":
+        """Pack rows already sorted by user (and by rank within a user)."""
+        import pandas as pd
+
+        users = np.asarray(user_ids, dtype=object)
+        codes, vocabulary = pd.factorize(
+            np.concatenate(
+                [
+                    np.asarray(title_ids, dtype=object),
+                    np.asarray(fallback_titles, dtype=object),
+                ]
+            )
+        )
+        codes = codes.astype(np.int32)
+        starts = (
+            np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+            if len(users)
+            else np.array([], dtype=np.int64)
+        )
+        offsets = np.append(starts, len(users)).astype(np.int64)
+        return cls(
+            user_ids=users[starts],
+            offsets=offsets,
+            title_codes=codes[: len(users)],
+            sources=np.asarray(sources, dtype=np.int8)[starts],
+            titles=np.asarray(vocabulary, dtype=object),
+            fallback_codes=codes[len(users) :],
+            models=tuple(models),
+        )
+
+    @classmethod
+    def from_connection(
+        cls,
+        conn: duckdb.DuckDBPyConnection,
+        table: str = "recommendations",
+        models: Sequence[str] = DEFAULT_MODELS,
+        fallback_model: str = "popularity",
+        fallback_size: int = 50,
+    ) -> "RecommendationIndex":
+        """Keep, per user, the rows of the first model in ``models`` that has any."""
+        models = list(models)
+        rows = conn.execute(
+            f"""
+            WITH candidates AS (
+                SELECT user_id, title_id, rank, list_position(?, model) - 1 AS source
+                FROM {table}
+                WHERE list_contains(?, model)
+            ), chosen AS (
+                SELECT *, MIN(source) OVER (PARTITION BY user_id) AS best
+                FROM candidates
+            )
+            SELECT CAST(user_id AS VARCHAR) AS user_id,
+                   CAST(title_id AS VARCHAR) AS title_id,
+                   source
+            FROM chosen
+            WHERE source = best
+            ORDER BY user_id, rank
+            """,
+            [models, models],
+        ).fetchnumpy()
+        # Titles the fallback model recommends most often; other models break ties.
+        fallback = conn.execute(
+            f"""
+            SELECT CAST(title_id AS VARCHAR) AS title_id
+            FROM {table}
+            GROUP BY title_id
+            ORDER BY COUNT(*) FILTER (WHERE model = ?) DESC, COUNT(*) DESC,
+                     AVG(rank), title_id
+            LIMIT {int(fallback_size)}
+            """,
+            [fallback_model],
+        ).fetchnumpy()
+        return cls.from_arrays(
+            rows["user_id"],
+            rows["title_id"],
+            rows["source"],
+            fallback["title_id"],
+            models=tuple(models),
+        )
+
+    def position(self, user_id: str) -> Optional[int]:
+        if self._positions is not None:
+            return self._positions.get(user_id)
+        key = user_id.encode("utf-8")
+        position = int(np.searchsorted(self.user_ids, key))
+        if position < len(self.user_ids) and self.user_ids[position] == key:
+            return position
+        return None
+
+    def lookup(self, user_id: str, k: Optional[int] = None) -> Recommendation:
+        position = self.position(user_id)
+        if position is None:
+            codes = self.fallback_codes
+            source = FALLBACK_SOURCE
+        else:
+            codes = self.title_codes[
+                self.offsets[position] : self.offsets[position + 1]
+            ]
+            source = self.models[self.sources[position]]
+        if k is not None:
+            codes = codes[:k]
+        titles = self.titles[codes].tolist()
+        if self.titles.dtype.kind == "S":
+            titles = [title.decode("utf-8") for title in titles]
+        return Recommendation(user_id, titles, source)
+
+
+class RecommendationService:
+    """Answers recommendation requests from an index with an LRU response cache."""
+
+    def __init__(self, index: RecommendationIndex, cache_size: int = 10_000) -> None:
+        self.index = index
+        self.cache_size = cache_size
+        self._render: Callable[[str, Optional[int]], bytes] = lru_cache(
+            maxsize=cache_size
+        )(self._render_uncached)
+
+    def _render_uncached(self, user_id: str, k: Optional[int]) -> bytes:
+        return self.index.lookup(user_id, k).to_json()
+
+    def recommend(self, user_id: str, k: Optional[int] = None) -> bytes:
+        return self._render(user_id, k)
+
+    def cache_stats(self) -> Dict[str, int]:
+        info = self._render.cache_info()  # type: ignore[attr-defined]
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+
+    def handle(self, method: str, target: str) -> Tuple[int, bytes]:
+        """Route one HTTP request to ``(status, JSON body)``."""
+        if method != "GET":
+            return 405, b'{"error":"method not allowed"}'
+        parts = urlsplit(target)
+        if parts.path == "/healthz":
+            return 200, json.dumps({"users": len(self.index)}).encode("utf-8")
+        prefix = "/recommendations/"
+        if not parts.path.startswith(prefix) or len(parts.path) == len(prefix):
+            return 404, b'{"error":"not found"}'
+        k: Optional[int] = None
+        values = parse_qs(parts.query).get("k")
+        if values:
+            try:
+                k = int(values[0])
+            except ValueError:
+                k = -1
+            if k < 0:
+                return 400, b'{"error":"k must be a non-negative integer"}'
+        return 200, self.recommend(unquote(parts.path[len(prefix) :]), k)
+
+
+class RequestHandler(Protocol):
+    def handle(self, method: str, target: str) -> Tuple[int, bytes]: ...
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}
+
+
+async def _handle_connection(
+    service: RequestHandler,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+) -> None:
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            keep_alive = True
+            while True:
+                header = await reader.readline()
+                if header in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = header.partition(b":")
+                if name.strip().lower() == b"connection":
+                    keep_alive = value.strip().lower() != b"close"
+            try:
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            except ValueError:
+                status, body = 400, b'{"error":"bad request"}'
+                keep_alive = False
+            else:
+                status, body = service.handle(method, target)
+            writer.write(
+                f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+                "Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode(
+                    "latin-1"
+                )
+                + body
+            )
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_http_server(
+    service: RequestHandler, host: str = "127.0.0.1", port: int = 8080
+) -> asyncio.AbstractServer:
+    """Start a keep-alive HTTP/1.1 server for ``GET /recommendations/{user}``."""
+    return await asyncio.start_server(
+        lambda reader, writer: _handle_connection(service, reader, writer), host, port
+    )
+
+
+@dataclass
+class LatencyReport:
+    requests: int
+    p50_us: float
+    p99_us: float
+    max_us: float
+    requests_per_second: float
+
+    @classmethod
+    def from_samples(cls, samples_ns: np.ndarray, elapsed_s: float) -> "LatencyReport":
+        micros = samples_ns / 1_000.0
+        return cls(
+            requests=len(samples_ns),
+            p50_us=float(np.percentile(micros, 50)),
+            p99_us=float(np.percentile(micros, 99)),
+            max_us=float(micros.max()),
+            requests_per_second=len(samples_ns) / elapsed_s if elapsed_s else 0.0,
+        )
+
+
+def _request_users(
+    index: RecommendationIndex, requests: int, unknown_fraction: float, seed: int
+) -> List[str]:
+    rng = np.random.default_rng(seed)
+    if len(index):
+        users = index.user_ids[rng.integers(0, len(index), size=requests)].tolist()
+    else:
+        users = ["unknown"] * requests
+    for position in np.flatnonzero(rng.random(requests) < unknown_fraction):
+        users[position] = f"unknown-{position}"
+    return users
+
+
+def benchmark_service(
+    service: RecommendationService,
+    requests: int = 100_000,
+    unknown_fraction: float = 0.05,
+    seed: int = 0,
+) -> LatencyReport:
+    """Measure in-process request latency for a random mix of users."""
+    users = _request_users(service.index, requests, unknown_fraction, seed)
+    samples = np.empty(requests, dtype=np.int64)
+    clock = time.perf_counter_ns
+    started = clock()
+    for position, user in enumerate(users):
+        begin = clock()
+        service.recommend(user)
+        samples[position] = clock() - begin
+    return LatencyReport.from_samples(samples, (clock() - started) / 1e9)
+
+
+async def benchmark_http(
+    service: RecommendationService,
+    requests: int = 5_000,
+    concurrency: int = 16,
+    unknown_fraction: float = 0.05,
+    seed: int = 0,
+) -> LatencyReport:
+    """Measure round trips through the HTTP front-end over loopback."""
+    server = await start_http_server(service, port=0)
+    port = server.sockets[0].getsockname()[1]
+    users = _request_users(service.index, requests, unknown_fraction, seed)
+    samples: List[int] = []
+
+    async def client(chunk: List[str]) -> None:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            for user in chunk:
+                begin = time.perf_counter_ns()
+                writer.write(f"GET /recommendations/{user} HTTP/1.1\r\n\r\n".encode())
+                await writer.drain()
+                length = 0
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":", 1)[1])
+                await reader.readexactly(length)
+                samples.append(time.perf_counter_ns() - begin)
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    async with server:
+        await asyncio.gather(
+            *(client(users[offset::concurrency]) for offset in range(concurrency))
+        )
+    elapsed = time.perf_counter() - started
+    return LatencyReport.from_samples(np.asarray(samples, dtype=np.int64), elapsed)
+
+
+def load_service(
+    db_path: Path = config.DB_PATH,
+    table: str = "recommendations",
+    cache_size: int = 10_000,
+) -> RecommendationService:
+    from .database import ConnectionManager
+
+    with ConnectionManager(db_path, read_only=True) as manager:
+        index = RecommendationIndex.from_connection(manager.connection, table=table)
+    return RecommendationService(index, cache_size=cache_size)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve precomputed recommendations.")
+    parser.add_argument("--db", type=Path, default=config.DB_PATH)
+    parser.add_argument("--table", default="recommendations")
+    parser.add_argument("--cache-size", type=int, default=10_000)
+    parser.add_argument(
+        "--snapshots",
+        type=Path,
+        help="serve and hot-swap snapshots from this directory",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the asyncio HTTP front-end")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+
+    bench = commands.add_parser("bench", help="local p50/p99 latency load test")
+    bench.add_argument("--requests", type=int, default=100_000)
+    bench.add_argument("--unknown-fraction", type=float, default=0.05)
+    bench.add_argument("--http", action="store_true", help="go through the HTTP server")
+    bench.add_argument("--concurrency", type=int, default=16)
+
+    args = parser.parse_args(argv)
+    if args.command == "serve" and args.snapshots is not None:
+        from .snapshots import SnapshotServer, SnapshotStore
+
+        swapper = SnapshotServer(
+            SnapshotStore(args.snapshots), cache_size=args.cache_size
+        )
+
+        async def run() -> None:
+            server = await start_http_server(swapper, args.host, args.port)
+            async with server:
+                await asyncio.gather(server.serve_forever(), swapper.watch())
+
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    service = load_service(args.db, table=args.table, cache_size=args.cache_size)
+    if args.command == "serve":
+
+        async def run() -> None:
+            server = await start_http_server(service, args.host, args.port)
+            async with server:
+                await server.serve_forever()
+
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.http:
+        report = asyncio.run(
+            benchmark_http(
+                service,
+                requests=args.requests,
+                concurrency=args.concurrency,
+                unknown_fraction=args.unknown_fraction,
+            )
+        )
+    else:
+        report = benchmark_service(
+            service, requests=args.requests, unknown_fraction=args.unknown_fraction
+        )
+    print(json.dumps({**report.__dict__, "cache": service.cache_stats()}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
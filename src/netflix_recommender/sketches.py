@@ -0,0 +1,57 @@
+"""Mergeable probabilistic sketches for the incremental drift checks."""
+
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, field
+from typing import Dict
+
+import numpy as np
+
+
+@dataclass
+class HyperLogLog:
+    """Mergeable distinct-count sketch with ``2**precision`` one-byte registers."""
+
+    precision: int = 12
+    registers: np.ndarray = field(default=None)  # type: ignore[assignment]
+
+    def __post_init__(self) -> None:
+        if self.registers is None:
+            self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+
+    def merge(self, other: "HyperLogLog") -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def add_hashes(self, hashes: np.ndarray) -> None:
+        """Fold 64-bit hashes into the registers."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        word_bits = 64 - self.precision
+        index = (hashes & np.uint64(len(self.registers) - 1)).astype(np.intp)
+        words = (hashes >> np.uint64(self.precision)).astype(np.float64)
+        # frexp's exponent is floor(log2(word)) + 1, and 0 for a zero word.
+        _, exponent = np.frexp(words)
+        ranks = (word_bits + 1 - exponent).astype(np.uint8)
+        np.maximum.at(self.registers, index, ranks)
+
+    def estimate(self) -> float:
+        m = float(len(self.registers))
+        alpha = 0.7213 / (1.0 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.exp2(-self.registers.astype(np.float64))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * math.log(m / zeros)
+        return raw
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "precision": self.precision,
+            "registers": self.registers.tobytes().hex(),
+        }
+
+    @classmethod
+    def from_dict(cls, payload: Dict[str, object]) -> "HyperLogLog":
+        registers = np.frombuffer(
+            bytes.fromhex(str(payload["registers"])), dtype=np.uint8
+        )
+        return cls(precision=int(payload["precision"]), registers=registers.copy())
@@ -0,0 +1,272 @@
+"""Versioned, memory-mappable serving snapshots with hot swapping.
+
+Each pipeline run can publish its :class:`~.serving.RecommendationIndex` as an
+immutable directory of ``.npy`` arrays under ``<root>/<run_id>/``. Ids are
+stored as sorted fixed-width byte strings so a server can ``np.load`` every
+array with ``mmap_mode="r"`` and start answering without decoding the whole
+file. ``<root>/CURRENT`` names the active run and is replaced atomically.
+
+:class:`SnapshotServer` follows that pointer: ``refresh()`` maps the new
+snapshot and swaps it in, requests hold a lease on the snapshot they started
+with, and a retired snapshot is deleted once its last lease is released.
+Removing a mapped file is safe on POSIX, so other processes still reading an
+old snapshot keep working until they swap too.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .outputs import atomic_path
+from .serving import RecommendationIndex, RecommendationService
+
+logger = logging.getLogger(__name__)
+
+POINTER_NAME = "CURRENT"
+MANIFEST_NAME = "manifest.json"
+_ARRAYS = ("user_ids", "offsets", "title_codes", "sources", "titles", "fallback_codes")
+
+
+def _encode(values: np.ndarray) -> np.ndarray:
+    if values.dtype.kind == "S":
+        return values
+    return np.array(
+        [str(value).encode("utf-8") for value in values.tolist()], dtype=bytes
+    )
+
+
+def _sorted_by_user(index: RecommendationIndex) -> Dict[str, np.ndarray]:
+    """Arrays for ``index`` with users reordered into byte-wise sorted order."""
+    users = _encode(index.user_ids)
+    order = np.argsort(users, kind="stable")
+    lengths = np.diff(index.offsets)[order]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    # Gather each user's segment of title codes in the new order.
+    starts = index.offsets[:-1][order]
+    gather = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+    return {
+        "user_ids": users[order],
+        "offsets": offsets,
+        "title_codes": np.asarray(index.title_codes, dtype=np.int32)[gather],
+        "sources": np.asarray(index.sources, dtype=np.int8)[order],
+        "titles": _encode(index.titles),
+        "fallback_codes": np.asarray(index.fallback_codes, dtype=np.int32),
+    }
+
+
+@dataclass
+class SnapshotInfo:
+    run_id: str
+    path: Path
+    created_at: float
+    users: int
+    rows: int
+    models: Tuple[str, ...]
+
+
+class SnapshotStore:
+    """Directory of immutable per-run snapshots plus the ``CURRENT`` pointer."""
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def path_for(self, run_id: str) -> Path:
+        if not run_id or "/" in run_id or run_id.startswith("."):
+            raise ValueError(f"Invalid snapshot run_id: {run_id!r}")
+        return self.root / run_id
+
+    def publish(
+        self, index: RecommendationIndex, run_id: str, activate: bool = True
+    ) -> SnapshotInfo:
+        target = self.path_for(run_id)
+        if target.exists():
+            raise FileExistsError(
+                f"Snapshot {run_id} already exists; snapshots are immutable"
+            )
+        arrays = _sorted_by_user(index)
+        manifest = {
+            "run_id": run_id,
+            "created_at": time.time(),
+            "users": len(arrays["user_ids"]),
+            "rows": len(arrays["title_codes"]),
+            "models": list(index.models),
+        }
+        with atomic_path(target, directory=True) as tmp:
+            for name in _ARRAYS:
+                np.save(tmp / f"{name}.npy", arrays[name], allow_pickle=False)
+            (tmp / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+        if activate:
+            self.activate(run_id)
+        return self.info(run_id)
+
+    def activate(self, run_id: str) -> None:
+        if not (self.path_for(run_id) / MANIFEST_NAME).exists():
+            raise FileNotFoundError(f"No snapshot for run {run_id} in {self.root}")
+        with atomic_path(self.root / POINTER_NAME) as tmp:
+            tmp.write_text(run_id + "\n", encoding="utf-8")
+
+    def current_run_id(self) -> Optional[str]:
+        pointer = self.root / POINTER_NAME
+        if not pointer.exists():
+            return None
+        return pointer.read_text(encoding="utf-8").strip() or None
+
+    def info(self, run_id: str) -> SnapshotInfo:
+        path = self.path_for(run_id)
+        manifest = json.loads((path / MANIFEST_NAME).read_text())
+        return SnapshotInfo(
+            run_id=run_id,
+            path=path,
+            created_at=float(manifest["created_at"]),
+            users=int(manifest["users"]),
+            rows=int(manifest["rows"]),
+            models=tuple(manifest["models"]),
+        )
+
+    def list_snapshots(self) -> List[SnapshotInfo]:
+        if not self.root.exists():
+            return []
+        snapshots = [
+            self.info(path.name)
+            for path in self.root.iterdir()
+            if path.is_dir()
+            and not path.name.startswith(".")
+            and (path / MANIFEST_NAME).exists()
+        ]
+        return sorted(snapshots, key=lambda info: info.created_at)
+
+    def load(self, run_id: str, mmap: bool = True) -> RecommendationIndex:
+        path = self.path_for(run_id)
+        mode = "r" if mmap else None
+        arrays = {
+            name: np.load(path / f"{name}.npy", mmap_mode=mode, allow_pickle=False)
+            for name in _ARRAYS
+        }
+        return RecommendationIndex(models=self.info(run_id).models, **arrays)
+
+    def remove(self, run_id: str) -> None:
+        if run_id == self.current_run_id():
+            raise ValueError(f"Refusing to remove the active snapshot {run_id}")
+        shutil.rmtree(self.path_for(run_id), ignore_errors=True)
+
+    def reclaim(self, keep: int = 2, protect: Iterable[str] = ()) -> List[str]:
+        """Delete all but the newest ``keep`` snapshots, sparing current and ``protect``."""
+        protected = set(protect) | {self.current_run_id()}
+        snapshots = self.list_snapshots()
+        stale = snapshots[: max(0, len(snapshots) - keep)]
+        removed = []
+        for info in stale:
+            if info.run_id in protected:
+                continue
+            shutil.rmtree(info.path, ignore_errors=True)
+            removed.append(info.run_id)
+        return removed
+
+
+class _Lease:
+    """A mapped snapshot plus the number of in-flight requests using it."""
+
+    def __init__(self, run_id: str, service: RecommendationService) -> None:
+        self.run_id = run_id
+        self.service: Optional[RecommendationService] = service
+        self.readers = 0
+        self.retired = False
+
+
+class SnapshotServer:
+    """Serves the active snapshot and swaps to a new one without downtime."""
+
+    def __init__(
+        self,
+        store: SnapshotStore,
+        cache_size: int = 10_000,
+        reclaim: bool = True,
+        keep: int = 1,
+    ) -> None:
+        # keep > 1 leaves the newest retired snapshots on disk as rollback targets.
+        self.store = store
+        self.cache_size = cache_size
+        self.reclaim = reclaim
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._current: Optional[_Lease] = None
+        self._live: Dict[str, _Lease] = {}
+        self.refresh()
+
+    @property
+    def run_id(self) -> Optional[str]:
+        current = self._current
+        return current.run_id if current else None
+
+    def refresh(self) -> bool:
+        """Swap to the snapshot named by ``CURRENT``; returns True if it changed."""
+        with self._refresh_lock:
+            run_id = self.store.current_run_id()
+            if run_id is None or run_id == self.run_id:
+                return False
+            service = RecommendationService(
+                self.store.load(run_id, mmap=True), cache_size=self.cache_size
+            )
+            with self._lock:
+                previous, self._current = self._current, _Lease(run_id, service)
+                self._live[run_id] = self._current
+                if previous is not None:
+                    previous.retired = True
+        logger.info(
+            "Swapped serving snapshot %s -> %s", previous and previous.run_id, run_id
+        )
+        if previous is not None:
+            self._release_if_idle(previous)
+        return True
+
+    @contextmanager
+    def acquire(self) -> Iterator[RecommendationService]:
+        with self._lock:
+            lease = self._current
+            if lease is None or lease.service is None:
+                raise LookupError(f"No active snapshot in {self.store.root}")
+            lease.readers += 1
+        try:
+            yield lease.service
+        finally:
+            with self._lock:
+                lease.readers -= 1
+            self._release_if_idle(lease)
+
+    def _release_if_idle(self, lease: _Lease) -> None:
+        with self._lock:
+            if not lease.retired or lease.readers or lease.service is None:
+                return
+            # Dropping the last reference unmaps the arrays.
+            lease.service = None
+            self._live.pop(lease.run_id, None)
+            protected = list(self._live)
+        if self.reclaim:
+            removed = self.store.reclaim(keep=self.keep, protect=protected)
+            if removed:
+                logger.info("Reclaimed snapshots %s", removed)
+
+    def handle(self, method: str, target: str) -> Tuple[int, bytes]:
+        with self.acquire() as service:
+            return service.handle(method, target)
+
+    async def watch(self, interval: float = 1.0) -> None:
+        """Poll the ``CURRENT`` pointer and hot-swap when it moves."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except (OSError, ValueError) as exc:
+                logger.warning("Snapshot refresh failed: %s", exc)
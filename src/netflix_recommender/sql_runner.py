@@ -0,0 +1,217 @@
+"""Parallel, cached execution of analytical SQL files.
+
+Statements are split with DuckDB's own parser. Consecutive ``SELECT``
+statements are independent reads, so they run concurrently, each on a
+pooled per-thread cursor from :class:`~.database.ConnectionManager`. Their
+results are streamed by DuckDB straight into Parquet (or Arrow IPC) files,
+so nothing is fetched into Python. Any other statement is a barrier: it runs
+alone, in file order, on the root connection.
+
+Each result file is named by a hash of the query text plus the version
+tokens of the tables it reads (see :func:`~.database.bump_table_versions`).
+If a file for that key already exists, the query is not run again. Queries
+that read an unversioned table, such as a view, always run. Because the
+tables a DDL or DML statement writes are not reliably known, such a
+statement bumps every table's version.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import duckdb
+
+from .database import (
+    TABLE_VERSIONS,
+    ConnectionManager,
+    bump_table_versions,
+    get_table_versions,
+)
+from .outputs import atomic_path, copy_query_to_parquet, stream_query_to_arrow
+
+logger = logging.getLogger(__name__)
+
+RESULT_FORMATS = ("parquet", "arrow")
+
+
+@dataclass
+class QueryResult:
+    statement: int
+    query: str
+    path: Optional[Path]
+    rows: int
+    cached: bool
+    seconds: float
+
+    def to_dict(self) -> Dict[str, object]:
+        payload = asdict(self)
+        payload["path"] = str(self.path) if self.path else None
+        return payload
+
+
+def _cache_key(query: str, versions: Dict[str, Optional[str]], fmt: str) -> str:
+    payload = json.dumps(
+        {"query": query, "tables": sorted(versions.items()), "format": fmt},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class SqlRunner:
+    """Run SQL files against a :class:`ConnectionManager`, writing results to files."""
+
+    def __init__(
+        self,
+        manager: ConnectionManager,
+        result_dir: Path,
+        result_format: str = "parquet",
+        max_workers: Optional[int] = None,
+        use_cache: bool = True,
+    ) -> None:
+        if result_format not in RESULT_FORMATS:
+            raise ValueError(
+                f"Unknown result format {result_format!r}; expected one of {RESULT_FORMATS}"
+            )
+        self.manager = manager
+        self.result_dir = result_dir
+        self.result_format = result_format
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.use_cache = use_cache
+
+    def run_file(self, sql_file: Path) -> List[QueryResult]:
+        return self.run(sql_file.read_text(encoding="utf-8"))
+
+    def run(self, sql: str) -> List[QueryResult]:
+        """Execute every statement in ``sql``; returns one result per statement."""
+        statements = duckdb.extract_statements(sql)
+        results: List[QueryResult] = []
+        batch: List[tuple[int, str]] = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for index, statement in enumerate(statements):
+                query = statement.query.strip()
+                if statement.type == duckdb.StatementType.SELECT:
+                    batch.append((index, query))
+                    continue
+                results.extend(self._run_queries(pool, batch))
+                batch = []
+                results.append(self._run_barrier(index, query))
+            results.extend(self._run_queries(pool, batch))
+        return results
+
+    def _run_queries(
+        self, pool: ThreadPoolExecutor, batch: List[tuple[int, str]]
+    ) -> List[QueryResult]:
+        if not batch:
+            return []
+        # Versions are read before any worker starts, on the owning thread.
+        conn = self.manager.connection
+        versions = {index: self._versions(conn, query) for index, query in batch}
+        return list(
+            pool.map(
+                lambda item: self._run_query(item[0], item[1], versions[item[0]]),
+                batch,
+            )
+        )
+
+    def _versions(
+        self, conn: duckdb.DuckDBPyConnection, query: str
+    ) -> Optional[Dict[str, Optional[str]]]:
+        try:
+            tables = duckdb.get_table_names(query)
+        except duckdb.Error:
+            return None
+        return get_table_versions(conn, tables)
+
+    def _run_query(
+        self,
+        index: int,
+        query: str,
+        versions: Optional[Dict[str, Optional[str]]],
+    ) -> QueryResult:
+        started = time.perf_counter()
+        cacheable = (
+            self.use_cache
+            and versions is not None
+            and all(version is not None for version in versions.values())
+        )
+        key = _cache_key(query, versions or {}, self.result_format)
+        path = self.result_dir / f"{key}.{self.result_format}"
+        meta_path = path.with_suffix(".json")
+        if cacheable and path.exists() and meta_path.exists():
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if meta.get("cacheable"):
+                return QueryResult(
+                    index,
+                    query,
+                    path,
+                    int(meta["rows"]),
+                    True,
+                    time.perf_counter() - started,
+                )
+
+        cursor = self.manager.cursor()
+        if self.result_format == "parquet":
+            rows = copy_query_to_parquet(cursor, query, path)
+        else:
+            rows = stream_query_to_arrow(cursor, query, path)
+        with atomic_path(meta_path) as tmp:
+            tmp.write_text(
+                json.dumps(
+                    {
+                        "query": query,
+                        "tables": versions,
+                        "rows": rows,
+                        "cacheable": cacheable,
+                    },
+                    indent=2,
+                ),
+                encoding="utf-8",
+            )
+        return QueryResult(
+            index, query, path, rows, False, time.perf_counter() - started
+        )
+
+    def _run_barrier(self, index: int, query: str) -> QueryResult:
+        started = time.perf_counter()
+        conn = self.manager.connection
+        conn.execute(query)
+        tables = [
+            row[0]
+            for row in conn.execute(
+                "SELECT table_name FROM duckdb_tables() WHERE schema_name = 'main' "
+                "AND NOT temporary AND table_name <> ?",
+                [TABLE_VERSIONS],
+            ).fetchall()
+        ]
+        bump_table_versions(conn, tables)
+        return QueryResult(index, query, None, 0, False, time.perf_counter() - started)
+
+
+def run_sql_file(
+    manager: ConnectionManager,
+    sql_file: Path,
+    result_dir: Path,
+    result_format: str = "parquet",
+    max_workers: Optional[int] = None,
+) -> List[QueryResult]:
+    """Run ``sql_file`` with a :class:`SqlRunner` and log each statement's outcome."""
+    runner = SqlRunner(manager, result_dir, result_format, max_workers)
+    results = runner.run_file(sql_file)
+    for result in results:
+        logger.info(
+            "SQL statement %d: %d rows -> %s (%s, %.3fs)",
+            result.statement,
+            result.rows,
+            result.path,
+            "cached" if result.cached else "executed",
+            result.seconds,
+        )
+    return results
@@ -0,0 +1,333 @@
+"""Offline analysis of JSONL traces written by the trace recorder.
+
+The analyzer streams a trace file line by line, rebuilds the span tree from
+``span.start``/``span.end`` events and derives per-stage total and self time,
+the critical path, collapsed stacks for flame-graph tools, and stage-level
+regressions between two runs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from .tracing import TraceEvent
+
+
+@dataclass
+class SpanNode:
+    span_id: str
+    name: str
+    parent_id: Optional[str]
+    start: float = 0.0
+    duration_ns: int = 0
+    children: List["SpanNode"] = field(default_factory=list)
+
+    @property
+    def end(self) -> float:
+        return self.start + self.duration_ns / 1e9
+
+    @property
+    def self_ns(self) -> int:
+        return max(0, self.duration_ns - sum(c.duration_ns for c in self.children))
+
+
+@dataclass
+class StageStats:
+    name: str
+    count: int = 0
+    total_ns: int = 0
+    self_ns: int = 0
+
+    @property
+    def total_ms(self) -> float:
+        return self.total_ns / 1e6
+
+    @property
+    def self_ms(self) -> float:
+        return self.self_ns / 1e6
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "count": self.count,
+            "total_ms": round(self.total_ms, 3),
+            "self_ms": round(self.self_ms, 3),
+        }
+
+
+@dataclass
+class StageRegression:
+    name: str
+    baseline_ms: float
+    candidate_ms: float
+    regressed: bool
+
+    @property
+    def ratio(self) -> float:
+        if self.baseline_ms == 0:
+            return float("inf") if self.candidate_ms > 0 else 1.0
+        return self.candidate_ms / self.baseline_ms
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "name": self.name,
+            "baseline_ms": round(self.baseline_ms, 3),
+            "candidate_ms": round(self.candidate_ms, 3),
+            "ratio": round(self.ratio, 3),
+            "regressed": self.regressed,
+        }
+
+
+@dataclass
+class TraceTree:
+    roots: List[SpanNode] = field(default_factory=list)
+    spans: Dict[str, SpanNode] = field(default_factory=dict)
+
+    def walk(self) -> Iterator[tuple[List[str], SpanNode]]:
+        """Yield ``(stack, node)`` pairs depth first, where stack ends with node."""
+        pending = [([root.name], root) for root in reversed(self.roots)]
+        while pending:
+            stack, node = pending.pop()
+            yield stack, node
+            for child in reversed(node.children):
+                pending.append((stack + [child.name], child))
+
+
+def iter_trace_events(path: Path, run_id: Optional[str] = None) -> Iterator[TraceEvent]:
+    """Stream events from a JSONL trace without loading the file into memory."""
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            payload = json.loads(line)
+            if run_id is not None and payload["run_id"] != run_id:
+                continue
+            yield TraceEvent(
+                event=payload["event"],
+                timestamp=payload["timestamp"],
+                run_id=payload["run_id"],
+                span_id=payload.get("span_id"),
+                parent_id=payload.get("parent_id"),
+                payload=payload.get("payload", {}),
+            )
+
+
+def _event_duration_ns(event: TraceEvent) -> int:
+    if "duration_ns" in event.payload:
+        return int(event.payload["duration_ns"])
+    return int(event.payload.get("duration_ms", 0)) * 1_000_000
+
+
+def build_span_tree(events: Iterable[TraceEvent]) -> TraceTree:
+    """Reconstruct the span tree; spans without an end event are dropped."""
+    spans: Dict[str, SpanNode] = {}
+    ended: set[str] = set()
+    for event in events:
+        if event.span_id is None:
+            continue
+        if event.event == "span.start":
+            spans[event.span_id] = SpanNode(
+                span_id=event.span_id,
+                name=event.payload.get("name", "?"),
+                parent_id=event.parent_id,
+                start=event.timestamp,
+            )
+        elif event.event == "span.end":
+            duration_ns = _event_duration_ns(event)
+            node = spans.get(event.span_id)
+            if node is None:
+                # The start event was not seen; back out the start time.
+                node = SpanNode(
+                    span_id=event.span_id,
+                    name=event.payload.get("name", "?"),
+                    parent_id=event.parent_id,
+                    start=event.timestamp - duration_ns / 1e9,
+                )
+                spans[event.span_id] = node
+            node.duration_ns = duration_ns
+            ended.add(event.span_id)
+
+    tree = TraceTree(spans={span_id: spans[span_id] for span_id in ended})
+    for node in sorted(tree.spans.values(), key=lambda item: item.start):
+        parent = tree.spans.get(node.parent_id) if node.parent_id else None
+        if parent is None:
+            tree.roots.append(node)
+        else:
+            parent.children.append(node)
+    return tree
+
+
+def stage_stats(tree: TraceTree) -> Dict[str, StageStats]:
+    """Aggregate total and self time per span name."""
+    stats: Dict[str, StageStats] = {}
+    for _, node in tree.walk():
+        entry = stats.setdefault(node.name, StageStats(node.name))
+        entry.count += 1
+        entry.total_ns += node.duration_ns
+        entry.self_ns += node.self_ns
+    return stats
+
+
+def critical_path(tree: TraceTree) -> List[SpanNode]:
+    """Return the chain of spans that determined when the longest root finished.
+
+    Starting from the last-finishing child, each step keeps the latest child
+    that ended before the previously selected one started, then recurses into
+    the selected children in chronological order.
+    """
+    if not tree.roots:
+        return []
+    root = max(tree.roots, key=lambda node: node.duration_ns)
+    return _critical_path(root)
+
+
+def _critical_path(node: SpanNode) -> List[SpanNode]:
+    path = [node]
+    selected: List[SpanNode] = []
+    horizon = float("inf")
+    for child in sorted(node.children, key=lambda item: item.end, reverse=True):
+        if child.end <= horizon:
+            selected.append(child)
+            horizon = child.start
+    for child in reversed(selected):
+        path.extend(_critical_path(child))
+    return path
+
+
+def collapsed_stacks(tree: TraceTree) -> Dict[str, int]:
+    """Collapse the tree into ``a;b;c -> self microseconds`` for flame graphs."""
+    stacks: Dict[str, int] = {}
+    for stack, node in tree.walk():
+        key = ";".join(stack)
+        stacks[key] = stacks.get(key, 0) + node.self_ns // 1_000
+    return stacks
+
+
+def write_collapsed_stacks(tree: TraceTree, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lines = [
+        f"{stack} {value}" for stack, value in sorted(collapsed_stacks(tree).items())
+    ]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def diff_stage_stats(
+    baseline: Dict[str, StageStats],
+    candidate: Dict[str, StageStats],
+    threshold: float = 0.2,
+    min_delta_ms: float = 1.0,
+) -> List[StageRegression]:
+    """Compare total time per stage; flag growth above ``threshold`` (a ratio).
+
+    ``min_delta_ms`` keeps sub-millisecond noise on tiny stages from being
+    reported as regressions.
+    """
+    results: List[StageRegression] = []
+    for name in sorted(set(baseline) | set(candidate)):
+        base_ms = baseline[name].total_ms if name in baseline else 0.0
+        cand_ms = candidate[name].total_ms if name in candidate else 0.0
+        regressed = cand_ms - base_ms >= min_delta_ms and cand_ms > base_ms * (
+            1.0 + threshold
+        )
+        results.append(StageRegression(name, base_ms, cand_ms, regressed))
+    return results
+
+
+def analyze_trace(path: Path, run_id: Optional[str] = None) -> TraceTree:
+    return build_span_tree(iter_trace_events(path, run_id=run_id))
+
+
+def latest_run_id(path: Path) -> Optional[str]:
+    """Run id of the last event; the recorder appends every run to one file."""
+    run_id = None
+    for event in iter_trace_events(path):
+        run_id = event.run_id
+    return run_id
+
+
+def compare_traces(
+    baseline_path: Path,
+    candidate_path: Path,
+    threshold: float = 0.2,
+    min_delta_ms: float = 1.0,
+    baseline_run_id: Optional[str] = None,
+    candidate_run_id: Optional[str] = None,
+) -> List[StageRegression]:
+    """Diff one run from each trace, defaulting to the latest run in each file."""
+    baseline = analyze_trace(
+        baseline_path, run_id=baseline_run_id or latest_run_id(baseline_path)
+    )
+    candidate = analyze_trace(
+        candidate_path, run_id=candidate_run_id or latest_run_id(candidate_path)
+    )
+    return diff_stage_stats(
+        stage_stats(baseline),
+        stage_stats(candidate),
+        threshold=threshold,
+        min_delta_ms=min_delta_ms,
+    )
+
+
+def render_analysis_markdown(tree: TraceTree) -> str:
+    lines = [
+        "# Trace Analysis",
+        "",
+        "## Stages",
+        "",
+        "| stage | count | total ms | self ms |",
+        "| --- | ---: | ---: | ---: |",
+    ]
+    stats = sorted(stage_stats(tree).values(), key=lambda s: s.total_ns, reverse=True)
+    for entry in stats:
+        lines.append(
+            f"| {entry.name} | {entry.count} | {entry.total_ms:.3f} | {entry.self_ms:.3f} |"
+        )
+    lines.extend(["", "## Critical Path", ""])
+    for node in critical_path(tree):
+        lines.append(f"- {node.name}: {node.duration_ns / 1e6:.3f} ms")
+    return "\n".join(lines) + "\n"
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Analyze recommender pipeline traces.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    summarize = commands.add_parser("summarize", help="stage timings and critical path")
+    summarize.add_argument("trace", type=Path)
+    summarize.add_argument("--run-id")
+    summarize.add_argument("--collapsed", type=Path, help="write collapsed stacks here")
+
+    diff = commands.add_parser("diff", help="flag stages that regressed between runs")
+    diff.add_argument("baseline", type=Path)
+    diff.add_argument("candidate", type=Path)
+    diff.add_argument("--threshold", type=float, default=0.2)
+    diff.add_argument("--min-delta-ms", type=float, default=1.0)
+    diff.add_argument("--baseline-run-id", help="defaults to the latest run")
+    diff.add_argument("--candidate-run-id", help="defaults to the latest run")
+
+    args = parser.parse_args(argv)
+    if args.command == "summarize":
+        tree = analyze_trace(args.trace, run_id=args.run_id)
+        print(render_analysis_markdown(tree))
+        if args.collapsed:
+            write_collapsed_stacks(tree, args.collapsed)
+        return 0
+
+    regressions = compare_traces(
+        args.baseline,
+        args.candidate,
+        threshold=args.threshold,
+        min_delta_ms=args.min_delta_ms,
+        baseline_run_id=args.baseline_run_id,
+        candidate_run_id=args.candidate_run_id,
+    )
+    print(json.dumps([item.to_dict() for item in regressions], indent=2))
+    return 1 if any(item.regressed for item in regressions) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
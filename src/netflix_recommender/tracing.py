@@ -1,18 +1,26 @@
 """Trace recording utilities for pipeline runs.
 
 Traces are stored as JSONL for easy inspection and converted to Markdown for
-recruiter-friendly demos. Tracing is opt-in and disabled by default.
+recruiter-friendly demos. Tracing is opt-in and disabled by default. Recorders
+can optionally hand events to a background writer so span bookkeeping never
+blocks on file I/O.
 """
 
 from __future__ import annotations
 
+import atexit
 import json
+import queue
+import random
+import threading
 import time
 import uuid
-from contextlib import contextmanager
+from contextvars import ContextVar, Token
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, Iterator, List, Optional
+from typing import Dict, List, Optional, Union
+
+_STOP = object()
 
 
 @dataclass
@@ -40,11 +48,46 @@ class TraceEvent:
 
 @dataclass
 class TraceSpan:
+    """A span that records start/end events and becomes the active parent.
+
+    Spans are context managers: entering one makes it the parent of any span
+    opened in the same context (thread or asyncio task) until it exits.
+    Unsampled spans still become active so their descendants are skipped too,
+    but they never write events.
+    """
+
     recorder: "TraceRecorder"
     name: str
     span_id: str
     parent_id: Optional[str]
     start_time: float
+    sampled: bool = True
+    payload: Dict[str, str] = field(default_factory=dict)
+    start_ns: int = 0
+    _token: Optional[Token] = field(default=None, init=False, repr=False)
+
+    def __enter__(self) -> "TraceSpan":
+        self._token = _ACTIVE_SPAN.set(self)
+        if self.sampled:
+            self.recorder.record_event(
+                "span.start",
+                span_id=self.span_id,
+                parent_id=self.parent_id,
+                payload={"name": self.name, **self.payload},
+            )
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        duration_ns = time.perf_counter_ns() - self.start_ns
+        if self._token is not None:
+            _ACTIVE_SPAN.reset(self._token)
+            self._token = None
+        if self.sampled:
+            self.end(
+                duration_ms=str(duration_ns // 1_000_000),
+                duration_ns=str(duration_ns),
+            )
 
     def end(self, **payload: str) -> None:
         self.recorder.record_event(
@@ -55,11 +98,193 @@ class TraceSpan:
         )
 
 
+class _NoopSpan:
+    """Shared span stand-in used when nothing should be recorded."""
+
+    sampled = False
+    span_id = "unsampled"
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        return None
+
+    def end(self, **payload: str) -> None:
+        return None
+
+
+_NOOP_SPAN = _NoopSpan()
+_ACTIVE_SPAN: ContextVar[Optional[TraceSpan]] = ContextVar(
+    "netflix_recommender_active_span", default=None
+)
+
+
+def current_span() -> Optional[TraceSpan]:
+    """Return the innermost span active in the current context."""
+    return _ACTIVE_SPAN.get()
+
+
+def child_span(name: str, **payload: str) -> Union[TraceSpan, _NoopSpan]:
+    """Open a span under the active one without threading a recorder through.
+
+    Intended for hot loops (per model, shard or batch, not per row): when no
+    span is active or the active trace was not sampled this is a
+    context-variable lookup that returns a shared no-op.
+    """
+    parent = _ACTIVE_SPAN.get()
+    if parent is None or not parent.sampled:
+        return _NOOP_SPAN
+    return parent.recorder.span(name, **payload)
+
+
+class BufferedTraceWriter:
+    """Background JSONL writer with a bounded queue and batched flushes.
+
+    Events are written by a single thread in submission order. The file is
+    opened once and flushed whenever ``batch_size`` lines are pending or
+    ``flush_interval`` seconds have passed since the oldest pending line.
+    When the queue is full new events are dropped and counted instead of
+    blocking the caller.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+        max_queue: int = 10_000,
+    ) -> None:
+        if batch_size < 1:
+            raise ValueError("batch_size must be >= 1")
+        if max_queue < 1:
+            raise ValueError("max_queue must be >= 1")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Union[str, threading.Event, object]]" = queue.Queue(
+            maxsize=max_queue
+        )
+        self._dropped = 0
+        self._written = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="trace-writer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def dropped(self) -> int:
+        return self._dropped
+
+    @property
+    def written(self) -> int:
+        return self._written
+
+    def submit(self, line: str) -> bool:
+        """Queue a serialized event; returns False when it was dropped.
+
+        Events submitted after :meth:`close` are dropped and counted too.
+        """
+        # The closed check and the enqueue share the lock, so nothing can
+        # land behind the stop sentinel that close() enqueues.
+        with self._lock:
+            if not self._closed:
+                try:
+                    self._queue.put_nowait(line)
+                    return True
+                except queue.Full:
+                    pass
+            self._dropped += 1
+            return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every event submitted so far is on disk."""
+        if self._closed or not self._thread.is_alive():
+            return True
+        marker = threading.Event()
+        self._queue.put(marker)
+        return marker.wait(timeout)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Drain pending events, close the file and stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        atexit.unregister(self.close)
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        batch: List[str] = []
+        deadline = 0.0
+        with self.path.open("a", encoding="utf-8") as handle:
+            while True:
+                timeout = (
+                    max(0.0, deadline - time.monotonic())
+                    if batch
+                    else self.flush_interval
+                )
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+                if isinstance(item, str):
+                    if not batch:
+                        deadline = time.monotonic() + self.flush_interval
+                    batch.append(item)
+                    if len(batch) < self.batch_size:
+                        continue
+                if batch:
+                    handle.write("".join(batch))
+                    handle.flush()
+                    self._written += len(batch)
+                    batch = []
+                if isinstance(item, threading.Event):
+                    item.set()
+                elif item is _STOP:
+                    return
+
+
 @dataclass
 class TraceRecorder:
     path: Path
     run_id: str
     enabled: bool = True
+    buffered: bool = False
+    batch_size: int = 256
+    flush_interval: float = 0.5
+    max_queue: int = 10_000
+    sample_rate: float = 1.0
+    _writer: Optional[BufferedTraceWriter] = field(default=None, init=False, repr=False)
+    _dir_ready: bool = field(default=False, init=False, repr=False)
+
+    @property
+    def dropped_events(self) -> int:
+        return self._writer.dropped if self._writer is not None else 0
+
+    def _get_writer(self) -> BufferedTraceWriter:
+        if self._writer is None:
+            self._writer = BufferedTraceWriter(
+                self.path,
+                batch_size=self.batch_size,
+                flush_interval=self.flush_interval,
+                max_queue=self.max_queue,
+            )
+        return self._writer
+
+    def flush(self) -> None:
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
 
     def record_event(
         self,
@@ -70,7 +295,6 @@ class TraceRecorder:
     ) -> None:
         if not self.enabled:
             return
-        self.path.parent.mkdir(parents=True, exist_ok=True)
         trace_event = TraceEvent(
             event=event,
             timestamp=time.time(),
@@ -79,42 +303,48 @@ class TraceRecorder:
             parent_id=parent_id,
             payload=payload or {},
         )
+        line = trace_event.to_json() + "\n"
+        if self.buffered:
+            self._get_writer().submit(line)
+            return
+        if not self._dir_ready:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._dir_ready = True
         with self.path.open("a", encoding="utf-8") as handle:
-            handle.write(trace_event.to_json())
-            handle.write("\n")
+            handle.write(line)
 
-    @contextmanager
     def span(
         self, name: str, parent_id: Optional[str] = None, **payload: str
-    ) -> Iterator[TraceSpan]:
+    ) -> TraceSpan:
+        """Create a span; the parent defaults to the active span of this recorder.
+
+        Sampling is decided once per trace at the root span (head-based) and
+        inherited by every descendant.
+        """
         if not self.enabled:
-            yield TraceSpan(
+            return TraceSpan(
                 self,
                 name=name,
                 span_id="disabled",
                 parent_id=parent_id,
                 start_time=time.time(),
+                sampled=False,
             )
-            return
-        span_id = uuid.uuid4().hex
-        self.record_event(
-            "span.start",
-            span_id=span_id,
-            parent_id=parent_id,
-            payload={"name": name, **payload},
-        )
-        span = TraceSpan(
+        active = _ACTIVE_SPAN.get()
+        if parent_id is None and active is not None and active.recorder is self:
+            sampled = active.sampled
+            parent_id = active.span_id if sampled else None
+        else:
+            sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        return TraceSpan(
             self,
             name=name,
-            span_id=span_id,
+            span_id=uuid.uuid4().hex if sampled else "unsampled",
             parent_id=parent_id,
             start_time=time.time(),
+            sampled=sampled,
+            payload=payload,
         )
-        try:
-            yield span
-        finally:
-            duration_ms = int((time.time() - span.start_time) * 1000)
-            span.end(duration_ms=str(duration_ms))
 
     def export_markdown(self, markdown_path: Path) -> None:
         events = self.read_events()
@@ -130,6 +360,7 @@ class TraceRecorder:
         markdown_path.write_text("\n".join(lines), encoding="utf-8")
 
     def read_events(self) -> List[TraceEvent]:
+        self.flush()
         if not self.path.exists():
             return []
         events: List[TraceEvent] = []
@@ -149,8 +380,20 @@ class TraceRecorder:
 
 
 def build_trace_recorder(
-    trace_path: Path, run_id: Optional[str] = None, enabled: bool = True
+    trace_path: Path,
+    run_id: Optional[str] = None,
+    enabled: bool = True,
+    buffered: bool = False,
+    max_queue: int = 10_000,
+    sample_rate: float = 1.0,
 ) -> TraceRecorder:
+    if not 0.0 <= sample_rate <= 1.0:
+        raise ValueError("sample_rate must be between 0 and 1")
     return TraceRecorder(
-        path=trace_path, run_id=run_id or uuid.uuid4().hex, enabled=enabled
+        path=trace_path,
+        run_id=run_id or uuid.uuid4().hex,
+        enabled=enabled,
+        buffered=buffered,
+        max_queue=max_queue,
+        sample_rate=sample_rate,
     )
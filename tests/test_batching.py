@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+
+import numpy as np
+import pytest
+from sklearn.metrics.pairwise import cosine_similarity
+
+from netflix_recommender.batching import MicroBatcher, normalize_rows, top_n_cosine
+from netflix_recommender.observability import MetricRegistry
+
+
+def test_top_n_cosine_matches_single_request_ordering():
+    rng = np.random.default_rng(0)
+    users = rng.random((6, 8))
+    items = rng.random((40, 8))
+    batched = top_n_cosine(users, normalize_rows(items), top_n=5)
+    for row, user in enumerate(users):
+        expected = cosine_similarity(user.reshape(1, -1), items).argsort()[0][-5:]
+        assert batched[row].tolist() == expected.tolist()
+
+
+def test_micro_batcher_coalesces_and_reports_metrics():
+    registry = MetricRegistry()
+    calls: list = []
+
+    def score(items: list) -> list:
+        calls.append(len(items))
+        return [item * 2 for item in items]
+
+    async def exercise() -> list:
+        async with MicroBatcher(
+            score, max_batch_size=8, max_wait_ms=50, metrics_registry=registry
+        ) as batcher:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(20)))
+
+    results = asyncio.run(exercise())
+    assert results == [i * 2 for i in range(20)]
+    assert calls == [8, 8, 4]
+    sizes = [sample.value for sample in registry.histograms["micro_batch.batch_size"]]
+    assert sizes == [8.0, 8.0, 4.0]
+    assert len(registry.histograms["micro_batch.queue_wait_ms"]) == 20
+
+
+def test_micro_batcher_propagates_errors():
+    def score(items: list) -> list:
+        raise RuntimeError("scoring failed")
+
+    async def exercise() -> None:
+        async with MicroBatcher(score, max_wait_ms=1, offload=False) as batcher:
+            await asyncio.gather(batcher.submit(1), batcher.submit(2))
+
+    with pytest.raises(RuntimeError, match="scoring failed"):
+        asyncio.run(exercise())
+
+
+def test_micro_batcher_survives_metrics_failure():
+    registry = MetricRegistry()
+    failures = [RuntimeError("metrics down")]
+    observe = registry.observe
+
+    def flaky_observe(name, value, tags=None):
+        if failures:
+            raise failures.pop()
+        observe(name, value, tags)
+
+    registry.observe = flaky_observe  # type: ignore[method-assign]
+
+    async def exercise() -> int:
+        async with MicroBatcher(
+            lambda items: items, max_wait_ms=1, offload=False, metrics_registry=registry
+        ) as batcher:
+            with pytest.raises(RuntimeError, match="metrics down"):
+                await asyncio.wait_for(batcher.submit(1), timeout=1)
+            return await asyncio.wait_for(batcher.submit(2), timeout=1)
+
+    assert asyncio.run(exercise()) == 2
+    assert registry.histograms["micro_batch.batch_size"]
+
+
+def test_micro_batcher_flushes_partial_batch_after_max_wait():
+    calls: list = []
+
+    def score(items: list) -> list:
+        calls.append(len(items))
+        return items
+
+    async def exercise() -> list:
+        async with MicroBatcher(
+            score, max_batch_size=8, max_wait_ms=20, offload=False
+        ) as batcher:
+            first = await asyncio.wait_for(
+                asyncio.gather(*(batcher.submit(i) for i in range(3))), timeout=1
+            )
+            second = await asyncio.wait_for(batcher.submit(3), timeout=1)
+            return [*first, second]
+
+    assert asyncio.run(exercise()) == [0, 1, 2, 3]
+    assert calls == [3, 1]
@@ -1,3 +1,7 @@
+import threading
+
+import pytest
+
 from netflix_recommender import config, data_pipeline, database
 
 
@@ -12,3 +16,54 @@ def test_star_schema_created(tmp_path, monkeypatch):
     assert conn.execute("SELECT COUNT(*) FROM dim_users").fetchone()[0] > 0
     assert conn.execute("SELECT COUNT(*) FROM dim_titles").fetchone()[0] > 0
     assert conn.execute("PRAGMA table_info('fact_views')").fetchall()
+
+
+def test_star_schema_uses_dense_integer_keys(tmp_path):
+    df = data_pipeline.extract_data(config.DATA_PATH)
+    conn = database.get_connection(tmp_path / "warehouse.db")
+    data_pipeline.load_raw_data(df, conn)
+    data_pipeline.build_star_schema(conn)
+
+    users = conn.execute("SELECT user_key, user_id FROM dim_users ORDER BY user_key").fetchall()
+    assert [key for key, _ in users] == list(range(len(users)))
+    assert [user for _, user in users] == sorted(df["user_id"].unique())
+    types = {row[0]: row[1] for row in conn.execute("DESCRIBE fact_views").fetchall()}
+    assert types["user_key"] == "INTEGER" and types["title_key"] == "INTEGER"
+    assert "user_id" not in types
+
+    joined = conn.execute(
+        "SELECT COUNT(*) FROM fact_views JOIN dim_users USING (user_key) JOIN dim_titles USING (title_key)"
+    ).fetchone()[0]
+    assert joined == len(df)
+
+
+def test_connection_manager_per_thread_cursors(tmp_path):
+    settings = {}
+    with database.ConnectionManager(
+        tmp_path / "pool.db",
+        threads=2,
+        memory_limit="256MB",
+        temp_directory=tmp_path / "spill",
+    ) as manager:
+        manager.connection.execute("CREATE TABLE t AS SELECT range AS x FROM range(100)")
+        main_cursor = manager.cursor()
+        assert manager.cursor() is main_cursor
+
+        def worker(name):
+            cursor = manager.cursor()
+            settings[name] = (
+                cursor,
+                cursor.execute("SELECT current_setting('threads'), SUM(x) FROM t").fetchone(),
+            )
+
+        threads = [threading.Thread(target=worker, args=(name,)) for name in "ab"]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert settings["a"][0] is not settings["b"][0]
+    assert settings["a"][1] == (2, 4950)
+    assert (tmp_path / "spill").is_dir()
+    with pytest.raises(RuntimeError):
+        manager.cursor()
@@ -13,3 +13,5 @@ def test_run_demo_creates_outputs(tmp_path: Path):
     assert (result.output_dir / "metrics.json").exists()
     assert result.trace_path.exists()
     assert result.trace_markdown_path.exists()
+    assert "Critical Path" in result.trace_analysis_path.read_text(encoding="utf-8")
+    assert result.trace_folded_path.exists()
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+import pytest
+
+from netflix_recommender.outputs import atomic_path, write_outputs
+from netflix_recommender.runtime import build_runtime_config
+
+
+def sample_recommendations() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "user_id": ["u1", "u1", "u2", "u3", "u3"],
+            "title_id": ["s2", "s1", "s3", "s1", "s4"],
+            "rank": [2, 1, 1, 1, 2],
+            "model": ["popularity"] * 5,
+        }
+    )
+
+
+def test_write_outputs_formats(tmp_path: Path):
+    frame = sample_recommendations()
+    artifacts = write_outputs(
+        frame,
+        tmp_path,
+        formats=["csv", "parquet", "json_shards"],
+        metrics={"precision_at_k": 0.5},
+        shards=2,
+    )
+    assert {artifact.format for artifact in artifacts} == {
+        "csv",
+        "parquet",
+        "json_shards",
+    }
+    assert len(pd.read_csv(tmp_path / "recommendations.csv")) == 5
+    parquet_rows = duckdb.sql(
+        f"SELECT COUNT(*) FROM '{tmp_path / 'recommendations.parquet'}'"
+    ).fetchone()[0]
+    assert parquet_rows == 5
+
+    index = json.loads((tmp_path / "dashboard" / "index.json").read_text())
+    assert index["metrics"] == {"precision_at_k": 0.5}
+    assert [entry["first_user"] for entry in index["shards"]] == ["u1", "u3"]
+    first = json.loads((tmp_path / "dashboard" / "shard-000.json").read_text())
+    assert first["recommendations"][0] == {
+        "user_id": "u1",
+        "model": "popularity",
+        "titles": ["s1", "s2"],
+    }
+    assert not [path for path in tmp_path.iterdir() if path.name.startswith(".")]
+
+
+def test_atomic_path_keeps_previous_output_on_failure(tmp_path: Path):
+    target = tmp_path / "recommendations.csv"
+    target.write_text("previous")
+    with pytest.raises(RuntimeError):
+        with atomic_path(target) as tmp:
+            tmp.write_text("partial")
+            raise RuntimeError("boom")
+    assert target.read_text() == "previous"
+    assert list(tmp_path.iterdir()) == [target]
+
+
+def test_unknown_output_format_rejected():
+    with pytest.raises(ValueError):
+        build_runtime_config(run_id="run", output_formats=["xlsx"])
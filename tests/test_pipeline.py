@@ -21,3 +21,17 @@ def test_run_pipeline(tmp_path, monkeypatch):
     conn = data_pipeline.database.get_connection(temp_db)
     count = conn.execute("SELECT COUNT(*) FROM recommendations").fetchone()[0]
     assert count == len(recommendations)
+
+
+def test_evaluate_models_counts_only_recommended_users():
+    df = data_pipeline.extract_data(config.DATA_PATH)
+    users = sorted(df["user_id"].unique())
+    recommendations = pd.DataFrame(
+        {
+            "user_id": pd.Categorical([users[0]], categories=users),
+            "title_id": ["s1"],
+            "rank": [1],
+        }
+    )
+    metrics = data_pipeline.evaluate_models(df, recommendations, top_k=1)
+    assert metrics["test_users"] == 1
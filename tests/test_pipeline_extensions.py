@@ -5,6 +5,7 @@ from pathlib import Path
 from netflix_recommender import config
 from netflix_recommender.data_pipeline import run_pipeline
 from netflix_recommender.runtime import build_runtime_config
+from netflix_recommender.snapshots import SnapshotStore
 
 
 def test_run_pipeline_with_runtime_config(tmp_path: Path):
@@ -21,6 +22,7 @@ def test_run_pipeline_with_runtime_config(tmp_path: Path):
         enable_metrics=False,
         enable_quality_checks=True,
         quality_report_path=output_dir / "quality_report.json",
+        snapshot_dir=tmp_path / "snapshots",
     )
 
     recommendations, metrics = run_pipeline(
@@ -32,3 +34,11 @@ def test_run_pipeline_with_runtime_config(tmp_path: Path):
     assert (output_dir / "summary.json").exists()
     assert (output_dir / "pipeline_report.md").exists()
     assert (output_dir / "quality_report.json").exists()
+    assert (output_dir / "warehouse_quality_report.json").exists()
+    snapshots = SnapshotStore(tmp_path / "snapshots")
+    assert snapshots.current_run_id() == "run-1"
+    assert snapshots.load("run-1").lookup(recommendations["user_id"].iloc[0]).titles
+
+    # A re-run under the same run_id keeps the immutable snapshot.
+    run_pipeline(data_path=config.DATA_PATH, runtime_config=runtime_config)
+    assert [info.run_id for info in snapshots.list_snapshots()] == ["run-1"]
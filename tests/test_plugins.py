@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import duckdb
+import numpy as np
 import pandas as pd
 
 from netflix_recommender.plugins import (
@@ -56,3 +58,92 @@ def test_ensure_required_columns_raises():
         assert "Missing required columns" in str(exc)
     else:
         raise AssertionError("Expected ValueError")
+
+
+def test_apply_all_shares_input_columns_and_leaves_input_untouched():
+    registry = build_default_registry()
+    input_df = sample_recommendations()
+    output = registry.apply_all(input_df, {"run_id": "run-1", "stage": "test"})
+
+    assert np.shares_memory(output["rank"].to_numpy(), input_df["rank"].to_numpy())
+    assert list(input_df.columns) == list(sample_recommendations().columns)
+    assert output["cold_start_flag"].tolist() == [True, False, True]
+    assert output["engagement_segment"].tolist() == ["low", "high", "medium"]
+
+
+class UndeclaredWritePlugin:
+    name = "undeclared"
+    reads = ()
+    writes = ("declared",)
+
+    def compute(self, recommendations, context):
+        return {"other": np.zeros(len(recommendations))}
+
+
+def test_apply_all_rejects_undeclared_columns():
+    registry = PluginRegistry()
+    registry.register(UndeclaredWritePlugin())
+    try:
+        registry.apply_all(sample_recommendations(), {})
+    except ValueError as exc:
+        assert "undeclared" in str(exc)
+    else:
+        raise AssertionError("Expected ValueError")
+
+
+class RequiredReadPlugin:
+    name = "required_read"
+    reads = ("view_events",)
+    writes = ("seen",)
+
+    def compute(self, recommendations, context):
+        return {"seen": recommendations["view_events"].to_numpy() > 0}
+
+
+def test_apply_all_checks_declared_reads_before_compute():
+    registry = PluginRegistry()
+    registry.register(RequiredReadPlugin())
+    try:
+        registry.apply_all(sample_recommendations().drop(columns="view_events"), {})
+    except ValueError as exc:
+        assert "required_read reads missing columns: view_events" in str(exc)
+    else:
+        raise AssertionError("Expected ValueError")
+
+
+def test_default_plugins_fall_back_when_optional_reads_are_missing():
+    recommendations = sample_recommendations().drop(
+        columns=["completion_ratio", "view_events"]
+    )
+    context = PluginContext(run_id="run-1", stage="test")
+    output = apply_plugins(recommendations, build_default_registry(), context)
+    assert output["engagement_segment"].tolist() == ["unknown"] * 3
+    assert output["cold_start_flag"].tolist() == [False] * 3
+
+
+def test_warehouse_enrichment_joins_feature_tables():
+    conn = duckdb.connect()
+    conn.execute(
+        "CREATE TABLE feat_title_popularity AS "
+        "SELECT * FROM (VALUES ('s1', 5, 0.9), ('s2', 1, 0.3)) "
+        "AS t(title_id, view_events, avg_completion)"
+    )
+    conn.execute(
+        "CREATE TABLE feat_user_engagement AS "
+        "SELECT * FROM (VALUES ('u1', 0.8, 120.0)) "
+        "AS t(user_id, avg_completion, total_watch_time)"
+    )
+    recommendations = pd.DataFrame(
+        {"user_id": ["u1", "u2", "u1"], "title_id": ["s2", "s1", "s9"]}
+    )
+
+    output = apply_plugins(
+        recommendations,
+        build_default_registry(conn),
+        PluginContext(run_id="run-1", stage="test"),
+    )
+
+    assert output["view_events"].tolist() == [1, 5, 0]
+    assert output["cold_start_flag"].tolist() == [True, False, True]
+    assert output["engagement_segment"].tolist()[0] == "high"
+    assert pd.isna(output.loc[1, "completion_ratio"])
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from netflix_recommender import config
+from netflix_recommender.data_pipeline import run_pipeline
+from netflix_recommender.profiling import StageProfiler, profile_import
+from netflix_recommender.runtime import build_runtime_config
+
+
+def test_stage_profiler_records_cpu_and_allocations(tmp_path: Path):
+    profiler = StageProfiler(tmp_path / "profiles")
+
+    with profiler.profile("allocate"):
+        payload = [str(index) for index in range(50_000)]
+    del payload
+
+    (profile,) = profiler.profiles
+    assert profile.stage == "allocate"
+    assert profile.wall_ms >= 0 and profile.cpu_ms >= 0
+    assert profile.py_alloc_peak_bytes > 0
+    assert Path(profile.profile_path).exists()
+    assert profile.top_functions
+
+
+def test_nested_profiles_fold_into_outer_stage(tmp_path: Path):
+    profiler = StageProfiler(tmp_path)
+    with profiler.profile("outer"):
+        with profiler.profile("inner"):
+            pass
+    assert [profile.stage for profile in profiler.profiles] == ["outer"]
+
+
+def test_pipeline_writes_stage_profiles(tmp_path: Path):
+    output_dir = tmp_path / "outputs"
+    runtime_config = build_runtime_config(
+        run_id="run-1",
+        output_dir=output_dir,
+        db_path=tmp_path / "pipeline.db",
+        trace_path=output_dir / "traces" / "trace.jsonl",
+        enable_tracing=True,
+        enable_profiling=True,
+    )
+
+    run_pipeline(data_path=config.DATA_PATH, runtime_config=runtime_config)
+
+    summary = json.loads(
+        (output_dir / "traces" / "profiles" / "profiles.json").read_text()
+    )
+    stages = {entry["stage"] for entry in summary}
+    assert {"extract", "train_models", "evaluate"} <= stages
+    assert (output_dir / "traces" / "profiles" / "train_models.prof").exists()
+    report = (output_dir / "pipeline_report.md").read_text(encoding="utf-8")
+    assert "## Stage Profiles" in report
+
+
+def test_entry_points_import_without_pandas_or_duckdb():
+    package = profile_import("netflix_recommender")
+    assert package.error is None and package.total_ms > 0
+    assert not package.loaded("netflix_recommender.database")
+
+    for module in ("netflix_recommender.runtime", "netflix_recommender.snapshots"):
+        profile = profile_import(module)
+        assert profile.error is None
+        assert module in profile.imported
+        assert not profile.loaded("pandas") and not profile.loaded("duckdb")
+
+    database = profile_import("netflix_recommender.database")
+    assert database.loaded("duckdb") and not database.loaded("pandas")
+
+    pipeline = profile_import("netflix_recommender.data_pipeline", top_n=3)
+    assert pipeline.loaded("duckdb") and len(pipeline.heaviest) == 3
+    assert profile_import("netflix_recommender.missing").error
+
+
+def test_package_submodules_load_on_attribute_access():
+    import netflix_recommender
+
+    assert netflix_recommender.rollups.COVERAGE_ROLLUP == "rollup_model_coverage"
+    assert "sql_runner" in dir(netflix_recommender)
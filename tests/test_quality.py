@@ -1,8 +1,15 @@
 from __future__ import annotations
 
+from datetime import datetime, timedelta
+
+import duckdb
 import pandas as pd
 
-from netflix_recommender.quality import DataQualityConfig, run_quality_checks
+from netflix_recommender.quality import (
+    DataQualityConfig,
+    run_quality_checks,
+    run_quality_checks_sql,
+)
 
 
 def test_quality_checks_pass():
@@ -29,3 +36,86 @@ def test_quality_checks_fail_for_missing_columns():
     report = run_quality_checks(df, config, dataset="raw")
     assert not report.passed()
     assert any(check.name == "required_columns" for check in report.checks)
+
+
+def test_sql_quality_engine_covers_all_checks():
+    conn = duckdb.connect()
+    conn.execute(
+        "CREATE TABLE dim_titles AS SELECT * FROM (VALUES ('s1'), ('s2')) t(title_id)"
+    )
+    conn.execute(
+        "CREATE TABLE fact_views AS SELECT * FROM (VALUES "
+        "('u1', 's1', TIMESTAMP '2024-01-02', 0.5), "
+        "('u1', 's9', TIMESTAMP '2024-01-03', 1.5), "
+        "(NULL, 's2', TIMESTAMP '2024-01-01', 0.2)"
+        ") t(user_id, title_id, timestamp, completion_ratio)"
+    )
+    config = DataQualityConfig(
+        min_rows=1,
+        required_columns=["user_id", "device_type"],
+        numeric_ranges={"completion_ratio": (0.0, 1.0)},
+        not_null_columns=["user_id"],
+        unique_columns=["title_id"],
+        foreign_keys={"title_id": ("dim_titles", "title_id")},
+        freshness_column="timestamp",
+        max_staleness=timedelta(days=1),
+        reference_time=datetime(2024, 1, 3, 12),
+    )
+
+    report = run_quality_checks_sql(conn, "fact_views", config)
+    results = {check.name: check for check in report.checks}
+
+    assert results["min_rows"].message == "row_count=3"
+    assert results["required_columns"].message == "missing: device_type"
+    assert results["range:completion_ratio"].message == "out_of_bounds=1"
+    assert results["not_null:user_id"].message == "nulls=1"
+    assert results["unique:title_id"].passed
+    assert results["foreign_key:title_id->dim_titles.title_id"].message == "orphans=1"
+    assert results["freshness:timestamp"].passed
+
+
+def test_quality_checks_report_frames_without_columns():
+    config = DataQualityConfig(
+        min_rows=1,
+        required_columns=["user_id"],
+        numeric_ranges={"completion_ratio": (0.0, 1.0)},
+        not_null_columns=["user_id"],
+    )
+    report = run_quality_checks(pd.DataFrame(), config, dataset="raw")
+    assert [(check.name, check.passed, check.message) for check in report.checks] == [
+        ("min_rows", False, "row_count=0 < 1"),
+        ("required_columns", False, "missing: user_id"),
+        ("range:completion_ratio", False, "column missing"),
+        ("not_null:user_id", False, "column missing"),
+    ]
+
+
+def test_frame_checks_report_out_of_bounds():
+    df = pd.DataFrame({"completion_ratio": [0.5, 1.2, None]})
+    config = DataQualityConfig(numeric_ranges={"completion_ratio": (0.0, 1.0)})
+    report = run_quality_checks(df, config, dataset="raw")
+    assert not report.passed()
+    assert report.checks[-1].message == "out_of_bounds=1"
+
+
+def test_range_checks_accept_open_bounds():
+    df = pd.DataFrame({"x": [1.0, 250.0]})
+    config = DataQualityConfig(numeric_ranges={"x": (0, float("inf"))})
+    assert run_quality_checks(df, config, dataset="raw").passed()
+
+
+def test_freshness_handles_timezone_aware_columns():
+    conn = duckdb.connect()
+    conn.execute(
+        "CREATE TABLE events AS "
+        "SELECT TIMESTAMPTZ '2024-01-03 10:00:00+00' AS updated_at"
+    )
+    config = DataQualityConfig(
+        freshness_column="updated_at", max_staleness=timedelta(days=1)
+    )
+    # Defaults to now(), long after the only event.
+    (default,) = run_quality_checks_sql(conn, "events", config).checks[1:]
+    assert not default.passed
+    config.reference_time = datetime(2024, 1, 3, 12)
+    (check,) = run_quality_checks_sql(conn, "events", config).checks[1:]
+    assert check.passed and check.message.startswith("latest=2024-01-03")
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import duckdb
+
+from netflix_recommender import config
+from netflix_recommender.data_pipeline import run_pipeline
+from netflix_recommender.quality import DataQualityConfig
+from netflix_recommender.quality_drift import (
+    HistogramSketch,
+    QualityState,
+    build_column_sketches,
+    run_incremental_quality_checks,
+)
+from netflix_recommender.runtime import build_runtime_config
+
+CONFIG = DataQualityConfig(
+    min_rows=0,
+    numeric_ranges={"completion_ratio": (0.0, 1.0)},
+    not_null_columns=["user_id"],
+)
+
+
+def append_views(conn, day: int, low: float, high: float, rows: int = 500) -> None:
+    conn.execute(f"""
+        INSERT INTO fact_views
+        SELECT 'u' || (i % 97), TIMESTAMP '2024-01-01' + INTERVAL {day} DAY + INTERVAL (i) SECOND,
+               {low} + ({high} - {low}) * (i % 100) / 100.0
+        FROM range({rows}) AS r(i)
+        """)
+
+
+def make_table():
+    conn = duckdb.connect()
+    conn.execute(
+        "CREATE TABLE fact_views (user_id VARCHAR, timestamp TIMESTAMP, completion_ratio DOUBLE)"
+    )
+    return conn
+
+
+def test_column_sketch_estimates_distinct_users():
+    conn = duckdb.connect()
+    conn.execute("CREATE VIEW ids AS SELECT i AS user_id FROM range(50000) r(i)")
+    layouts = {"user_id": HistogramSketch(0.0, 1.0, 4)}
+
+    sketch = build_column_sketches(conn, "ids", layouts)["user_id"]
+    assert abs(sketch.hll.estimate() - 50_000) / 50_000 < 0.05
+
+
+def test_incremental_checks_only_scan_new_rows_and_flag_drift(tmp_path: Path):
+    state_path = tmp_path / "quality_state.json"
+    conn = make_table()
+    append_views(conn, day=0, low=0.2, high=1.0)
+
+    first = run_incremental_quality_checks(
+        conn, "fact_views", CONFIG, state_path, drift_columns=["completion_ratio"]
+    )
+    assert first.checks[0].message == "row_count=500"
+    assert not any(check.name.startswith("drift:") for check in first.checks)
+
+    append_views(conn, day=1, low=0.2, high=1.0)
+    stable = run_incremental_quality_checks(
+        conn, "fact_views", CONFIG, state_path, drift_columns=["completion_ratio"]
+    )
+    checks = {check.name: check for check in stable.checks}
+    assert checks["min_rows"].message == "row_count=500"
+    assert checks["sample:min_rows"].message == "row_count=1000"
+    assert checks["drift:completion_ratio"].passed
+
+    append_views(conn, day=2, low=0.0, high=0.2)
+    drifted = run_incremental_quality_checks(
+        conn, "fact_views", CONFIG, state_path, drift_columns=["completion_ratio"]
+    )
+    checks = {check.name: check for check in drifted.checks}
+    assert not checks["drift:completion_ratio"].passed
+
+    state = QualityState.load(state_path)
+    assert state.sketches["completion_ratio"].rows == 1500
+    assert str(state.watermark).startswith("2024-01-03")
+
+
+def test_pipeline_incremental_quality_mode_persists_state(tmp_path: Path):
+    output_dir = tmp_path / "outputs"
+    runtime_config = build_runtime_config(
+        run_id="run-1",
+        output_dir=output_dir,
+        db_path=tmp_path / "pipeline.db",
+        enable_quality_checks=True,
+        quality_mode="incremental",
+    )
+
+    state_path = output_dir / "quality_state.json"
+    run_pipeline(data_path=config.DATA_PATH, runtime_config=runtime_config)
+    history = {
+        column: sketch.rows
+        for column, sketch in QualityState.load(state_path).sketches.items()
+    }
+    assert history and all(rows > 0 for rows in history.values())
+    # The rerun finds no rows past the watermark.
+    run_pipeline(data_path=config.DATA_PATH, runtime_config=runtime_config)
+
+    report = json.loads((output_dir / "warehouse_quality_report.json").read_text())
+    assert report["dataset"] == "fact_views[increment]"
+    assert report["checks"][0]["message"] == "row_count=0"
+    assert all(check["passed"] for check in report["checks"])
+    state = QualityState.load(state_path)
+    assert state.watermark
+    assert {column: sketch.rows for column, sketch in state.sketches.items()} == history
@@ -1,4 +1,8 @@
+import numpy as np
+import pandas as pd
+
 from netflix_recommender import config, data_pipeline, database, recommenders
+from netflix_recommender.tracing import build_trace_recorder
 
 
 def test_recommenders_produce_results(tmp_path, monkeypatch):
@@ -16,3 +20,66 @@ def test_recommenders_produce_results(tmp_path, monkeypatch):
     assert not cf.empty
     assert set(pop.columns) == {"user_id", "title_id", "rank", "model"}
     assert set(cf.columns) == {"user_id", "title_id", "rank", "model"}
+
+
+def test_user_cf_traces_one_span_per_stage(tmp_path):
+    conn = database.get_connection(tmp_path / "rec.db")
+    data_pipeline.load_raw_data(data_pipeline.extract_data(config.DATA_PATH), conn)
+    data_pipeline.build_star_schema(conn)
+    recorder = build_trace_recorder(tmp_path / "trace.jsonl", run_id="run-1")
+
+    with recorder.span("train"):
+        recommenders.user_based_cf(conn, top_k=2)
+
+    starts = [
+        event.payload
+        for event in recorder.read_events()
+        if event.event == "span.start" and event.payload["name"].startswith("user_cf")
+    ]
+    assert [payload["name"] for payload in starts] == ["user_cf.similarity", "user_cf.rank"]
+    users = conn.execute("SELECT COUNT(*) FROM dim_users").fetchone()[0]
+    assert 0 < int(starts[1]["users"]) <= users
+
+
+def test_candidate_policy_fills_top_k_with_allowed_titles(tmp_path):
+    df = data_pipeline.extract_data(config.DATA_PATH)
+    ratings = {"s1": "TV-MA", "s2": "G", "s3": "PG", "s4": "R", "s5": "TV-Y"}
+    df["content_rating"] = df["show_id"].map(ratings)
+    conn = database.get_connection(tmp_path / "rec.db")
+    data_pipeline.load_raw_data(df, conn)
+    data_pipeline.build_star_schema(conn)
+    masks = data_pipeline.load_profile_item_masks(conn)
+
+    recs = data_pipeline.train_models(conn, top_k=3, item_masks=masks)
+
+    kids = recs[recs["user_id"].isin(["u1", "u3", "u8"])]
+    assert set(kids["title_id"]) <= {"s2", "s3", "s5"}
+    kids_popularity = kids[kids["model"] == "popularity"]
+    assert kids_popularity.groupby("user_id", observed=True).size().eq(3).all()
+    main_popularity = recs[(recs["user_id"] == "u2") & (recs["model"] == "popularity")]
+    assert "s1" in set(main_popularity["title_id"])
+
+
+def test_interactions_are_int32_coded_and_match_pivot(tmp_path):
+    df = data_pipeline.extract_data(config.DATA_PATH)
+    conn = database.get_connection(tmp_path / "rec.db")
+    data_pipeline.load_raw_data(df, conn)
+    data_pipeline.build_star_schema(conn)
+
+    interactions = recommenders.load_interactions(conn)
+    assert interactions.user_codes.dtype == np.int32
+    assert interactions.title_codes.dtype == np.int32
+
+    frame = conn.execute(
+        "SELECT user_id, title_id, completion_ratio FROM fact_views JOIN dim_users USING (user_key) JOIN dim_titles USING (title_key)"
+    ).df()
+    pivot = frame.pivot_table(index="user_id", columns="title_id", values="completion_ratio", fill_value=0)
+    assert list(pivot.index) == interactions.user_ids.tolist()
+    assert list(pivot.columns) == interactions.title_ids.tolist()
+    np.testing.assert_allclose(interactions.dense_matrix(), pivot.to_numpy())
+
+    recs = data_pipeline.train_models(conn, top_k=2)
+    assert isinstance(recs["user_id"].dtype, pd.CategoricalDtype)
+    database.write_dataframe(conn, recs, "recommendations")
+    types = dict(conn.execute("SELECT column_name, data_type FROM duckdb_columns() WHERE table_name = 'recommendations'").fetchall())
+    assert types["user_id"] == "VARCHAR"
@@ -2,10 +2,12 @@ from __future__ import annotations
 
 from pathlib import Path
 
+import duckdb
 import pandas as pd
 
 from netflix_recommender.reporting import (
     build_summary,
+    build_summary_sql,
     list_output_files,
     write_markdown_report,
     write_summary,
@@ -46,3 +48,15 @@ def test_list_output_files(tmp_path: Path):
     (tmp_path / "b.txt").write_text("b")
     files = list_output_files(tmp_path)
     assert len(files) == 2
+
+
+def test_sql_summary_matches_frame():
+    frame = sample_recommendations()
+    expected = build_summary(frame)
+
+    conn = duckdb.connect()
+    conn.register("recommendations", frame)
+    assert build_summary_sql(conn) == expected
+    approximate = build_summary_sql(conn, approximate=True)
+    assert approximate.total_rows == 3
+    assert approximate.unique_users == 2
@@ -0,0 +1,137 @@
+import json
+
+import pandas as pd
+
+from netflix_recommender import database, rollups
+
+ENGAGEMENT = """
+    SELECT CAST(timestamp AS DATE) AS day, COUNT(DISTINCT user_key), COUNT(*),
+           SUM(watch_time_minutes), SUM(completion_ratio), COUNT(completion_ratio)
+    FROM fact_views GROUP BY day ORDER BY day
+"""
+
+
+def _views(rows):
+    return pd.DataFrame(
+        rows,
+        columns=[
+            "user_key",
+            "timestamp",
+            "device_type",
+            "watch_time_minutes",
+            "completion_ratio",
+        ],
+    ).astype({"timestamp": "datetime64[us]"})
+
+
+def test_daily_rollups_refresh_only_new_days(tmp_path):
+    conn = database.get_connection(tmp_path / "rollups.db")
+    history = _views(
+        [
+            (0, "2024-01-01 08:00", "TV", 30, 0.5),
+            (1, "2024-01-01 09:00", "TV", 10, 0.25),
+            (0, "2024-01-02 10:00", "Mobile", 5, 1.0),
+        ]
+    )
+    database.write_dataframe(conn, history, "fact_views")
+
+    first = rollups.refresh_daily_rollups(conn)
+    assert [refresh.mode for refresh in first] == ["full", "full"]
+    assert rollups.refresh_daily_rollups(conn)[0].mode == "unchanged"
+
+    # A later row for the last rolled-up day plus a new day.
+    increment = _views(
+        [
+            (2, "2024-01-02 22:00", "TV", 20, None),
+            (1, "2024-01-03 07:00", "Tablet", 15, 0.75),
+        ]
+    )
+    database.write_dataframe(conn, increment, "fact_views", mode="append")
+    conn.execute(
+        "UPDATE rollup_daily_engagement SET views = -1 WHERE day = '2024-01-01'"
+    )
+
+    refreshed = rollups.refresh_daily_rollups(conn)
+    assert refreshed[0].mode == "incremental"
+    assert refreshed[0].since == "2024-01-02"
+    assert refreshed[0].rows == 2
+    # 2024-01-01 was not recomputed, so the marker survives.
+    rolled = conn.execute(
+        "SELECT * FROM rollup_daily_engagement ORDER BY day"
+    ).fetchall()
+    assert rolled[0][2] == -1
+    assert rolled[1:] == conn.execute(ENGAGEMENT).fetchall()[1:]
+    devices = conn.execute(
+        "SELECT device_type, SUM(watch_minutes) FROM rollup_daily_device "
+        "GROUP BY device_type ORDER BY device_type"
+    ).fetchall()
+    assert devices == [("Mobile", 5), ("TV", 60), ("Tablet", 15)]
+
+
+def test_daily_rollups_rebuild_when_history_is_rewritten(tmp_path):
+    conn = database.get_connection(tmp_path / "rollups.db")
+    rows = [
+        (0, "2024-01-01 08:00", "TV", 30, 0.5),
+        (1, "2024-01-01 09:00", "TV", 10, 0.25),
+        (0, "2024-01-02 10:00", "Mobile", 5, 1.0),
+    ]
+    database.write_dataframe(conn, _views(rows), "fact_views")
+    rollups.refresh_daily_rollups(conn)
+
+    # A pipeline rerun rebuilds fact_views: one row corrected, one removed.
+    corrected = [(0, "2024-01-01 08:00", "TV", 45, 0.5), rows[2]]
+    database.write_dataframe(conn, _views(corrected), "fact_views")
+    refreshed = rollups.refresh_daily_rollups(conn)
+
+    assert [refresh.mode for refresh in refreshed] == ["full", "full"]
+    rolled = conn.execute("SELECT * FROM rollup_daily_engagement ORDER BY day")
+    assert rolled.fetchall() == conn.execute(ENGAGEMENT).fetchall()
+    assert rollups.refresh_daily_rollups(conn)[0].mode == "unchanged"
+
+
+def test_daily_rollups_ignore_renumbered_user_keys(tmp_path):
+    conn = database.get_connection(tmp_path / "rollups.db")
+    rows = [
+        (0, "2024-01-01 08:00", "TV", 30, 0.5),
+        (1, "2024-01-01 09:00", "TV", 10, 0.25),
+    ]
+    database.write_dataframe(conn, _views(rows), "fact_views")
+    rollups.refresh_daily_rollups(conn)
+
+    # A new user sorting first shifts every existing key by one.
+    renumbered = [(key + 1, *rest) for key, *rest in rows]
+    renumbered.append((0, "2024-01-02 10:00", "Mobile", 5, 1.0))
+    database.write_dataframe(conn, _views(renumbered), "fact_views")
+    refreshed = rollups.refresh_daily_rollups(conn)
+
+    assert [refresh.mode for refresh in refreshed] == ["incremental", "incremental"]
+    rolled = conn.execute("SELECT * FROM rollup_daily_engagement ORDER BY day")
+    assert rolled.fetchall() == conn.execute(ENGAGEMENT).fetchall()
+
+
+def test_coverage_rollup_follows_recommendations_version(tmp_path):
+    conn = database.get_connection(tmp_path / "rollups.db")
+    database.write_dataframe(
+        conn, _views([(0, "2024-01-01", "TV", 1, 1.0)]), "fact_views"
+    )
+    recs = pd.DataFrame(
+        {
+            "user_id": ["u1", "u1", "u2"],
+            "title_id": ["s1", "s2", "s1"],
+            "rank": [1, 2, 1],
+            "model": ["popularity", "popularity", "user_cf"],
+        }
+    )
+    database.write_dataframe(conn, recs, "recommendations")
+
+    assert rollups.refresh_rollups(conn)[-1].mode == "full"
+    assert rollups.refresh_coverage_rollup(conn).mode == "unchanged"
+    database.write_dataframe(conn, recs.head(2), "recommendations")
+    assert rollups.refresh_coverage_rollup(conn).mode == "full"
+
+    path = rollups.export_dashboard_rollups(conn, tmp_path / "engagement.json")
+    payload = json.loads(path.read_text())
+    assert payload["coverage"] == [
+        {"model": "popularity", "users_covered": 1, "total_rows": 2}
+    ]
+    assert payload["daily"][0]["day"] == "2024-01-01"
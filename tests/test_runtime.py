@@ -3,7 +3,7 @@ from __future__ import annotations
 from pathlib import Path
 
 from netflix_recommender import config
-from netflix_recommender.runtime import build_runtime_config
+from netflix_recommender.runtime import build_runtime_config, runtime_from_env
 
 
 def test_build_runtime_config_defaults(tmp_path: Path):
@@ -20,3 +20,9 @@ def test_build_runtime_config_overrides(tmp_path: Path):
     )
     assert runtime_config.output_dir == output_dir
     assert runtime_config.db_path == db_path
+
+
+def test_runtime_from_env_enables_approximate_summary(monkeypatch):
+    assert not runtime_from_env("run-3").approximate_summary
+    monkeypatch.setenv("NETFLIX_REC_APPROX_SUMMARY", "1")
+    assert runtime_from_env("run-3").approximate_summary
@@ -49,3 +49,37 @@ def test_enforce_policy_no_rating_column():
     recommendations = pd.DataFrame({"user_id": ["u1"], "title_id": ["s1"]})
     output = enforce_policy(recommendations, policy, enabled=True)
     assert output.loc[0, "policy_reason"] == "no-rating-column"
+
+
+def test_compiled_policy_matches_row_evaluation():
+    policy = SafetyPolicy(
+        rules=[
+            SafetyRule(name="kids", description="", allowed_ratings=["G", "TV-Y"]),
+            SafetyRule(name="teens", description="", allowed_ratings=["PG-13", "G"]),
+        ],
+        allow_unknown=False,
+    )
+    ratings = ["G", "TV-Y", "PG-13", "TV-MA", None, "R", "G"]
+    output = policy.apply(pd.DataFrame({"content_rating": ratings}))
+
+    expected = [policy.evaluate_rating(rating) for rating in ratings]
+    assert output["policy_allowed"].tolist() == [item.allowed for item in expected]
+    assert output["policy_reason"].tolist() == [item.reason for item in expected]
+
+
+def test_compiled_policy_without_rules_allows_everything():
+    output = SafetyPolicy().apply(pd.DataFrame({"content_rating": ["R", "G"]}))
+    assert output["policy_allowed"].all()
+    assert set(output["policy_reason"]) == {"no-rules"}
+
+
+def test_compiled_policy_handles_categorical_ratings():
+    policy = build_default_policy()
+    ratings = pd.Series(["PG", "R", None, "G"], dtype="category")
+    output = policy.apply(pd.DataFrame({"content_rating": ratings}))
+    assert output["policy_reason"].tolist() == [
+        "family_friendly",
+        "unknown-rating-allowed",
+        "unknown-rating-allowed",
+        "family_friendly",
+    ]
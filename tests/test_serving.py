@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import duckdb
+import pandas as pd
+
+from netflix_recommender.serving import (
+    RecommendationIndex,
+    RecommendationService,
+    benchmark_service,
+    start_http_server,
+)
+
+
+def build_index() -> RecommendationIndex:
+    conn = duckdb.connect()
+    conn.register(
+        "recommendations",
+        pd.DataFrame(
+            {
+                "user_id": ["u2", "u1", "u1", "u2", "u3", "u3"],
+                "title_id": ["s1", "s2", "s1", "s3", "s9", "s3"],
+                "rank": [1, 2, 1, 1, 1, 2],
+                "model": [
+                    "user_cf",
+                    "user_cf",
+                    "user_cf",
+                    "popularity",
+                    "popularity",
+                    "popularity",
+                ],
+            }
+        ),
+    )
+    return RecommendationIndex.from_connection(conn)
+
+
+def test_index_prefers_first_model_and_falls_back():
+    index = build_index()
+    assert len(index) == 3
+    assert index.offsets.tolist() == [0, 2, 3, 5]
+
+    known = index.lookup("u1")
+    assert known.titles == ["s1", "s2"]
+    assert known.source == "user_cf"
+    assert index.lookup("u3").source == "popularity"
+
+    unknown = index.lookup("new-user", k=1)
+    assert unknown.source == "fallback"
+    assert unknown.titles == ["s3"]
+
+
+def test_service_routes_and_caches():
+    service = RecommendationService(build_index(), cache_size=8)
+    status, body = service.handle("GET", "/recommendations/u1?k=1")
+    assert status == 200
+    assert json.loads(body)["titles"] == ["s1"]
+    service.handle("GET", "/recommendations/u1?k=1")
+    assert service.cache_stats()["hits"] == 1
+
+    assert service.handle("GET", "/recommendations/u1?k=x")[0] == 400
+    assert service.handle("GET", "/other")[0] == 404
+    assert service.handle("POST", "/recommendations/u1")[0] == 405
+
+    report = benchmark_service(service, requests=200)
+    assert report.requests == 200
+    assert report.p99_us >= report.p50_us
+
+
+def test_http_front_end_keeps_connection_alive():
+    service = RecommendationService(build_index())
+
+    async def exercise() -> list:
+        server = await start_http_server(service, port=0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            bodies = []
+            for user in ("u2", "nobody"):
+                writer.write(f"GET /recommendations/{user} HTTP/1.1\r\n\r\n".encode())
+                await writer.drain()
+                headers = {}
+                while (line := await reader.readline()) != b"\r\n":
+                    name, _, value = line.decode().partition(":")
+                    headers[name.lower()] = value.strip()
+                body = await reader.readexactly(int(headers["content-length"]))
+                bodies.append(json.loads(body))
+            writer.close()
+            return bodies
+
+    bodies = asyncio.run(exercise())
+    assert bodies[0]["source"] == "user_cf"
+    assert bodies[1]["source"] == "fallback"
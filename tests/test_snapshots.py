@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from netflix_recommender.serving import RecommendationIndex
+from netflix_recommender.snapshots import SnapshotServer, SnapshotStore
+
+
+def build_index(title: str) -> RecommendationIndex:
+    return RecommendationIndex.from_arrays(
+        user_ids=["u9", "u9", "u10", "u2"],
+        title_ids=[title, "s2", "s3", "s4"],
+        sources=[0, 0, 1, 0],
+        fallback_titles=["s4", title],
+    )
+
+
+def test_publish_and_mmap_load(tmp_path: Path):
+    store = SnapshotStore(tmp_path)
+    info = store.publish(build_index("s1"), "run-1")
+    assert info.users == 3
+    assert store.current_run_id() == "run-1"
+
+    loaded = store.load("run-1")
+    assert isinstance(loaded.offsets, np.memmap)
+    assert loaded.lookup("u9").titles == ["s1", "s2"]
+    assert loaded.lookup("u10").source == "popularity"
+    assert loaded.lookup("u1").source == "fallback"
+    assert loaded.lookup("u1", k=1).titles == ["s4"]
+
+    with pytest.raises(FileExistsError):
+        store.publish(build_index("s1"), "run-1")
+
+
+def test_server_hot_swaps_and_reclaims_after_last_reader(tmp_path: Path):
+    store = SnapshotStore(tmp_path)
+    store.publish(build_index("s1"), "run-1")
+    server = SnapshotServer(store)
+    assert server.handle("GET", "/recommendations/u9")[1].startswith(b'{"user_id"')
+
+    with server.acquire() as old_service:
+        store.publish(build_index("s7"), "run-2")
+        assert server.refresh()
+        assert server.run_id == "run-2"
+        # The in-flight request still sees, and pins, the old snapshot.
+        assert old_service.index.lookup("u9").titles[0] == "s1"
+        assert (tmp_path / "run-1").exists()
+
+    assert not (tmp_path / "run-1").exists()
+    with server.acquire() as service:
+        assert service.index.lookup("u9").titles[0] == "s7"
+    assert not server.refresh()
+
+
+def test_concurrent_readers_during_swap(tmp_path: Path):
+    store = SnapshotStore(tmp_path)
+    store.publish(build_index("s1"), "run-1")
+    server = SnapshotServer(store)
+    errors: list = []
+
+    def reader() -> None:
+        for _ in range(500):
+            status, _ = server.handle("GET", "/recommendations/u9")
+            if status != 200:
+                errors.append(status)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for run in range(2, 6):
+        store.publish(build_index(f"s{run}"), f"run-{run}")
+        server.refresh()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert [info.run_id for info in store.list_snapshots()] == ["run-5"]
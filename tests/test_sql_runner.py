@@ -0,0 +1,52 @@
+import duckdb
+import pandas as pd
+
+from netflix_recommender import database
+from netflix_recommender.sql_runner import SqlRunner
+
+SQL = """
+-- Views per device; the literal below must not split the statement
+SELECT device, COUNT(*) AS views, 'a;b' AS note FROM events GROUP BY device ORDER BY device;
+SELECT SUM(minutes) AS minutes FROM events;
+CREATE OR REPLACE TABLE long_views AS SELECT * FROM events WHERE minutes > 10;
+SELECT COUNT(*) AS n FROM long_views; -- trailing comment
+"""
+
+
+def test_split_statements_respects_string_literals():
+    statements = database.split_statements("SELECT ';' AS x; SELECT 2;")
+    assert statements == ["SELECT ';' AS x", "SELECT 2;"]
+
+
+def test_sql_runner_streams_results_and_caches_by_table_version(tmp_path):
+    events = pd.DataFrame({"device": ["tv", "tv", "mobile"], "minutes": [30, 5, 12]})
+    with database.ConnectionManager(tmp_path / "sql.db") as manager:
+        database.write_dataframe(manager.connection, events, "events")
+        runner = SqlRunner(manager, tmp_path / "results", max_workers=2)
+
+        first = runner.run(SQL)
+        assert [result.statement for result in first] == [0, 1, 2, 3]
+        assert first[2].path is None
+        assert not any(result.cached for result in first)
+        by_device = duckdb.read_parquet(str(first[0].path)).df()
+        assert by_device.to_dict("list") == {
+            "device": ["mobile", "tv"],
+            "views": [1, 2],
+            "note": ["a;b", "a;b"],
+        }
+        assert first[3].rows == 1
+
+        # The CREATE barrier re-versions every table, so a rerun of the file
+        # never hits the cache; the reads alone do once nothing changes.
+        second = runner.run(SQL)
+        assert not any(result.cached for result in second)
+        reads = SQL.split("CREATE")[0]
+        runner.run(reads)
+        cached = runner.run(reads)
+        assert [result.cached for result in cached] == [True, True]
+        assert cached[0].rows == 2
+
+        database.write_dataframe(manager.connection, events.head(1), "events")
+        fresh = runner.run(reads)
+        assert [result.cached for result in fresh] == [False, False]
+        assert fresh[0].rows == 1
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from netflix_recommender.trace_analysis import (
+    analyze_trace,
+    collapsed_stacks,
+    compare_traces,
+    critical_path,
+    main,
+    stage_stats,
+    write_collapsed_stacks,
+)
+
+
+def write_trace(
+    path: Path,
+    spans: list[tuple[str, str, str | None, float, int]],
+    run_id: str = "run-1",
+):
+    """Append start/end events for ``(span_id, name, parent, start_s, duration_ms)``."""
+    lines = []
+    for span_id, name, parent_id, start, duration_ms in spans:
+        for event, timestamp, payload in (
+            ("span.start", start, {"name": name}),
+            (
+                "span.end",
+                start + duration_ms / 1000,
+                {"name": name, "duration_ns": str(duration_ms * 1_000_000)},
+            ),
+        ):
+            lines.append(
+                json.dumps(
+                    {
+                        "event": event,
+                        "timestamp": timestamp,
+                        "run_id": run_id,
+                        "span_id": span_id,
+                        "parent_id": parent_id,
+                        "payload": payload,
+                    }
+                )
+            )
+    with path.open("a", encoding="utf-8") as handle:
+        handle.write("\n".join(lines) + "\n")
+
+
+def sample_spans(train_ms: int = 60) -> list[tuple[str, str, str | None, float, int]]:
+    return [
+        ("root", "pipeline", None, 0.0, 100 + train_ms),
+        ("a", "extract", "root", 0.0, 20),
+        ("b", "train_models", "root", 0.03, train_ms),
+        ("c", "model.user_cf", "b", 0.03, train_ms - 10),
+    ]
+
+
+def test_stage_stats_split_total_and_self_time(tmp_path: Path):
+    trace_path = tmp_path / "trace.jsonl"
+    write_trace(trace_path, sample_spans())
+
+    stats = stage_stats(analyze_trace(trace_path))
+    assert stats["pipeline"].total_ms == 160
+    assert stats["pipeline"].self_ms == 80
+    assert stats["train_models"].self_ms == 10
+
+
+def test_critical_path_and_collapsed_stacks(tmp_path: Path):
+    trace_path = tmp_path / "trace.jsonl"
+    write_trace(trace_path, sample_spans())
+    tree = analyze_trace(trace_path)
+
+    names = [node.name for node in critical_path(tree)]
+    assert names == ["pipeline", "extract", "train_models", "model.user_cf"]
+    stacks = collapsed_stacks(tree)
+    assert stacks["pipeline;train_models;model.user_cf"] == 50_000
+
+    folded = tmp_path / "trace.folded"
+    write_collapsed_stacks(tree, folded)
+    assert "pipeline;extract 20000" in folded.read_text(encoding="utf-8")
+
+
+def test_compare_traces_flags_regressions(tmp_path: Path):
+    baseline = tmp_path / "baseline.jsonl"
+    candidate = tmp_path / "candidate.jsonl"
+    write_trace(baseline, sample_spans(train_ms=60))
+    write_trace(candidate, sample_spans(train_ms=120))
+
+    regressions = {item.name: item for item in compare_traces(baseline, candidate)}
+    assert regressions["train_models"].regressed
+    assert not regressions["extract"].regressed
+
+
+def test_compare_traces_selects_runs_within_a_file(tmp_path: Path, capsys):
+    trace_path = tmp_path / "trace.jsonl"
+    write_trace(trace_path, sample_spans(train_ms=60), run_id="run-1")
+    write_trace(trace_path, sample_spans(train_ms=120), run_id="run-2")
+
+    latest = {item.name: item for item in compare_traces(trace_path, trace_path)}
+    assert latest["train_models"].baseline_ms == 120
+    assert not latest["train_models"].regressed
+
+    regressions = compare_traces(trace_path, trace_path, baseline_run_id="run-1")
+    by_name = {item.name: item for item in regressions}
+    assert by_name["train_models"].baseline_ms == 60
+    assert by_name["train_models"].candidate_ms == 120
+    assert by_name["train_models"].regressed
+
+    argv = ["diff", str(trace_path), str(trace_path), "--baseline-run-id", "run-1"]
+    assert main(argv) == 1
+    report = {item["name"]: item for item in json.loads(capsys.readouterr().out)}
+    assert report["train_models"]["baseline_ms"] == 60
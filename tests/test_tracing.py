@@ -2,7 +2,12 @@ from __future__ import annotations
 
 from pathlib import Path
 
-from netflix_recommender.tracing import build_trace_recorder
+from netflix_recommender.tracing import (
+    BufferedTraceWriter,
+    build_trace_recorder,
+    child_span,
+    current_span,
+)
 
 
 def test_trace_recorder_writes_events(tmp_path: Path):
@@ -31,3 +36,79 @@ def test_trace_recorder_exports_markdown(tmp_path: Path):
     content = markdown_path.read_text(encoding="utf-8")
     assert "Trace Report" in content
     assert "pipeline.start" in content
+
+
+def test_buffered_recorder_preserves_order(tmp_path: Path):
+    trace_path = tmp_path / "trace.jsonl"
+    recorder = build_trace_recorder(
+        trace_path, run_id="run-3", enabled=True, buffered=True
+    )
+
+    for index in range(50):
+        recorder.record_event("tick", payload={"index": str(index)})
+    recorder.close()
+
+    events = recorder.read_events()
+    assert [event.payload["index"] for event in events] == [
+        str(index) for index in range(50)
+    ]
+    assert recorder.dropped_events == 0
+
+
+def test_buffered_writer_counts_drops_when_full(tmp_path: Path):
+    writer = BufferedTraceWriter(tmp_path / "trace.jsonl", max_queue=1)
+    # Saturate the queue faster than the writer thread can drain it.
+    accepted = sum(writer.submit("{}\n") for _ in range(10_000))
+    writer.close()
+
+    assert writer.dropped == 10_000 - accepted
+    assert writer.written == accepted
+
+
+def test_buffered_writer_counts_events_after_close(tmp_path: Path):
+    recorder = build_trace_recorder(
+        tmp_path / "trace.jsonl", run_id="run-5", enabled=True, buffered=True
+    )
+    recorder.record_event("before")
+    recorder.close()
+    recorder.record_event("after")
+
+    assert [event.event for event in recorder.read_events()] == ["before"]
+    assert recorder.dropped_events == 1
+
+
+def test_nested_spans_propagate_parent(tmp_path: Path):
+    recorder = build_trace_recorder(tmp_path / "trace.jsonl", run_id="run-4")
+
+    with recorder.span("pipeline") as root:
+        with recorder.span("train"):
+            with child_span("model.popularity"):
+                pass
+
+    ends = {
+        event.payload["name"]: event
+        for event in recorder.read_events()
+        if event.event == "span.end"
+    }
+    assert ends["pipeline"].parent_id is None
+    assert ends["train"].parent_id == root.span_id
+    assert ends["model.popularity"].parent_id == ends["train"].span_id
+    assert int(ends["train"].payload["duration_ns"]) >= 0
+    assert current_span() is None
+
+
+def test_unsampled_trace_records_nothing(tmp_path: Path):
+    trace_path = tmp_path / "trace.jsonl"
+    recorder = build_trace_recorder(trace_path, run_id="run-5", sample_rate=0.0)
+
+    with recorder.span("pipeline") as root:
+        with recorder.span("train") as child:
+            assert child_span("model.popularity") is child_span("model.user_cf")
+
+    assert not root.sampled and not child.sampled
+    assert recorder.read_events() == []
+
+
+def test_child_span_without_active_span_is_noop():
+    with child_span("orphan") as span:
+        assert not span.sampled